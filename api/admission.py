@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+import asyncio
+import math
+import time
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of being admitted"""
+
+    def __init__(self, status_code: int, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.reason = reason
+
+    @property
+    def retry_after_header(self) -> str:
+        """Retry-After value in whole seconds"""
+        return str(max(1, math.ceil(self.retry_after)))
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate tokens per second"""
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = now
+
+    def try_take(self, now: float) -> float:
+        """Take one token; return 0 on success or the seconds until one is available"""
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.rate
+
+class _RouteState:
+    """Concurrency slots, queue and counters for one route"""
+
+    def __init__(self, limit: int, initial_service_time: float):
+        self.limit = limit
+        self.slots = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.queued = 0
+        self.service_time = initial_service_time  # EWMA of seconds per request
+        self.accepted = 0
+        self.rate_limited = 0
+        self.overloaded = 0
+
+class AdmissionController:
+    """Per-route concurrency limits and per-rider rate limits with early load shedding.
+
+    A request is rejected with 429 when its rider has no tokens left, and with
+    503 when the queueing delay it would see, estimated from the queue length
+    and the recent service time, is above queue_delay_target seconds.
+    """
+
+    def __init__(self, default_concurrency: int = 64,
+                 route_concurrency: Optional[Dict[str, int]] = None,
+                 queue_delay_target: float = 0.5,
+                 rider_rate: float = 1.0, rider_burst: float = 5.0,
+                 max_tracked_riders: int = 100000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.default_concurrency = default_concurrency
+        self.route_concurrency = dict(route_concurrency or {})
+        self.queue_delay_target = queue_delay_target
+        self.rider_rate = rider_rate
+        self.rider_burst = rider_burst
+        self.max_tracked_riders = max_tracked_riders
+        self._clock = clock
+        self._routes: Dict[str, _RouteState] = {}
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()  # Least recently used first
+
+    @asynccontextmanager
+    async def admit(self, route: str, rider_id: Optional[str] = None):
+        """Hold a concurrency slot on route for the duration of the block"""
+        state = await self.acquire(route, rider_id)
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.release(state, self._clock() - started)
+
+    async def acquire(self, route: str, rider_id: Optional[str] = None) -> _RouteState:
+        """Wait for a slot on route, or raise AdmissionRejected"""
+        state = self._route(route)
+
+        if rider_id is not None:
+            wait = self._take_token(rider_id)
+            if wait > 0:
+                state.rate_limited += 1
+                raise AdmissionRejected(429, wait, "Too many ride requests for this rider")
+
+        if state.in_flight >= state.limit:
+            expected_delay = (state.queued + 1) * state.service_time / state.limit
+            if expected_delay > self.queue_delay_target:
+                state.overloaded += 1
+                raise AdmissionRejected(503, expected_delay, "Server is overloaded, please retry later")
+
+        state.queued += 1
+        try:
+            await state.slots.acquire()
+        finally:
+            state.queued -= 1
+        state.in_flight += 1
+        state.accepted += 1
+        return state
+
+    def release(self, state: _RouteState, service_time: float) -> None:
+        """Free a slot taken by acquire and record how long it was held"""
+        state.in_flight -= 1
+        state.service_time += 0.2 * (service_time - state.service_time)
+        state.slots.release()
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Get accept/shed counters and current load per route"""
+        return {
+            route: {
+                "accepted": state.accepted,
+                "rejected_rate_limited": state.rate_limited,
+                "rejected_overloaded": state.overloaded,
+                "in_flight": state.in_flight,
+                "queued": state.queued,
+                "concurrency_limit": state.limit,
+                "avg_service_time": state.service_time
+            }
+            for route, state in self._routes.items()
+        }
+
+    def _route(self, route: str) -> _RouteState:
+        state = self._routes.get(route)
+        if state is None:
+            limit = self.route_concurrency.get(route, self.default_concurrency)
+            state = _RouteState(limit, self.queue_delay_target / 10)
+            self._routes[route] = state
+        return state
+
+    def _take_token(self, rider_id: str) -> float:
+        now = self._clock()
+        bucket = self._buckets.get(rider_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rider_rate, self.rider_burst, now)
+            self._buckets[rider_id] = bucket
+            if len(self._buckets) > self.max_tracked_riders:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(rider_id)
+        return bucket.try_take(now)
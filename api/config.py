@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 import os
 
 class Settings(BaseSettings):
@@ -9,6 +10,75 @@ class Settings(BaseSettings):
     
     # CORS settings
     BACKEND_CORS_ORIGINS: list[str] = ["*"]
+    
+    # Idempotency-Key response cache
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_TTL_SECONDS: float = 3600.0
+    
+    # Serialized ride and driver bodies kept per cache for ETag polling
+    RESPONSE_CACHE_SIZE: int = 10000
+    
+    # Fare estimates and available-driver searches: identical requests share
+    # one computation, keyed on locations rounded to COALESCE_PRECISION decimal
+    # places (4 is about 11 m), and its result is reused for COALESCE_TTL_SECONDS
+    COALESCE_PRECISION: int = 4
+    COALESCE_TTL_SECONDS: float = 0.5
+    
+    # Ride offers: each ride goes to OFFER_FANOUT drivers at once and the first
+    # to accept gets it; 0 assigns the best match without asking (1 is sequential)
+    OFFER_FANOUT: int = 0
+    OFFER_TIMEOUT_SECONDS: float = 15.0
+    OFFER_SWEEP_INTERVAL: float = 1.0  # Seconds between checks for expired offers
+    
+    # Viewport queries: clustered below this zoom level or above this many points
+    MAP_CLUSTER_ZOOM: int = 14
+    MAP_MAX_POINTS: int = 2000
+    
+    # Admission control for ride routes
+    ADMISSION_DEFAULT_CONCURRENCY: int = 64
+    ADMISSION_ROUTE_CONCURRENCY: dict[str, int] = {"request_ride": 32}
+    ADMISSION_QUEUE_DELAY_TARGET: float = 0.5  # Seconds
+    ADMISSION_RIDER_RATE: float = 0.5  # Ride requests per second per rider
+    ADMISSION_RIDER_BURST: float = 5.0
+    
+    # Worker pool for matching, range queries and estimates
+    WORKER_POOL_KIND: str = "thread"  # "thread" or "process" (process only for pure work)
+    WORKER_POOL_SIZE: int = 4
+    
+    # Profiling through /admin/profile and the X-Profile-Trace header
+    PROFILE_OUTPUT_DIR: str = "profiles"
+    PROFILE_MAX_SECONDS: float = 300.0
+    PROFILE_TRACE_HEADER_ENABLED: bool = False
+    
+    # Worker number stamped into new IDs; give each API process sharing a
+    # store its own, from 0 to 1023
+    ID_WORKER_ID: int = 0
+    
+    # Road graph file for routed distances; straight lines when unset
+    ROAD_GRAPH_PATH: Optional[str] = None
+    
+    # GeoJSON service zones (service areas, airports, no-pickup zones, rate
+    # cards); no zone checks or zone pricing when unset
+    ZONES_PATH: Optional[str] = None
+    ZONE_CACHE_SIZE: int = 100000  # Memoized zone lookups by location
+    
+    # Sharded mode: SHARD_COUNT > 1 runs drivers and rides in that many shard
+    # processes, one per equal longitude band of [SHARD_MIN_LONGITUDE,
+    # SHARD_MAX_LONGITUDE]; only the core rider, driver and ride routes are served
+    SHARD_COUNT: int = 0
+    SHARD_MIN_LONGITUDE: float = -180.0
+    SHARD_MAX_LONGITUDE: float = 180.0
+    
+    # Persistence: "memory" keeps everything in process; "sqlite" writes users
+    # and rides to SQLITE_PATH and keeps only active rides in memory
+    STORAGE_BACKEND: str = "memory"
+    SQLITE_PATH: str = "ride_sharing.db"
+    SQLITE_BATCH_SIZE: int = 500
+    SQLITE_FLUSH_INTERVAL: float = 0.2  # Seconds
+    
+    # CSV or NDJSON files of users to bulk import at startup
+    BULK_IMPORT_DRIVERS_PATH: Optional[str] = None
+    BULK_IMPORT_RIDERS_PATH: Optional[str] = None
 
     class Config:
         env_file = ".env"
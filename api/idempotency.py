@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import time
+
+# Header clients send to make a request safe to retry
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused for a different request"""
+    pass
+
+class IdempotencyCache:
+    """Bounded TTL cache of responses keyed by client-supplied idempotency keys"""
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 3600.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        # key -> (expires_at, fingerprint, response), oldest first. Every entry
+        # gets the same TTL, so insertion order is also expiry order.
+        self._entries: "OrderedDict[Hashable, Tuple[float, str, Any]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, Tuple[str, asyncio.Future]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, fingerprint: str) -> Optional[Any]:
+        """Get the stored response for a key, or None if there is none.
+
+        Raises IdempotencyConflict if the key was stored for a request with a
+        different fingerprint.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, stored_fingerprint, response = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return None
+        if stored_fingerprint != fingerprint:
+            raise IdempotencyConflict(f"{IDEMPOTENCY_HEADER} was already used for a different request")
+        return response
+
+    def put(self, key: Hashable, fingerprint: str, response: Any) -> None:
+        """Store the response for a key, evicting expired and excess entries"""
+        now = self._clock()
+        self._entries.pop(key, None)
+        self._entries[key] = (now + self.ttl_seconds, fingerprint, response)
+        self._evict(now)
+
+    async def run(self, key: Hashable, fingerprint: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Get the stored response for a key, or compute and store it.
+        
+        A request that arrives while the first one with its key is still
+        running waits for that result instead of computing its own. The
+        computation runs as its own task, so the first request giving up
+        neither cancels it nor fails the requests waiting on it.
+        """
+        response = self.get(key, fingerprint)
+        if response is not None:
+            return response
+
+        pending = self._in_flight.get(key)
+        if pending is not None:
+            pending_fingerprint, task = pending
+            if pending_fingerprint != fingerprint:
+                raise IdempotencyConflict(f"{IDEMPOTENCY_HEADER} was already used for a different request")
+        else:
+            task = asyncio.ensure_future(compute())
+            self._in_flight[key] = (fingerprint, task)
+            task.add_done_callback(lambda done: self._finish(key, fingerprint, done))
+        return await asyncio.shield(task)
+
+    def clear(self) -> None:
+        """Drop every stored response"""
+        self._entries.clear()
+
+    def _finish(self, key: Hashable, fingerprint: str, task: asyncio.Future) -> None:
+        del self._in_flight[key]
+        if task.cancelled():
+            return
+        if task.exception() is None:
+            self.put(key, fingerprint, task.result())
+
+    def _evict(self, now: float) -> None:
+        while self._entries:
+            oldest_key, (expires_at, _, _) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[oldest_key]
@@ -1,7 +1,22 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+import atexit
+import threading
 import uvicorn
-from api.routers import riders, drivers, rides
+from api.routers import riders, drivers, rides, admin, sharded
+from api.admission import AdmissionRejected
+from api.metrics import MetricsMiddleware, register_domain_gauges
+from api.profiling import ProfilingMiddleware
+from api.config import get_settings
+from models.ids import SnowflakeIdGenerator, set_id_generator
+from monitoring.metrics import registry
+from monitoring.profiler import profiler
+from routing.engine import routing_engine
+from sharding.shard_map import GeoShardMap
+from spatial.zones import zone_index
+from storage.bulk_import import import_drivers, import_riders
+from storage.sqlite import SQLiteRepository
 
 app = FastAPI(
     title="Ride-Sharing Platform API",
@@ -17,11 +32,69 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
 )
+app.add_middleware(ProfilingMiddleware, trace_header_enabled=get_settings().PROFILE_TRACE_HEADER_ENABLED)
+app.add_middleware(MetricsMiddleware)
+profiler.output_dir = get_settings().PROFILE_OUTPUT_DIR
+set_id_generator(SnowflakeIdGenerator(get_settings().ID_WORKER_ID))
+if get_settings().ROAD_GRAPH_PATH:
+    routing_engine.load(get_settings().ROAD_GRAPH_PATH)
+zone_index.cache_size = get_settings().ZONE_CACHE_SIZE
+if get_settings().ZONES_PATH:
+    zone_index.load(get_settings().ZONES_PATH)
 
-# Include routers
-app.include_router(riders.router, prefix="/api/riders", tags=["riders"])
-app.include_router(drivers.router, prefix="/api/drivers", tags=["drivers"])
-app.include_router(rides.router, prefix="/api/rides", tags=["rides"])
+if get_settings().SHARD_COUNT > 1:
+    # The shards hold every rider, driver and ride; features that need them
+    # all in this process are not available
+    if get_settings().STORAGE_BACKEND != "memory" or get_settings().OFFER_FANOUT:
+        raise ValueError("SHARD_COUNT needs STORAGE_BACKEND=memory and OFFER_FANOUT=0")
+    if get_settings().BULK_IMPORT_DRIVERS_PATH or get_settings().BULK_IMPORT_RIDERS_PATH:
+        raise ValueError("SHARD_COUNT does not support bulk imports at startup")
+    sharded.start_shards(
+        GeoShardMap.even(get_settings().SHARD_COUNT, get_settings().SHARD_MIN_LONGITUDE,
+                         get_settings().SHARD_MAX_LONGITUDE),
+        get_settings().ROAD_GRAPH_PATH, get_settings().ZONES_PATH
+    )
+    atexit.register(sharded.stop_shards)
+    app.include_router(sharded.riders_router, prefix="/api/riders", tags=["riders"])
+    app.include_router(sharded.drivers_router, prefix="/api/drivers", tags=["drivers"])
+    app.include_router(sharded.rides_router, prefix="/api/rides", tags=["rides"])
+else:
+    # Include routers
+    app.include_router(riders.router, prefix="/api/riders", tags=["riders"])
+    app.include_router(drivers.router, prefix="/api/drivers", tags=["drivers"])
+    app.include_router(rides.router, prefix="/api/rides", tags=["rides"])
+    register_domain_gauges(rides.ride_manager)
+app.include_router(admin.router, prefix="/admin", tags=["admin"])
+
+if get_settings().STORAGE_BACKEND == "sqlite":
+    repository = SQLiteRepository(get_settings().SQLITE_PATH, get_settings().SQLITE_BATCH_SIZE,
+                                  get_settings().SQLITE_FLUSH_INTERVAL)
+    rides.user_manager.set_repository(repository)
+    rides.ride_manager.set_repository(repository, rides.user_manager.riders, rides.user_manager.drivers)
+    rides.ride_manager.register_drivers(rides.user_manager.get_all_drivers())
+    # Write out whatever is still queued on a clean shutdown
+    atexit.register(repository.close)
+
+if get_settings().BULK_IMPORT_RIDERS_PATH:
+    report = import_riders(get_settings().BULK_IMPORT_RIDERS_PATH, rides.user_manager)
+    print(f"Imported {report.imported} riders ({report.rejected} rejected) in {report.seconds:.1f}s")
+if get_settings().BULK_IMPORT_DRIVERS_PATH:
+    report = import_drivers(get_settings().BULK_IMPORT_DRIVERS_PATH, rides.user_manager, rides.ride_manager)
+    print(f"Imported {report.imported} drivers ({report.rejected} rejected) in {report.seconds:.1f}s")
+
+if get_settings().OFFER_FANOUT:
+    rides.ride_manager.set_offer_dispatch(get_settings().OFFER_FANOUT, get_settings().OFFER_TIMEOUT_SECONDS)
+    threading.Thread(target=rides.ride_manager.run_offer_sweeper, args=(get_settings().OFFER_SWEEP_INTERVAL,),
+                     name="offer-sweeper", daemon=True).start()
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Turn a shed request into a 429/503 with a Retry-After hint"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.reason},
+        headers={"Retry-After": exc.retry_after_header}
+    )
 
 @app.get("/")
 async def root():
@@ -31,5 +104,15 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request latency, matching and pool metrics in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admission")
+async def admission_stats():
+    """Accept and shed counters of the ride routes' admission controller"""
+    return rides.admission_controller.stats()
+
 if __name__ == "__main__":
     uvicorn.run("api.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
@@ -0,0 +1,57 @@
+from typing import Dict
+import time
+
+from managers.ride_manager import RideManager
+from monitoring.metrics import registry, Labels
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests by route template",
+    ["method", "route", "status"])
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request into HTTP_REQUEST_DURATION.
+
+    Requests are labelled with the matched route template rather than the raw
+    path, so IDs in URLs do not create a series per ride.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            template = route.path if route is not None else "unmatched"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started,
+                                          (scope["method"], template, str(status)))
+
+def register_domain_gauges(ride_manager: RideManager) -> None:
+    """Expose the available pool and active rides of ride_manager as gauges"""
+    def available_drivers() -> Dict[Labels, float]:
+        counts = ride_manager.driver_index.counts_by_vehicle_type()
+        return {(vehicle_type,): count for vehicle_type, count in counts.items()}
+
+    def active_rides() -> Dict[Labels, float]:
+        counts: Dict[Labels, float] = {}
+        for ride in ride_manager.get_active_rides():
+            labels = (ride.status.value,)
+            counts[labels] = counts.get(labels, 0) + 1
+        return counts
+
+    registry.gauge("available_drivers", "Drivers in the available pool by vehicle type",
+                   ["vehicle_type"], available_drivers)
+    registry.gauge("active_rides", "Active rides by status", ["status"], active_rides)
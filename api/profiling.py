@@ -0,0 +1,39 @@
+from monitoring.profiler import profiler, span
+
+# Requests carrying this header get their spans written to their own trace file
+PROFILE_TRACE_HEADER = "X-Profile-Trace"
+PROFILE_FILE_HEADER = "X-Profile-Trace-File"
+
+_TRACE_HEADER_KEY = PROFILE_TRACE_HEADER.lower().encode()
+
+class ProfilingMiddleware:
+    """ASGI middleware tracing the spans of requests that ask for it.
+
+    When trace_header_enabled is off, or a request has no trace header, the
+    request passes straight through.
+    """
+
+    def __init__(self, app, trace_header_enabled: bool = False):
+        self.app = app
+        self.trace_header_enabled = trace_header_enabled
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not self.trace_header_enabled
+                or not any(key == _TRACE_HEADER_KEY for key, _ in scope["headers"])):
+            await self.app(scope, receive, send)
+            return
+
+        trace = profiler.begin_trace()
+        file_name = trace.path.encode()
+
+        async def send_with_trace_file(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_FILE_HEADER.lower().encode(), file_name)]
+            await send(message)
+
+        try:
+            with span(f"{scope['method']} {scope['path']}"):
+                await self.app(scope, receive, send_with_trace_file)
+        finally:
+            trace.finish()
@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+import uuid
+
+from fastapi import Response
+from monitoring.metrics import registry
+
+CACHE_LOOKUPS = registry.counter(
+    "response_cache_lookups_total", "Cached response lookups by cache and outcome", ["cache", "outcome"])
+
+class ResponseCache:
+    """Bounded LRU of serialized response bodies, one per entity, tagged with its version.
+
+    A lookup with the version the entity has now returns the stored bytes;
+    any other version renders and replaces them. ETags carry a token drawn
+    when the cache is created, so a restarted server, whose version counters
+    start again from zero, never confirms a body it did not send.
+    """
+
+    def __init__(self, name: str, max_entries: int = 10000):
+        self.name = name
+        self.max_entries = max_entries
+        self._token = uuid.uuid4().hex[:8]
+        # key -> (version, ETag, body), least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[Hashable, str, bytes]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, version: Hashable, render: Callable[[], bytes]) -> Tuple[str, bytes]:
+        """(ETag, body) of an entity at a version, rendering the body only if it is not stored"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self._entries.move_to_end(key)
+            CACHE_LOOKUPS.inc(labels=(self.name, "hit"))
+            return entry[1], entry[2]
+
+        CACHE_LOOKUPS.inc(labels=(self.name, "miss"))
+        body = render()
+        etag = f'"{self._token}-{key}-{_version_tag(version)}"'
+        self._entries[key] = (version, etag, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return etag, body
+
+    def response(self, key: Hashable, version: Hashable, render: Callable[[], bytes],
+                 if_none_match: Optional[str] = None) -> Response:
+        """JSON response for an entity, or 304 Not Modified if the client's ETag is current"""
+        etag, body = self.get(key, version, render)
+        # Clients may cache the body but must check its ETag before reusing it
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if if_none_match is not None and _matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+def _version_tag(version: Hashable) -> str:
+    return "-".join(str(part) for part in version) if isinstance(version, tuple) else str(version)
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # Weak comparison, as If-None-Match calls for
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import List
+
+from api.config import get_settings
+from monitoring.profiler import profiler
+
+router = APIRouter()
+
+# Pydantic models
+class ProfileRequest(BaseModel):
+    seconds: float = Field(10.0, gt=0.0, description="How long to profile for")
+    interval_ms: float = Field(5.0, ge=1.0, le=1000.0, description="Stack sampling interval in milliseconds")
+
+class ProfileStatus(BaseModel):
+    running: bool
+    seconds_left: float
+    files: List[str]
+
+# Routes
+@router.post("/profile", response_model=ProfileStatus)
+async def start_profile(profile_request: ProfileRequest):
+    """Record spans and sample every thread's stack for a number of seconds"""
+    if profile_request.seconds > get_settings().PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400,
+                            detail=f"Profiles are limited to {get_settings().PROFILE_MAX_SECONDS:g} seconds")
+    if not profiler.start(profile_request.seconds, profile_request.interval_ms / 1000):
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return profiler.status()
+
+@router.get("/profile", response_model=ProfileStatus)
+async def get_profile_status():
+    """Get the state of the profiler and the most recent output files"""
+    return profiler.status()
+
+@router.delete("/profile", response_model=ProfileStatus)
+async def stop_profile():
+    """Stop a running profile early and write its files"""
+    profiler.stop()
+    return profiler.status()
@@ -1,14 +1,26 @@
-from fastapi import APIRouter, HTTPException, Path, Body, Query
+from fastapi import APIRouter, HTTPException, Path, Body, Query, Response, Header
 from pydantic import BaseModel, Field
-from typing import List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple, Union
 from managers.user_manager import UserManager
 from managers.ride_manager import RideManager
+from models.offer import Offer
 from models.user import Driver
 from models.ride import VehicleType
+from api.config import get_settings
+from api.response_cache import ResponseCache
+from api.single_flight import SingleFlight, quantize
+from api.viewport import MapCluster, ViewportRequest, should_cluster, to_viewport
+from api.workers import worker_pool
+from models.stats import fleet_stats
+from observers.change_log import change_log
+from routing.engine import routing_engine
+from spatial.viewport import Viewport, cluster_cell_size, cluster_points
 
 router = APIRouter()
 user_manager = UserManager()
 ride_manager = RideManager()
+driver_cache = ResponseCache("driver", get_settings().RESPONSE_CACHE_SIZE)
+available_flight = SingleFlight("available_drivers", get_settings().COALESCE_TTL_SECONDS)
 
 # Pydantic models for request/response
 class VehicleInfo(BaseModel):
@@ -47,6 +59,58 @@ class AvailableDriversRequest(BaseModel):
     max_distance: float = Field(15.0, description="Maximum distance in kilometers", ge=0.0, le=50.0)
     vehicle_type: Optional[str] = Field(None, description="Filter by vehicle type")
 
+class DriverChangesResponse(BaseModel):
+    sequence: int = Field(..., description="Pass as since on the next poll")
+    resync: bool = Field(..., description="The change log no longer reaches back to since; changed holds every available driver")
+    changed: List[DriverResponse] = Field(..., description="Drivers now available that changed since the last poll")
+    removed: List[str] = Field(..., description="IDs of drivers that changed and are no longer available")
+
+class DriverViewportRequest(ViewportRequest):
+    vehicle_type: Optional[str] = Field(None, description="Filter by vehicle type")
+
+class MapDriver(BaseModel):
+    id: str
+    location: Tuple[float, float]
+    vehicle_type: str
+    rating: float
+
+class DriverViewportResponse(BaseModel):
+    total: int = Field(..., description="Available drivers in the viewport")
+    clustered: bool
+    drivers: List[MapDriver] = Field([], description="Each driver, when not clustered")
+    clusters: List[MapCluster] = Field([], description="Drivers grouped by grid cell, counted per vehicle type")
+
+class OfferResponse(BaseModel):
+    id: str
+    ride_id: str
+    driver_id: str
+    status: str
+    wave: int = Field(..., description="1 for the ride's first round of offers, 2 for the next, ...")
+    pickup_location: Optional[Tuple[float, float]] = None
+    dropoff_location: Optional[Tuple[float, float]] = None
+    expires_at: float = Field(..., description="Unix time after which the offer can no longer be accepted")
+
+class DriverStatsResponse(BaseModel):
+    ride_count: int
+    earnings: float
+    distance_km: float
+    busy_seconds: float
+    rating_count: int
+    rating_sum: float
+
+class WindowStatsResponse(BaseModel):
+    rides: float
+    earnings: float
+    distance_km: float
+    busy_seconds: float
+    utilization: float = Field(..., description="Busy time over the window length times the fleet size")
+
+class FleetStatsResponse(BaseModel):
+    drivers: int
+    available_drivers: int
+    lifetime: DriverStatsResponse
+    windows: Dict[str, WindowStatsResponse] = Field(..., description="Totals over rolling windows, e.g. 5m and 1h")
+
 class AvailableDriverResponse(BaseModel):
     id: str
     name: str
@@ -71,7 +135,7 @@ async def create_driver(driver_data: DriverCreate):
             driver_data.current_location
         )
         # Register driver with ride manager
-        ride_manager.register_driver(driver)
+        await worker_pool.run(ride_manager.register_driver, driver)
         return convert_to_response(driver)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -82,19 +146,74 @@ async def get_all_drivers():
     drivers = user_manager.get_all_drivers()
     return [convert_to_response(driver) for driver in drivers]
 
-@router.get("/available", response_model=List[DriverResponse])
-async def get_available_drivers():
-    """Get all available drivers"""
-    drivers = ride_manager.get_available_drivers()
-    return [convert_to_response(driver) for driver in drivers]
+@router.get("/available", response_model=Union[List[DriverResponse], DriverChangesResponse])
+async def get_available_drivers(
+    response: Response,
+    since: Optional[int] = Query(None, ge=0, description="X-Change-Sequence of the last poll; only changes after it")
+):
+    """Get all available drivers, or with since only those that changed"""
+    if since is None:
+        # Taken before the list, so the next delta repeats rather than misses a change
+        response.headers["X-Change-Sequence"] = str(change_log.sequence)
+        drivers = ride_manager.get_available_drivers()
+        return [convert_to_response(driver) for driver in drivers]
+    
+    changes = await worker_pool.run(available_driver_changes, since)
+    response.headers["X-Change-Sequence"] = str(changes.sequence)
+    return changes
+
+@router.get("/stats", response_model=FleetStatsResponse)
+async def get_fleet_stats():
+    """Ride counts, earnings, distance and utilization across the fleet, lifetime and recent"""
+    # Running totals only: the cost does not grow with fleet size or ride count
+    drivers = len(user_manager.drivers)
+    snapshot = fleet_stats.snapshot(drivers)
+    return FleetStatsResponse(drivers=drivers, available_drivers=len(ride_manager.driver_index), **snapshot)
+
+@router.get("/{driver_id}/stats", response_model=DriverStatsResponse)
+async def get_driver_stats(driver_id: str = Path(..., description="The ID of the driver")):
+    """Running totals of a driver's completed rides and ratings"""
+    driver = user_manager.get_driver(driver_id)
+    if not driver:
+        raise HTTPException(status_code=404, detail="Driver not found")
+    return DriverStatsResponse(**driver.stats.to_dict())
+
+@router.get("/{driver_id}/offers", response_model=List[OfferResponse])
+async def get_driver_offers(driver_id: str = Path(..., description="The ID of the driver")):
+    """Get the ride offers a driver can still answer"""
+    if not user_manager.get_driver(driver_id):
+        raise HTTPException(status_code=404, detail="Driver not found")
+    with ride_manager.lock:
+        offer = ride_manager.offers.open_for_driver(driver_id)
+        return [convert_offer(offer)] if offer is not None else []
+
+@router.put("/{driver_id}/offers/{offer_id}/accept", response_model=OfferResponse)
+async def accept_offer(
+    driver_id: str = Path(..., description="The ID of the driver answering"),
+    offer_id: str = Path(..., description="The ID of the offer to accept")
+):
+    """Accept a ride offer; only the first driver to accept a ride gets it"""
+    return await answer_offer(driver_id, offer_id, ride_manager.accept_offer)
+
+@router.put("/{driver_id}/offers/{offer_id}/decline", response_model=OfferResponse)
+async def decline_offer(
+    driver_id: str = Path(..., description="The ID of the driver answering"),
+    offer_id: str = Path(..., description="The ID of the offer to decline")
+):
+    """Decline a ride offer so the ride goes to other drivers"""
+    return await answer_offer(driver_id, offer_id, ride_manager.decline_offer)
 
 @router.get("/{driver_id}", response_model=DriverResponse)
-async def get_driver(driver_id: str = Path(..., description="The ID of the driver to get")):
+async def get_driver(
+    driver_id: str = Path(..., description="The ID of the driver to get"),
+    if_none_match: Optional[str] = Header(None, description="ETag of a previous response; 304 if unchanged")
+):
     """Get a specific driver by ID"""
     driver = user_manager.get_driver(driver_id)
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
-    return convert_to_response(driver)
+    return driver_cache.response(driver.id, driver.version,
+                                 lambda: convert_to_response(driver).model_dump_json().encode(), if_none_match)
 
 @router.put("/{driver_id}/location", response_model=DriverResponse)
 async def update_driver_location(
@@ -120,46 +239,90 @@ async def update_driver_availability(
     driver.set_availability(availability_update.is_available)
     
     if availability_update.is_available:
-        ride_manager.register_driver(driver)
+        await worker_pool.run(ride_manager.register_driver, driver)
     else:
-        ride_manager.unregister_driver(driver)
+        await worker_pool.run(ride_manager.unregister_driver, driver)
     
     return convert_to_response(driver)
 
 @router.post("/available", response_model=List[AvailableDriverResponse])
 async def find_available_drivers(request: AvailableDriversRequest):
     """Find available drivers within a specified range"""
+    # Searches from the same spot at once share one scan
+    key = (quantize(request.location, get_settings().COALESCE_PRECISION), request.max_distance, request.vehicle_type)
+    return await available_flight.run(key, lambda: worker_pool.run(search_available_drivers, request))
+
+@router.post("/available/viewport", response_model=DriverViewportResponse)
+async def find_drivers_in_viewport(request: DriverViewportRequest):
+    """Find available drivers inside a map bounding box or polygon, clustered when zoomed out"""
+    viewport = to_viewport(request)
+    return await worker_pool.run(drivers_in_viewport, request, viewport)
+
+# Helper functions
+async def answer_offer(driver_id: str, offer_id: str, answer: Callable[[str], bool]) -> OfferResponse:
+    """Apply a driver's answer to one of their offers; 409 once it is no longer open"""
+    offer = ride_manager.offers.get(offer_id)
+    if offer is None or offer.driver_id != driver_id:
+        raise HTTPException(status_code=404, detail="Offer not found")
+    if not await worker_pool.run(answer, offer_id):
+        raise HTTPException(status_code=409, detail=f"Offer is no longer open: {offer.status.value}")
+    return convert_offer(offer)
+
+def convert_offer(offer: Offer) -> OfferResponse:
+    """Convert an Offer to OfferResponse, with the trip if the ride is still active"""
+    ride = ride_manager.active_rides.get(offer.ride_id)
+    return OfferResponse(
+        id=offer.id,
+        ride_id=offer.ride_id,
+        driver_id=offer.driver_id,
+        status=offer.status.value,
+        wave=offer.wave,
+        pickup_location=ride.pickup_location if ride else None,
+        dropoff_location=ride.dropoff_location if ride else None,
+        expires_at=offer.expires_at
+    )
+
+def drivers_in_viewport(request: DriverViewportRequest, viewport: Viewport) -> DriverViewportResponse:
+    """Available drivers in a viewport from the spatial index, as points or clusters"""
+    drivers = ride_manager.driver_index.in_viewport(viewport, request.vehicle_type)
+    if should_cluster(request.zoom, len(drivers)):
+        clusters = cluster_points(((driver.get_location(), driver.vehicle.vehicle_type) for driver in drivers),
+                                  cluster_cell_size(request.zoom))
+        return DriverViewportResponse(total=len(drivers), clustered=True, clusters=clusters)
+    
+    points = [MapDriver(id=driver.id, location=driver.get_location(),
+                        vehicle_type=driver.vehicle.vehicle_type, rating=driver.rating)
+              for driver in drivers]
+    return DriverViewportResponse(total=len(drivers), clustered=False, drivers=points)
+
+def search_available_drivers(request: AvailableDriversRequest) -> List[dict]:
+    """Find available drivers within range of a location, closest first"""
     try:
         # Get all available drivers from the ride manager
         all_available_drivers = ride_manager.get_available_drivers()
         
-        # Import necessary modules for distance calculation
-        from models.ride import Ride
-        from models.user import Rider
+        # Optionally filter by vehicle type before measuring anything
+        if request.vehicle_type is not None:
+            all_available_drivers = [driver for driver in all_available_drivers
+                                     if driver.vehicle.vehicle_type == request.vehicle_type]
         
-        # Create a temporary ride object to use its distance calculation method
-        temp_rider = Rider("Temporary", "0000000000")
-        temp_ride = Ride(temp_rider, request.location, (0.0, 0.0))
+        # Road distance from every driver to the location in one query
+        distances = routing_engine.distances_to([driver.get_location() for driver in all_available_drivers],
+                                                request.location, request.max_distance)
         
-        # Filter drivers by distance and optionally by vehicle type
         nearby_drivers = []
-        for driver in all_available_drivers:
-            # Calculate distance between request location and driver location
-            distance = temp_ride._calculate_distance(request.location, driver.get_location())
-            
+        for driver, distance in zip(all_available_drivers, distances):
             # Check if driver is within the specified range
             if distance <= request.max_distance:
-                # If vehicle type filter is provided, check if it matches
-                if request.vehicle_type is None or driver.vehicle.vehicle_type == request.vehicle_type:
-                    nearby_drivers.append({
-                        "id": driver.id,
-                        "name": driver.name,
-                        "vehicle_id": driver.vehicle.vehicle_id,
-                        "vehicle_model": driver.vehicle.model,
-                        "vehicle_type": driver.vehicle.vehicle_type,
-                        "rating": driver.rating,
-                        "distance": distance
-                    })
+                nearby_drivers.append({
+                    "id": driver.id,
+                    "name": driver.name,
+                    "vehicle_id": driver.vehicle.vehicle_id,
+                    "vehicle_model": driver.vehicle.model,
+                    "vehicle_type": driver.vehicle.vehicle_type,
+                    "rating": driver.rating,
+                    "distance": distance
+                })
         
         # Sort by distance (closest first)
         nearby_drivers.sort(key=lambda d: d["distance"])
@@ -169,7 +332,30 @@ async def find_available_drivers(request: AvailableDriversRequest):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-# Helper function
+def available_driver_changes(since: int) -> DriverChangesResponse:
+    """Available drivers changed after a change sequence, or all of them if the log is too short"""
+    # The log is read first, outside the manager lock. Changes are logged
+    # once applied, and pool changes under that lock, so once it is taken
+    # every change read is in place
+    changes = change_log.changed_since(since, "driver")
+    if changes is None:
+        sequence = change_log.sequence
+        drivers = ride_manager.get_available_drivers()
+        return DriverChangesResponse(sequence=sequence, resync=True,
+                                     changed=[convert_to_response(driver) for driver in drivers], removed=[])
+    
+    sequence, driver_ids = changes
+    changed, removed = [], []
+    with ride_manager.lock:
+        for driver_id in driver_ids:
+            driver = user_manager.get_driver(driver_id)
+            if driver is not None and driver in ride_manager.driver_index:
+                changed.append(driver)
+            else:
+                removed.append(driver_id)
+    return DriverChangesResponse(sequence=sequence, resync=False,
+                                 changed=[convert_to_response(driver) for driver in changed], removed=removed)
+
 def convert_to_response(driver: Driver) -> DriverResponse:
     """Convert Driver object to DriverResponse model"""
     vehicle_info = VehicleInfo(
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException, Path, Body, Query, Depends
+from fastapi import APIRouter, HTTPException, Path, Body, Query, Depends, Header, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Tuple, Dict, Any
+from typing import List, Optional, Tuple, Dict, Any, Awaitable, Callable, Union
 from datetime import datetime
 from enum import Enum
 
@@ -8,12 +9,36 @@ from managers.user_manager import UserManager
 from managers.ride_manager import RideManager
 from models.ride import Ride, VehicleType, RideType, RideStatus
 from models.user import Rider, Driver
-from strategies.driver_matching import NearestDriverStrategy, HighestRatedDriverStrategy
-from strategies.pricing import BasePricingStrategy, SurgePricingDecorator, DiscountDecorator
+from strategies.driver_matching import MATCHING_STRATEGIES, max_match_distance
+from strategies.pricing import ZonePricingStrategy, SurgePricingDecorator, DiscountDecorator, pricing_strategy_for
+from api.config import get_settings
+from api.idempotency import IdempotencyCache, IdempotencyConflict, IDEMPOTENCY_HEADER
+from api.admission import AdmissionController
+from api.response_cache import ResponseCache
+from api.single_flight import SingleFlight, quantize
+from api.viewport import MapCluster, ViewportRequest, should_cluster, to_viewport
+from api.workers import worker_pool
+from monitoring.profiler import span
+from observers.change_log import change_log
+from routing.eta import eta_service
+from spatial.viewport import Viewport, cluster_cell_size, cluster_points
+from spatial.zones import zone_index
+from storage.export import EXPORT_FORMATS, export_chunks
 
 router = APIRouter()
 user_manager = UserManager()
 ride_manager = RideManager()
+idempotency_cache = IdempotencyCache(get_settings().IDEMPOTENCY_CACHE_SIZE,
+                                     get_settings().IDEMPOTENCY_TTL_SECONDS)
+ride_cache = ResponseCache("ride", get_settings().RESPONSE_CACHE_SIZE)
+estimate_flight = SingleFlight("estimate", get_settings().COALESCE_TTL_SECONDS)
+admission_controller = AdmissionController(
+    default_concurrency=get_settings().ADMISSION_DEFAULT_CONCURRENCY,
+    route_concurrency=get_settings().ADMISSION_ROUTE_CONCURRENCY,
+    queue_delay_target=get_settings().ADMISSION_QUEUE_DELAY_TARGET,
+    rider_rate=get_settings().ADMISSION_RIDER_RATE,
+    rider_burst=get_settings().ADMISSION_RIDER_BURST
+)
 
 # Pydantic models
 class VehicleTypeEnum(str, Enum):
@@ -37,6 +62,15 @@ class RideStatusEnum(str, Enum):
 class DriverMatchingStrategyEnum(str, Enum):
     NEAREST = "NEAREST"
     HIGHEST_RATED = "HIGHEST_RATED"
+    FASTEST_ARRIVAL = "FASTEST_ARRIVAL"
+
+class ExportFormatEnum(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+class RidePositionEnum(str, Enum):
+    PICKUP = "pickup"
+    DRIVER = "driver"
 
 class PricingStrategyEnum(str, Enum):
     BASE = "BASE"
@@ -78,6 +112,9 @@ class FareEstimateResponse(BaseModel):
     pricing_strategy: str
     base_fare: float
     per_km_rate: float
+    surcharge: float = 0.0  # Zone surcharges at the pickup and dropoff, e.g. airports
+    pickup_zones: List[str] = []  # Names of the zones containing the pickup
+    eta_seconds: Optional[float] = None  # Pickup ETA of the fastest available driver
 
 class DriverInfo(BaseModel):
     id: str
@@ -102,35 +139,197 @@ class RideResponse(BaseModel):
     end_time: Optional[datetime] = None
     fare: float
     distance: float
+    eta_seconds: Optional[float] = None  # Assigned driver's pickup ETA until the rider is picked up
+    driven_distance: Optional[float] = None  # Distance traced since pickup
+
+class RideChangesResponse(BaseModel):
+    sequence: int = Field(..., description="Pass as since on the next poll")
+    resync: bool = Field(..., description="The change log no longer reaches back to since; changed holds every active ride")
+    changed: List[RideResponse] = Field(..., description="Active rides that changed since the last poll")
+    removed: List[str] = Field(..., description="IDs of rides that changed and are no longer active")
+
+class RideViewportRequest(ViewportRequest):
+    by: RidePositionEnum = Field(RidePositionEnum.PICKUP,
+                                 description="Place rides at their pickup, or at their driver's current position")
+
+class MapRide(BaseModel):
+    id: str
+    location: Tuple[float, float]
+    status: str
+    vehicle_type: str
+    driver_id: Optional[str] = None
+
+class RideViewportResponse(BaseModel):
+    total: int = Field(..., description="Active rides in the viewport")
+    clustered: bool
+    rides: List[MapRide] = Field([], description="Each ride, when not clustered")
+    clusters: List[MapCluster] = Field([], description="Rides grouped by grid cell, counted per status")
 
 # Routes
 @router.post("/", response_model=RideResponse)
-async def request_ride(ride_data: RideCreate):
+async def request_ride(
+    ride_data: RideCreate,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
     """Request a new ride"""
+    async def create():
+        with span("rides.request_ride"):
+            async with admission_controller.admit("request_ride", ride_data.rider_id):
+                # Concurrent requests in the same cell share one pool task
+                region = ride_manager.driver_index.cell_for(ride_data.pickup_location)
+                return await worker_pool.run_coalesced(region, create_ride, ride_data)
+    
+    return await run_idempotent("request_ride", idempotency_key, ride_data.model_dump_json(), create)
+
+@router.get("/", response_model=List[RideResponse])
+async def get_all_rides(
+    rider_id: Optional[str] = Query(None, description="Only rides of this rider"),
+    driver_id: Optional[str] = Query(None, description="Only rides of this driver"),
+    status: Optional[RideStatusEnum] = Query(None, description="Only rides in this status"),
+    limit: Optional[int] = Query(None, ge=1, description="At most this many rides"),
+    before: Optional[str] = Query(None, description="Ride ID to page from: only older rides are listed")
+):
+    """Get all rides, newest first, optionally filtered"""
+    print("Total Riders:", len(user_manager.get_all_riders()), "Total Drivers:", len(user_manager.get_all_drivers()))
+    # May query the repository, so keep it off the event loop
+    try:
+        rides = await worker_pool.run(ride_manager.find_rides, rider_id, driver_id,
+                                      RideStatus(status.value) if status else None, limit, before)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return [convert_to_response(ride) for ride in rides]
+
+@router.get("/active", response_model=Union[List[RideResponse], RideChangesResponse])
+async def get_active_rides(
+    response: Response,
+    since: Optional[int] = Query(None, ge=0, description="X-Change-Sequence of the last poll; only changes after it")
+):
+    """Get all active rides, or with since only those that changed"""
+    if since is None:
+        # Taken before the list, so the next delta repeats rather than misses a change
+        response.headers["X-Change-Sequence"] = str(change_log.sequence)
+        rides = list(ride_manager.active_rides.values())
+        return [convert_to_response(ride) for ride in rides]
+    
+    changes = await worker_pool.run(active_ride_changes, since)
+    response.headers["X-Change-Sequence"] = str(changes.sequence)
+    return changes
+
+@router.post("/active/viewport", response_model=RideViewportResponse)
+async def find_rides_in_viewport(request: RideViewportRequest):
+    """Find active rides inside a map bounding box or polygon, clustered when zoomed out"""
+    viewport = to_viewport(request)
+    return await worker_pool.run(rides_in_viewport, request, viewport)
+
+@router.get("/export")
+async def export_rides(
+    since: Optional[datetime] = Query(None, description="First request time to include"),
+    until: Optional[datetime] = Query(None, description="Request time to stop before"),
+    status: RideStatusEnum = Query(RideStatusEnum.COMPLETED, description="Ride status to export"),
+    export_format: ExportFormatEnum = Query(ExportFormatEnum.NDJSON, alias="format", description="ndjson or csv"),
+    gzip: bool = Query(False, description="Compress the export with gzip")
+):
+    """Stream rides requested in a time range as NDJSON or CSV, oldest first"""
+    # Rides are read, encoded and sent a chunk at a time; the sync generator
+    # runs on the threadpool, so store reads stay off the event loop
+    records = ride_manager.iter_ride_records(RideStatus(status.value), local_time(since), local_time(until))
+    filename = f"rides.{export_format.value}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_chunks(records, export_format.value, gzip),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[export_format.value],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/{ride_id}", response_model=RideResponse)
+async def get_ride(
+    ride_id: str = Path(..., description="The ID of the ride to get"),
+    if_none_match: Optional[str] = Header(None, description="ETag of a previous response; 304 if unchanged")
+):
+    """Get a specific ride by ID"""
+    ride = ride_manager.get_ride(ride_id)
+    if not ride:
+        raise HTTPException(status_code=404, detail="Ride not found")
+    # The body also shows the driver's rating and the distance traced from
+    # their location updates, so a driver change is a new version too
+    version = (ride.version, ride.driver.version if ride.driver else 0)
+    return ride_cache.response(ride.id, version, lambda: convert_to_response(ride).model_dump_json().encode(),
+                               if_none_match)
+
+@router.post("/estimate", response_model=FareEstimateResponse)
+async def estimate_fare(fare_request: FareEstimateRequest):
+    """Estimate the fare for a ride without creating a ride request"""
+    # Riders asking for the same trip at once share one estimate
+    return await estimate_flight.run(estimate_key(fare_request), lambda: compute_estimate(fare_request))
+
+@router.put("/{ride_id}/start", response_model=RideResponse)
+async def start_ride(
+    ride_id: str = Path(..., description="The ID of the ride to start"),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Start a ride (driver en route to pickup)"""
+    return await run_transition("start_ride", ride_manager.start_ride, ride_id, idempotency_key, "Failed to start ride")
+
+@router.put("/{ride_id}/pickup", response_model=RideResponse)
+async def pickup_rider(
+    ride_id: str = Path(..., description="The ID of the ride to update"),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Mark rider as picked up (ride in progress)"""
+    return await run_transition("pickup_rider", ride_manager.pickup_rider, ride_id, idempotency_key, "Failed to pickup rider")
+
+@router.put("/{ride_id}/complete", response_model=RideResponse)
+async def complete_ride(
+    ride_id: str = Path(..., description="The ID of the ride to complete"),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Complete a ride"""
+    return await run_transition("complete_ride", ride_manager.complete_ride, ride_id, idempotency_key, "Failed to complete ride")
+
+@router.put("/{ride_id}/cancel", response_model=RideResponse)
+async def cancel_ride(
+    ride_id: str = Path(..., description="The ID of the ride to cancel"),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Cancel a ride"""
+    return await run_transition("cancel_ride", ride_manager.cancel_ride, ride_id, idempotency_key, "Failed to cancel ride")
+
+# Helper functions
+async def run_idempotent(operation: str, idempotency_key: Optional[str], fingerprint: str,
+                         compute: Callable[[], Awaitable[RideResponse]]) -> RideResponse:
+    """Run compute once per idempotency key, replaying its response to retries"""
+    if not idempotency_key:
+        return await compute()
+    try:
+        return await idempotency_cache.run((operation, idempotency_key), fingerprint, compute)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+async def run_transition(operation: str, transition: Callable[[str], bool], ride_id: str,
+                         idempotency_key: Optional[str], error_detail: str) -> RideResponse:
+    """Apply a ride state transition on the worker pool behind admission control"""
+    async def apply():
+        async with admission_controller.admit(operation):
+            success = await worker_pool.run(transition, ride_id)
+        if not success:
+            raise HTTPException(status_code=400, detail=error_detail)
+        return convert_to_response(ride_manager.get_ride(ride_id))
+    
+    return await run_idempotent(operation, idempotency_key, ride_id, apply)
+
+def create_ride(ride_data: RideCreate) -> RideResponse:
+    """Create a ride for a request and match a driver to it"""
     try:
         # Get the rider
         rider = user_manager.get_rider(ride_data.rider_id)
         if not rider:
             raise HTTPException(status_code=404, detail="Rider not found")
         
-        # Set driver matching strategy
-        if ride_data.driver_matching_strategy == DriverMatchingStrategyEnum.NEAREST:
-            ride_manager.set_driver_matching_strategy(NearestDriverStrategy())
-        else:
-            ride_manager.set_driver_matching_strategy(HighestRatedDriverStrategy())
+        # Strategies go with this request only, so concurrent requests never
+        # see each other's choices
+        matching_strategy = MATCHING_STRATEGIES[ride_data.driver_matching_strategy.value]()
         
-        # Set pricing strategy
-        base_strategy = BasePricingStrategy()
-        if ride_data.pricing_strategy == PricingStrategyEnum.SURGE:
-            multiplier = ride_data.surge_multiplier or 1.5
-            strategy = SurgePricingDecorator(base_strategy, multiplier)
-            ride_manager.set_pricing_strategy(strategy)
-        elif ride_data.pricing_strategy == PricingStrategyEnum.DISCOUNT:
-            percentage = ride_data.discount_percentage or 10.0
-            strategy = DiscountDecorator(base_strategy, percentage)
-            ride_manager.set_pricing_strategy(strategy)
-        else:
-            ride_manager.set_pricing_strategy(base_strategy)
+        pricing_strategy = pricing_strategy_for(ride_data.pricing_strategy.value, ride_data.surge_multiplier,
+                                                ride_data.discount_percentage)
         
         # Request the ride
         vehicle_type = VehicleType[ride_data.vehicle_type]
@@ -140,14 +339,18 @@ async def request_ride(ride_data: RideCreate):
                 rider, 
                 ride_data.pickup_location, 
                 ride_data.dropoff_location, 
-                vehicle_type
+                vehicle_type,
+                matching_strategy,
+                pricing_strategy
             )
         else:
             ride = ride_manager.request_carpool(
                 rider, 
                 ride_data.pickup_location, 
                 ride_data.dropoff_location, 
-                vehicle_type
+                vehicle_type,
+                matching_strategy,
+                pricing_strategy
             )
         
         if not ride:
@@ -157,112 +360,135 @@ async def request_ride(ride_data: RideCreate):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/", response_model=List[RideResponse])
-async def get_all_rides():
-    """Get all rides"""
-    print("Total Riders:", len(user_manager.get_all_riders()), "Total Drivers:", len(user_manager.get_all_drivers()))
-    rides = list(ride_manager.rides.values())
-    return [convert_to_response(ride) for ride in rides]
-
-@router.get("/active", response_model=List[RideResponse])
-async def get_active_rides():
-    """Get all active rides"""
-    rides = list(ride_manager.active_rides.values())
-    return [convert_to_response(ride) for ride in rides]
+async def compute_estimate(fare_request: FareEstimateRequest) -> FareEstimateResponse:
+    """Fare estimate with the fastest driver's ETA, admitted like any other request"""
+    async with admission_controller.admit("estimate_fare"):
+        try:
+            estimate = await worker_pool.run_isolated(calculate_estimate, fare_request)
+            # Needs the live driver pool, so it stays in this process
+            estimate.eta_seconds = await worker_pool.run(estimate_pickup_eta, fare_request)
+            return estimate
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-@router.get("/{ride_id}", response_model=RideResponse)
-async def get_ride(ride_id: str = Path(..., description="The ID of the ride to get")):
-    """Get a specific ride by ID"""
-    ride = ride_manager.get_ride(ride_id)
-    if not ride:
-        raise HTTPException(status_code=404, detail="Ride not found")
-    return convert_to_response(ride)
+def local_time(moment: Optional[datetime]) -> Optional[datetime]:
+    """Naive local time, as rides record theirs, for a query time that may carry a UTC offset"""
+    if moment is None or moment.tzinfo is None:
+        return moment
+    return moment.astimezone().replace(tzinfo=None)
 
-@router.post("/estimate", response_model=FareEstimateResponse)
-async def estimate_fare(fare_request: FareEstimateRequest):
-    """Estimate the fare for a ride without creating a ride request"""
-    try:
-        # Create a temporary ride object to calculate distance
-        from models.ride import Ride, VehicleType, RideType
-        from models.user import Rider
-        
-        # Create a temporary rider (not saved)
-        temp_rider = Rider("Temporary", "0000000000")
-        
-        # Create a temporary ride to calculate distance
-        vehicle_type = VehicleType[fare_request.vehicle_type]
-        temp_ride = Ride(
-            temp_rider, 
-            fare_request.pickup_location, 
-            fare_request.dropoff_location, 
-            vehicle_type,
-            RideType.REGULAR
-        )
-        
-        # Set pricing strategy
-        base_strategy = BasePricingStrategy()
-        if fare_request.pricing_strategy == PricingStrategyEnum.SURGE:
-            multiplier = fare_request.surge_multiplier or 1.5
-            strategy = SurgePricingDecorator(base_strategy, multiplier)
-        elif fare_request.pricing_strategy == PricingStrategyEnum.DISCOUNT:
-            percentage = fare_request.discount_percentage or 10.0
-            strategy = DiscountDecorator(base_strategy, percentage)
-        else:
-            strategy = base_strategy
-        
-        # Calculate estimated fare
-        estimated_fare = strategy.calculate_fare(temp_ride)
-        
-        # Get base price components for transparency
-        base_fare = base_strategy._get_base_fare(vehicle_type)
-        per_km_rate = base_strategy._get_per_km_rate(vehicle_type)
-        
-        return FareEstimateResponse(
-            estimated_fare=estimated_fare,
-            distance=temp_ride.distance,
-            vehicle_type=fare_request.vehicle_type,
-            pricing_strategy=fare_request.pricing_strategy,
-            base_fare=base_fare,
-            per_km_rate=per_km_rate
-        )
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+def estimate_key(fare_request: FareEstimateRequest) -> Tuple:
+    """Requests with the same key get the same estimate"""
+    precision = get_settings().COALESCE_PRECISION
+    return (quantize(fare_request.pickup_location, precision), quantize(fare_request.dropoff_location, precision),
+            fare_request.vehicle_type.value, fare_request.pricing_strategy.value,
+            fare_request.surge_multiplier, fare_request.discount_percentage)
 
-@router.put("/{ride_id}/start", response_model=RideResponse)
-async def start_ride(ride_id: str = Path(..., description="The ID of the ride to start")):
-    """Start a ride (driver en route to pickup)"""
-    success = ride_manager.start_ride(ride_id)
-    if not success:
-        raise HTTPException(status_code=400, detail="Failed to start ride")
-    return convert_to_response(ride_manager.get_ride(ride_id))
+def calculate_estimate(fare_request: FareEstimateRequest) -> FareEstimateResponse:
+    """Calculate a fare estimate for a request; safe to run in a worker process"""
+    # Create a temporary ride object to calculate distance
+    from models.ride import Ride, VehicleType, RideType
+    from models.user import Rider
+    
+    # Quote only trips that could be booked
+    zone_index.check_trip(fare_request.pickup_location, fare_request.dropoff_location)
+    
+    # Create a temporary rider (not saved)
+    temp_rider = Rider("Temporary", "0000000000")
+    
+    # Create a temporary ride to calculate distance
+    vehicle_type = VehicleType[fare_request.vehicle_type]
+    temp_ride = Ride(
+        temp_rider, 
+        fare_request.pickup_location, 
+        fare_request.dropoff_location, 
+        vehicle_type,
+        RideType.REGULAR
+    )
+    
+    # Set pricing strategy
+    base_strategy = ZonePricingStrategy()
+    if fare_request.pricing_strategy == PricingStrategyEnum.SURGE:
+        multiplier = fare_request.surge_multiplier or 1.5
+        strategy = SurgePricingDecorator(base_strategy, multiplier)
+    elif fare_request.pricing_strategy == PricingStrategyEnum.DISCOUNT:
+        percentage = fare_request.discount_percentage or 10.0
+        strategy = DiscountDecorator(base_strategy, percentage)
+    else:
+        strategy = base_strategy
+    
+    # Calculate estimated fare
+    estimated_fare = strategy.calculate_fare(temp_ride)
+    
+    # Get base price components for transparency
+    base_fare = base_strategy.base_fare_for(temp_ride)
+    per_km_rate = base_strategy.per_km_rate_for(temp_ride)
+    
+    return FareEstimateResponse(
+        estimated_fare=estimated_fare,
+        distance=temp_ride.distance,
+        vehicle_type=fare_request.vehicle_type,
+        pricing_strategy=fare_request.pricing_strategy,
+        base_fare=base_fare,
+        per_km_rate=per_km_rate,
+        surcharge=base_strategy.surcharge_for(temp_ride),
+        pickup_zones=[zone.name for zone in zone_index.zones_at(fare_request.pickup_location)]
+    )
 
-@router.put("/{ride_id}/pickup", response_model=RideResponse)
-async def pickup_rider(ride_id: str = Path(..., description="The ID of the ride to update")):
-    """Mark rider as picked up (ride in progress)"""
-    success = ride_manager.pickup_rider(ride_id)
-    if not success:
-        raise HTTPException(status_code=400, detail="Failed to pickup rider")
-    return convert_to_response(ride_manager.get_ride(ride_id))
+def estimate_pickup_eta(fare_request: FareEstimateRequest) -> Optional[float]:
+    """Seconds until the fastest available driver could reach the pickup, None if none in range"""
+    drivers = [driver for driver in ride_manager.get_available_drivers()
+               if driver.vehicle.vehicle_type == fare_request.vehicle_type.value]
+    etas = eta_service.etas_to([driver.get_location() for driver in drivers],
+                               fare_request.pickup_location,
+                               max_match_distance(fare_request.vehicle_type.value))
+    fastest = min(etas, default=float("inf"))
+    return fastest if fastest != float("inf") else None
 
-@router.put("/{ride_id}/complete", response_model=RideResponse)
-async def complete_ride(ride_id: str = Path(..., description="The ID of the ride to complete")):
-    """Complete a ride"""
-    success = ride_manager.complete_ride(ride_id)
-    if not success:
-        raise HTTPException(status_code=400, detail="Failed to complete ride")
-    return convert_to_response(ride_manager.get_ride(ride_id))
+def active_ride_changes(since: int) -> RideChangesResponse:
+    """Active rides changed after a change sequence, or all of them if the log is too short"""
+    # The log is read first, outside the manager lock; a change is logged
+    # under that lock along with its active-ride update, so once the lock is
+    # taken every change read is applied
+    changes = change_log.changed_since(since, "ride")
+    if changes is None:
+        sequence = change_log.sequence
+        rides = ride_manager.get_active_rides()
+        return RideChangesResponse(sequence=sequence, resync=True,
+                                   changed=[convert_to_response(ride) for ride in rides], removed=[])
+    
+    sequence, ride_ids = changes
+    changed, removed = [], []
+    with ride_manager.lock:
+        for ride_id in ride_ids:
+            ride = ride_manager.active_rides.get(ride_id)
+            if ride is not None:
+                changed.append(ride)
+            else:
+                removed.append(ride_id)
+    return RideChangesResponse(sequence=sequence, resync=False,
+                               changed=[convert_to_response(ride) for ride in changed], removed=removed)
 
-@router.put("/{ride_id}/cancel", response_model=RideResponse)
-async def cancel_ride(ride_id: str = Path(..., description="The ID of the ride to cancel")):
-    """Cancel a ride"""
-    success = ride_manager.cancel_ride(ride_id)
-    if not success:
-        raise HTTPException(status_code=400, detail="Failed to cancel ride")
-    return convert_to_response(ride_manager.get_ride(ride_id))
+def rides_in_viewport(request: RideViewportRequest, viewport: Viewport) -> RideViewportResponse:
+    """Active rides in a viewport from the spatial index, as points or clusters"""
+    rides = ride_manager.ride_index.in_viewport(viewport, request.by.value)
+    if should_cluster(request.zoom, len(rides)):
+        clusters = cluster_points(((location, ride.status.value) for ride, location in rides),
+                                  cluster_cell_size(request.zoom))
+        return RideViewportResponse(total=len(rides), clustered=True, clusters=clusters)
+    
+    points = [MapRide(id=ride.id, location=location, status=ride.status.value,
+                      vehicle_type=ride.vehicle_type.value,
+                      driver_id=ride.driver.id if ride.driver else None)
+              for ride, location in rides]
+    return RideViewportResponse(total=len(rides), clustered=False, rides=points)
 
-# Helper function
 def convert_to_response(ride: Ride) -> RideResponse:
     """Convert Ride object to RideResponse model"""
+    with span("rides.serialize"):
+        return _build_response(ride)
+
+def _build_response(ride: Ride) -> RideResponse:
     response_data = {
         "id": ride.id,
         "rider_id": ride.rider.id,
@@ -276,9 +502,14 @@ def convert_to_response(ride: Ride) -> RideResponse:
         "end_time": ride.end_time,
         "fare": ride.fare,
         "distance": ride.distance,
+        "eta_seconds": None,
+        "driven_distance": ride.trace.distance_km if ride.trace else None,
         "driver": None
     }
     
+    if ride.status in (RideStatus.DRIVER_ASSIGNED, RideStatus.DRIVER_EN_ROUTE):
+        response_data["eta_seconds"] = ride.pickup_eta_seconds
+    
     if ride.driver:
         response_data["driver"] = DriverInfo(
             id=ride.driver.id,
@@ -0,0 +1,223 @@
+from fastapi import APIRouter, HTTPException, Path, Header
+from typing import Any, Dict, Optional
+from api.idempotency import IDEMPOTENCY_HEADER
+from api.routers import rides
+from api.routers.drivers import AvailabilityUpdate, DriverCreate, DriverResponse, LocationUpdate, VehicleInfo
+from api.routers.riders import RiderCreate, RiderResponse
+from api.routers.rides import FareEstimateRequest, FareEstimateResponse, RideCreate, RideResponse
+from api.workers import worker_pool
+from monitoring.profiler import span
+from sharding.router import ShardError, ShardRouter
+from sharding.shard_map import GeoShardMap
+
+# Core rider, driver and ride routes served by shard processes when
+# SHARD_COUNT is set. Each call blocks on a shard's pipe, so handlers make
+# it on the worker pool; calls for different shards then run in parallel.
+riders_router = APIRouter()
+drivers_router = APIRouter()
+rides_router = APIRouter()
+shard_router: Optional[ShardRouter] = None  # Set by start_shards
+
+def start_shards(shard_map: GeoShardMap, road_graph_path: Optional[str] = None,
+                 zones_path: Optional[str] = None) -> ShardRouter:
+    """Start one shard process per band of shard_map for the routes to use"""
+    global shard_router
+    shard_router = ShardRouter(shard_map, road_graph_path=road_graph_path, zones_path=zones_path)
+    return shard_router
+
+def stop_shards() -> None:
+    """Stop the shard processes, if started"""
+    global shard_router
+    if shard_router is not None:
+        shard_router.close()
+        shard_router = None
+
+# Rider routes
+@riders_router.post("/", response_model=RiderResponse)
+async def create_rider(rider_data: RiderCreate):
+    """Register a new rider"""
+    rider_id = shard_router.register_rider(rider_data.name, rider_data.phone, rider_data.default_location)
+    return RiderResponse(**shard_router.get_rider(rider_id))
+
+@riders_router.get("/{rider_id}", response_model=RiderResponse)
+async def get_rider(rider_id: str = Path(..., description="The ID of the rider to get")):
+    """Get a specific rider by ID, with their rides from every shard"""
+    rider = await worker_pool.run(shard_router.get_rider, rider_id)
+    if not rider:
+        raise HTTPException(status_code=404, detail="Rider not found")
+    return RiderResponse(**rider)
+
+@riders_router.put("/{rider_id}/location", response_model=RiderResponse)
+async def update_rider_location(
+    location_data: LocationUpdate,
+    rider_id: str = Path(..., description="The ID of the rider to update")
+):
+    """Update a rider's current location"""
+    success = await worker_pool.run(shard_router.update_rider_location, rider_id, location_data.location)
+    if not success:
+        raise HTTPException(status_code=404, detail="Rider not found")
+    return RiderResponse(**await worker_pool.run(shard_router.get_rider, rider_id))
+
+# Driver routes
+@drivers_router.post("/", response_model=DriverResponse)
+async def create_driver(driver_data: DriverCreate):
+    """Register a new driver in the shard owning their location"""
+    try:
+        driver_id = await worker_pool.run(
+            shard_router.register_driver,
+            driver_data.name,
+            driver_data.phone,
+            driver_data.vehicle.vehicle_id,
+            driver_data.vehicle.model,
+            driver_data.vehicle.vehicle_type,
+            driver_data.vehicle.capacity,
+            driver_data.current_location
+        )
+        return convert_driver(await worker_pool.run(shard_router.get_driver, driver_id))
+    except ShardError as e:
+        raise HTTPException(status_code=400, detail=e.reason)
+
+@drivers_router.get("/{driver_id}", response_model=DriverResponse)
+async def get_driver(driver_id: str = Path(..., description="The ID of the driver to get")):
+    """Get a specific driver by ID"""
+    driver = await worker_pool.run(shard_router.get_driver, driver_id)
+    if not driver:
+        raise HTTPException(status_code=404, detail="Driver not found")
+    return convert_driver(driver)
+
+@drivers_router.put("/{driver_id}/location", response_model=DriverResponse)
+async def update_driver_location(
+    location_data: LocationUpdate,
+    driver_id: str = Path(..., description="The ID of the driver to update")
+):
+    """Update a driver's current location; idle drivers move to the shard owning it"""
+    success = await worker_pool.run(shard_router.update_driver_location, driver_id, location_data.location)
+    if not success:
+        raise HTTPException(status_code=404, detail="Driver not found")
+    return convert_driver(await worker_pool.run(shard_router.get_driver, driver_id))
+
+@drivers_router.put("/{driver_id}/availability", response_model=DriverResponse)
+async def update_driver_availability(
+    availability_update: AvailabilityUpdate,
+    driver_id: str = Path(..., description="The ID of the driver to update")
+):
+    """Update a driver's availability status"""
+    success = await worker_pool.run(shard_router.set_driver_availability, driver_id,
+                                    availability_update.is_available)
+    if not success:
+        raise HTTPException(status_code=404, detail="Driver not found")
+    return convert_driver(await worker_pool.run(shard_router.get_driver, driver_id))
+
+# Ride routes
+@rides_router.post("/", response_model=RideResponse)
+async def request_ride(
+    ride_data: RideCreate,
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Request a new ride in the shard owning the pickup"""
+    async def create():
+        with span("rides.request_ride"):
+            async with rides.admission_controller.admit("request_ride", ride_data.rider_id):
+                try:
+                    ride = await worker_pool.run(
+                        shard_router.request_ride,
+                        ride_data.rider_id,
+                        ride_data.pickup_location,
+                        ride_data.dropoff_location,
+                        ride_data.vehicle_type.value,
+                        ride_data.ride_type.value,
+                        ride_data.driver_matching_strategy.value,
+                        ride_data.pricing_strategy.value,
+                        ride_data.surge_multiplier,
+                        ride_data.discount_percentage
+                    )
+                except KeyError:
+                    raise HTTPException(status_code=404, detail="Rider not found")
+                except ShardError as e:
+                    raise HTTPException(status_code=400, detail=e.reason)
+                return RideResponse.model_validate(ride)
+
+    return await rides.run_idempotent("request_ride", idempotency_key, ride_data.model_dump_json(), create)
+
+@rides_router.post("/estimate", response_model=FareEstimateResponse)
+async def estimate_fare(fare_request: FareEstimateRequest):
+    """Estimate the fare for a ride; no pickup ETA, as the drivers are in the shards"""
+    async def compute():
+        async with rides.admission_controller.admit("estimate_fare"):
+            try:
+                return await worker_pool.run_isolated(rides.calculate_estimate, fare_request)
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+    return await rides.estimate_flight.run(rides.estimate_key(fare_request), compute)
+
+@rides_router.get("/{ride_id}", response_model=RideResponse)
+async def get_ride(ride_id: str = Path(..., description="The ID of the ride to get")):
+    """Get a specific ride by ID"""
+    ride = await worker_pool.run(shard_router.get_ride, ride_id)
+    if not ride:
+        raise HTTPException(status_code=404, detail="Ride not found")
+    return RideResponse.model_validate(ride)
+
+@rides_router.put("/{ride_id}/start", response_model=RideResponse)
+async def start_ride(
+    ride_id: str = Path(..., description="The ID of the ride to start"),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Start a ride (driver en route to pickup)"""
+    return await run_transition("start_ride", ride_id, idempotency_key, "Failed to start ride")
+
+@rides_router.put("/{ride_id}/pickup", response_model=RideResponse)
+async def pickup_rider(
+    ride_id: str = Path(..., description="The ID of the ride to update"),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Mark rider as picked up (ride in progress)"""
+    return await run_transition("pickup_rider", ride_id, idempotency_key, "Failed to pickup rider")
+
+@rides_router.put("/{ride_id}/complete", response_model=RideResponse)
+async def complete_ride(
+    ride_id: str = Path(..., description="The ID of the ride to complete"),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Complete a ride"""
+    return await run_transition("complete_ride", ride_id, idempotency_key, "Failed to complete ride")
+
+@rides_router.put("/{ride_id}/cancel", response_model=RideResponse)
+async def cancel_ride(
+    ride_id: str = Path(..., description="The ID of the ride to cancel"),
+    idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER)
+):
+    """Cancel a ride"""
+    return await run_transition("cancel_ride", ride_id, idempotency_key, "Failed to cancel ride")
+
+# Helper functions
+async def run_transition(operation: str, ride_id: str, idempotency_key: Optional[str],
+                         error_detail: str) -> RideResponse:
+    """Apply a ride state transition in the ride's shard behind admission control"""
+    async def apply():
+        async with rides.admission_controller.admit(operation):
+            success, ride = await worker_pool.run(shard_router.transition, operation, ride_id)
+        if not success:
+            raise HTTPException(status_code=400, detail=error_detail)
+        return RideResponse.model_validate(ride)
+
+    return await rides.run_idempotent(operation, idempotency_key, ride_id, apply)
+
+def convert_driver(driver: Dict[str, Any]) -> DriverResponse:
+    """Convert a shard's driver state to a DriverResponse model"""
+    return DriverResponse(
+        id=driver["id"],
+        name=driver["name"],
+        phone=driver["phone"],
+        vehicle=VehicleInfo(
+            vehicle_id=driver["vehicle_id"],
+            model=driver["model"],
+            vehicle_type=driver["vehicle_type"],
+            capacity=driver["capacity"]
+        ),
+        current_location=driver["location"],
+        is_available=driver["is_available"],
+        rating=driver["rating"],
+        ride_history=driver["ride_history"]
+    )
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+import asyncio
+import time
+
+from monitoring.metrics import registry
+
+COALESCED_REQUESTS = registry.counter(
+    "coalesced_requests_total",
+    "Requests through a single-flight layer, by flight and whether they computed, joined or hit the cache",
+    ["flight", "outcome"])
+
+def quantize(location: Tuple[float, float], precision: int) -> Tuple[float, float]:
+    """Round a location to precision decimal places, e.g. 4 for about 11 m"""
+    return (round(location[0], precision), round(location[1], precision))
+
+class SingleFlight:
+    """Shares one computation among concurrent identical requests and keeps its result briefly.
+
+    The first request for a key starts the computation; requests with the
+    same key that arrive while it runs await the same result instead of
+    starting their own. A finished result is then served for ttl_seconds,
+    so a burst that straddles the end of the computation is covered too.
+    Failures are shared with the waiting requests but never kept.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float = 0.5, max_entries: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.ttl_seconds = ttl_seconds  # 0 only joins computations already running
+        self.max_entries = max_entries
+        self._clock = clock
+        # key -> (expires_at, result), oldest first; every entry gets the same TTL
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Get a fresh result for key, joining the computation in flight or starting one"""
+        entry = self._results.get(key)
+        if entry is not None:
+            if entry[0] > self._clock():
+                COALESCED_REQUESTS.inc(labels=(self.name, "cached"))
+                return entry[1]
+            del self._results[key]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            COALESCED_REQUESTS.inc(labels=(self.name, "joined"))
+        else:
+            COALESCED_REQUESTS.inc(labels=(self.name, "computed"))
+            task = self._in_flight[key] = asyncio.ensure_future(compute())
+            task.add_done_callback(lambda done: self._finish(key, done))
+        # A caller that disconnects leaves the computation running for the others
+        return await asyncio.shield(task)
+
+    def clear(self) -> None:
+        """Drop every kept result"""
+        self._results.clear()
+
+    def _finish(self, key: Hashable, task: asyncio.Future) -> None:
+        del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None or self.ttl_seconds <= 0:
+            return
+
+        now = self._clock()
+        self._results[key] = (now + self.ttl_seconds, task.result())
+        while self._results:
+            oldest_key, (expires_at, _) = next(iter(self._results.items()))
+            if expires_at > now and len(self._results) <= self.max_entries:
+                break
+            del self._results[oldest_key]
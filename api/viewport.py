@@ -0,0 +1,30 @@
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Tuple
+
+from api.config import get_settings
+from spatial.viewport import Viewport
+
+class ViewportRequest(BaseModel):
+    bbox: Optional[Tuple[float, float, float, float]] = Field(
+        None, description="Bounding box (min latitude, min longitude, max latitude, max longitude)")
+    polygon: Optional[List[Tuple[float, float]]] = Field(
+        None, description="Polygon of (latitude, longitude) points; used instead of bbox when given")
+    zoom: int = Field(18, ge=0, le=22, description="Map zoom level; points are clustered below MAP_CLUSTER_ZOOM")
+
+class MapCluster(BaseModel):
+    location: Tuple[float, float] = Field(..., description="Mean position of the points in the cluster")
+    count: int
+    counts: Dict[str, int] = Field(..., description="Points per vehicle type or ride status")
+
+def to_viewport(request: ViewportRequest) -> Viewport:
+    """Build the viewport a request asks for, or fail the request with 400"""
+    try:
+        return Viewport(box=request.bbox, polygon=request.polygon)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def should_cluster(zoom: int, count: int) -> bool:
+    """Cluster zoomed-out maps, and any map with more points than a dashboard can draw"""
+    settings = get_settings()
+    return zoom < settings.MAP_CLUSTER_ZOOM or count > settings.MAP_MAX_POINTS
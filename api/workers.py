@@ -0,0 +1,113 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import Context, copy_context
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+import asyncio
+import threading
+
+from api.config import get_settings
+from routing.engine import routing_engine
+from spatial.zones import zone_index
+
+class WorkerPool:
+    """Runs blocking work off the event loop so one slow scan cannot stall other connections.
+
+    Work that reads or changes the shared managers always runs on the thread
+    pool, because a process has its own copy of every singleton. Pure,
+    picklable functions such as fare estimates may use a process pool by
+    setting kind to "process". Pool processes load the road graph and zones
+    from their files when they start, since under the spawn and forkserver
+    start methods they do not inherit this process's copies.
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: int = 4, road_graph_path: Optional[str] = None,
+                 zones_path: Optional[str] = None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown worker pool kind: {kind}")
+
+        self.kind = kind
+        self.max_workers = max_workers
+        self.road_graph_path = road_graph_path
+        self.zones_path = zones_path
+        self._threads = ThreadPoolExecutor(max_workers, thread_name_prefix="worker")
+        self._processes: Optional[ProcessPoolExecutor] = None  # Started on first use
+        # region -> jobs waiting for the batch already scheduled for that region
+        self._batches: Dict[Hashable, List[Tuple[Callable, tuple, Context, asyncio.Future]]] = {}
+        self._batches_lock = threading.Lock()
+        self.batches_run = 0
+        self.jobs_coalesced = 0
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) on the thread pool, in a copy of the caller's context"""
+        context = copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._threads, context.run, fn, *args)
+
+    async def run_isolated(self, fn: Callable, *args) -> Any:
+        """Run a pure, picklable fn(*args) on the process pool if configured"""
+        return await asyncio.get_running_loop().run_in_executor(self._isolated_executor(), fn, *args)
+
+    async def run_coalesced(self, region: Hashable, fn: Callable, *args) -> Any:
+        """Run fn(*args) on the thread pool, batched with concurrent jobs for the same region.
+
+        The first job for a region schedules one pool task; jobs that arrive
+        before it starts join it and run back to back in arrival order.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._batches_lock:
+            batch = self._batches.get(region)
+            if batch is None:
+                batch = self._batches[region] = []
+                loop.run_in_executor(self._threads, self._run_batch, loop, region)
+            else:
+                self.jobs_coalesced += 1
+            batch.append((fn, args, copy_context(), future))
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        """Get pool configuration and coalescing counters"""
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "batches_run": self.batches_run,
+            "jobs_coalesced": self.jobs_coalesced
+        }
+
+    def _run_batch(self, loop: asyncio.AbstractEventLoop, region: Hashable) -> None:
+        with self._batches_lock:
+            jobs = self._batches.pop(region)
+            self.batches_run += 1
+
+        for fn, args, context, future in jobs:
+            try:
+                result = context.run(fn, *args)
+            except Exception as e:
+                loop.call_soon_threadsafe(_resolve, future, None, e)
+            else:
+                loop.call_soon_threadsafe(_resolve, future, result, None)
+
+    def _isolated_executor(self) -> Executor:
+        if self.kind != "process":
+            return self._threads
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(self.max_workers, initializer=_load_map_data,
+                                                  initargs=(self.road_graph_path, self.zones_path))
+        return self._processes
+
+def _load_map_data(road_graph_path: Optional[str], zones_path: Optional[str]) -> None:
+    """Process pool initializer: load the road graph and zones estimates read"""
+    if road_graph_path:
+        routing_engine.load(road_graph_path)
+    if zones_path:
+        zone_index.load(zones_path)
+
+def _resolve(future: asyncio.Future, result: Any, error: Optional[Exception]) -> None:
+    """Complete a future from the event loop thread unless its caller gave up"""
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+worker_pool = WorkerPool(get_settings().WORKER_POOL_KIND, get_settings().WORKER_POOL_SIZE,
+                         get_settings().ROAD_GRAPH_PATH, get_settings().ZONES_PATH)
@@ -0,0 +1,71 @@
+from typing import List, Tuple
+import math
+import random
+
+from managers.user_manager import UserManager
+from models.ride import VehicleType
+from models.user import Driver, Rider
+from spatial.geo import degree_span
+
+# Synthetic city centred on New York, matching the coordinates used in test.py
+CITY_CENTER = (40.7128, -74.0060)
+CITY_RADIUS_KM = 15.0
+
+# Share of the fleet per vehicle type
+VEHICLE_MIX = [
+    (VehicleType.SEDAN, 0.5),
+    (VehicleType.BIKE, 0.2),
+    (VehicleType.AUTO_RICKSHAW, 0.15),
+    (VehicleType.SUV, 0.15)
+]
+
+# Seats per vehicle type
+VEHICLE_CAPACITY = {
+    VehicleType.BIKE: 1,
+    VehicleType.AUTO_RICKSHAW: 3,
+    VehicleType.SEDAN: 4,
+    VehicleType.SUV: 6
+}
+
+def random_point(rng: random.Random, center: Tuple[float, float] = CITY_CENTER,
+                 radius_km: float = CITY_RADIUS_KM) -> Tuple[float, float]:
+    """Pick a point in the city, denser towards the centre"""
+    lat_span, lon_span = degree_span(center[0], radius_km)
+    # Square root of a uniform draw would be uniform over the disc; the plain
+    # draw concentrates demand and supply downtown like a real city
+    distance = rng.random()
+    angle = rng.uniform(0.0, 2 * math.pi)
+    return (center[0] + distance * lat_span * math.sin(angle),
+            center[1] + distance * lon_span * math.cos(angle))
+
+def random_vehicle_type(rng: random.Random) -> VehicleType:
+    """Pick a vehicle type following VEHICLE_MIX"""
+    types, weights = zip(*VEHICLE_MIX)
+    return rng.choices(types, weights)[0]
+
+def generate_drivers(user_manager: UserManager, count: int, seed: int = 0) -> List[Driver]:
+    """Register count drivers spread over the city with varied ratings"""
+    rng = random.Random(seed)
+    drivers = []
+    for i in range(count):
+        vehicle_type = random_vehicle_type(rng)
+        driver = user_manager.register_driver(
+            f"Driver {i}", f"555-{i:07d}", f"VEH{i:07d}", "Synthetic",
+            vehicle_type.value, VEHICLE_CAPACITY[vehicle_type], random_point(rng)
+        )
+        driver.rating = round(rng.uniform(3.0, 5.0), 2)
+        drivers.append(driver)
+    return drivers
+
+def generate_riders(user_manager: UserManager, count: int, seed: int = 0) -> List[Rider]:
+    """Register count riders with home locations spread over the city"""
+    rng = random.Random(seed + 1)
+    return [
+        user_manager.register_rider(f"Rider {i}", f"556-{i:07d}", random_point(rng))
+        for i in range(count)
+    ]
+
+def generate_trips(count: int, seed: int = 0) -> List[Tuple[Tuple[float, float], Tuple[float, float], VehicleType]]:
+    """Generate (pickup, dropoff, vehicle type) requests"""
+    rng = random.Random(seed + 2)
+    return [(random_point(rng), random_point(rng), random_vehicle_type(rng)) for _ in range(count)]
@@ -0,0 +1,281 @@
+"""Async HTTP load generator for the FastAPI app.
+
+Usage:
+    python -m benchmarks.load                                  # in-process, 30s at 50 scenarios/s
+    python -m benchmarks.load --rate 200 --duration 60 --mix register=1,ping=20,estimate=5,lifecycle=2
+    python -m benchmarks.load --uvicorn                        # through a local uvicorn on --port
+    python -m benchmarks.load --url http://localhost:8000      # against a server started elsewhere
+
+Scenarios start on an open-loop Poisson schedule at --rate per second, so a
+slow server does not slow the offered load down; --max-in-flight only caps
+memory when it falls far behind. Every HTTP call is timed and reported by
+route template with p50/p95/p99 latency, throughput and error rate.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+
+import httpx
+
+from benchmarks.city import VEHICLE_CAPACITY, random_point, random_vehicle_type
+
+DEFAULT_MIX = {"register": 1.0, "ping": 10.0, "estimate": 5.0, "lifecycle": 2.0}
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Parse 'register=1,ping=10' into scenario weights"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"Unknown scenario {name}; expected one of {', '.join(DEFAULT_MIX)}")
+        mix[name] = float(weight or 1.0)
+    return mix
+
+class LatencyRecorder:
+    """Collects per-route latencies and status codes"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}  # Route -> seconds
+        self.errors: Dict[str, int] = {}
+        self.statuses: Dict[str, Dict[int, int]] = {}
+
+    def add(self, route: str, seconds: float, status: int) -> None:
+        self.latencies.setdefault(route, []).append(seconds)
+        counts = self.statuses.setdefault(route, {})
+        counts[status] = counts.get(status, 0) + 1
+        if status == 0 or status >= 400:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        """Summarise every route plus an overall line"""
+        routes = {route: self._summary(samples, self.errors.get(route, 0), elapsed, self.statuses[route])
+                  for route, samples in sorted(self.latencies.items())}
+        everything = [sample for samples in self.latencies.values() for sample in samples]
+        routes["TOTAL"] = self._summary(everything, sum(self.errors.values()), elapsed, {})
+        return routes
+
+    @staticmethod
+    def _summary(samples: List[float], errors: int, elapsed: float,
+                 statuses: Dict[int, int]) -> Dict[str, Any]:
+        ordered = sorted(samples)
+        percentile = lambda share: ordered[min(len(ordered) - 1, int(len(ordered) * share))] * 1000 if ordered else 0.0
+        return {
+            "requests": len(ordered),
+            "throughput": len(ordered) / elapsed if elapsed else 0.0,
+            "error_rate": errors / len(ordered) if ordered else 0.0,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "statuses": {str(status): count for status, count in sorted(statuses.items())}
+        }
+
+class LoadGenerator:
+    """Drives the API with a weighted mix of scenarios at a target rate"""
+
+    def __init__(self, client: httpx.AsyncClient, mix: Dict[str, float], seed: int = 42):
+        self.client = client
+        self.mix = mix
+        self.rng = random.Random(seed)
+        self.recorder = LatencyRecorder()
+        self.rider_ids: List[str] = []
+        self.driver_ids: List[str] = []
+
+    async def call(self, route: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        """Issue one request, recording its latency under route; status 0 means no response"""
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.add(route, time.perf_counter() - started, 0)
+            return None
+        self.recorder.add(route, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def seed(self, riders: int, drivers: int) -> None:
+        """Register a starting population; these calls are not part of the report"""
+        for _ in range(riders):
+            await self._register_rider()
+        for _ in range(drivers):
+            await self._register_driver()
+        self.recorder = LatencyRecorder()
+
+    async def run(self, rate: float, duration: float, max_in_flight: int = 1000) -> Dict[str, Any]:
+        """Start scenarios at rate per second for duration seconds and report on them"""
+        names, weights = zip(*self.mix.items())
+        slots = asyncio.Semaphore(max_in_flight)
+        tasks = set()
+        started = time.perf_counter()
+        next_start = started
+        late = 0
+
+        async def scenario(name: str) -> None:
+            try:
+                await getattr(self, f"_scenario_{name}")()
+            finally:
+                slots.release()
+
+        while next_start - started < duration:
+            delay = next_start - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -0.1:
+                late += 1
+            await slots.acquire()
+            task = asyncio.create_task(scenario(self.rng.choices(names, weights)[0]))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_start += self.rng.expovariate(rate)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        return {"elapsed_seconds": elapsed, "late_starts": late, "routes": self.recorder.report(elapsed)}
+
+    async def _register_rider(self) -> None:
+        response = await self.call("POST /api/riders/", "POST", "/api/riders/", json={
+            "name": "Load Rider", "phone": f"557-{self.rng.randrange(10 ** 7):07d}",
+            "default_location": random_point(self.rng)
+        })
+        if response is not None and response.status_code == 200:
+            self.rider_ids.append(response.json()["id"])
+
+    async def _register_driver(self) -> None:
+        vehicle_type = random_vehicle_type(self.rng)
+        response = await self.call("POST /api/drivers/", "POST", "/api/drivers/", json={
+            "name": "Load Driver", "phone": f"558-{self.rng.randrange(10 ** 7):07d}",
+            "vehicle": {
+                "vehicle_id": f"LOAD{self.rng.randrange(10 ** 7):07d}", "model": "Synthetic",
+                "vehicle_type": vehicle_type.value, "capacity": VEHICLE_CAPACITY[vehicle_type]
+            },
+            "current_location": random_point(self.rng)
+        })
+        if response is not None and response.status_code == 200:
+            self.driver_ids.append(response.json()["id"])
+
+    async def _scenario_register(self) -> None:
+        if self.rng.random() < 0.5:
+            await self._register_rider()
+        else:
+            await self._register_driver()
+
+    async def _scenario_ping(self) -> None:
+        if not self.driver_ids:
+            return
+        driver_id = self.rng.choice(self.driver_ids)
+        await self.call("PUT /api/drivers/{id}/location", "PUT", f"/api/drivers/{driver_id}/location",
+                        json={"location": random_point(self.rng)})
+
+    async def _scenario_estimate(self) -> None:
+        await self.call("POST /api/rides/estimate", "POST", "/api/rides/estimate", json=self._trip())
+
+    async def _scenario_lifecycle(self) -> None:
+        if not self.rider_ids:
+            return
+        request = dict(self._trip(), rider_id=self.rng.choice(self.rider_ids))
+        response = await self.call("POST /api/rides/", "POST", "/api/rides/", json=request)
+        if response is None or response.status_code != 200:
+            return
+
+        ride = response.json()
+        if ride["driver"] is None:
+            await self.call("PUT /api/rides/{id}/cancel", "PUT", f"/api/rides/{ride['id']}/cancel")
+            return
+        for step in ("start", "pickup", "complete"):
+            response = await self.call(f"PUT /api/rides/{{id}}/{step}", "PUT", f"/api/rides/{ride['id']}/{step}")
+            if response is None or response.status_code != 200:
+                return
+
+    def _trip(self) -> Dict[str, Any]:
+        return {
+            "pickup_location": random_point(self.rng),
+            "dropoff_location": random_point(self.rng),
+            "vehicle_type": random_vehicle_type(self.rng).value
+        }
+
+def start_uvicorn(port: int) -> Tuple[Any, threading.Thread]:
+    """Serve api.main:app on localhost:port from a background thread"""
+    import uvicorn
+    from api.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"uvicorn failed to start on port {port}")
+        time.sleep(0.05)
+    return server, thread
+
+def make_client(url: Optional[str]) -> httpx.AsyncClient:
+    """Client for a server at url, or for the app in this process when url is None"""
+    if url:
+        limits = httpx.Limits(max_connections=200, max_keepalive_connections=200)
+        return httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0)
+
+    from api.main import app
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadgen", timeout=30.0)
+
+async def run_load(url: Optional[str], mix: Dict[str, float], rate: float, duration: float,
+                   riders: int, drivers: int, seed: int, max_in_flight: int) -> Dict[str, Any]:
+    async with make_client(url) as client:
+        generator = LoadGenerator(client, mix, seed)
+        await generator.seed(riders, drivers)
+        report = await generator.run(rate, duration, max_in_flight)
+    report["target"] = url or "in-process"
+    report["rate"] = rate
+    report["mix"] = mix
+    return report
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Target {report['target']}: {report['elapsed_seconds']:.1f}s at {report['rate']:g} scenarios/s, "
+          f"{report['late_starts']} late starts")
+    print(f"{'route':<36} {'requests':>9} {'req/s':>9} {'errors':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, summary in report["routes"].items():
+        print(f"{route:<36} {summary['requests']:>9} {summary['throughput']:>9.1f} "
+              f"{summary['error_rate']:>8.2%} {summary['p50_ms']:>9.2f} "
+              f"{summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f}")
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Ride-sharing API load generator")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="Base URL of a running server; default drives the app in-process")
+    target.add_argument("--uvicorn", action="store_true", help="Start a local uvicorn server for the run")
+    parser.add_argument("--port", type=int, default=8765, help="Port for --uvicorn")
+    parser.add_argument("--rate", type=float, default=50.0, help="Scenarios started per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load for")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="Scenario weights, e.g. register=1,ping=10,estimate=5,lifecycle=2")
+    parser.add_argument("--riders", type=int, default=500, help="Riders registered before the run")
+    parser.add_argument("--drivers", type=int, default=200, help="Drivers registered before the run")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="Cap on concurrently running scenarios")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the generated traffic")
+    parser.add_argument("--output", help="Also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    server = None
+    url = args.url
+    if args.uvicorn:
+        server, thread = start_uvicorn(args.port)
+        url = f"http://127.0.0.1:{args.port}"
+    try:
+        report = asyncio.run(run_load(url, args.mix, args.rate, args.duration, args.riders,
+                                      args.drivers, args.seed, args.max_in_flight))
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
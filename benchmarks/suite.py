@@ -0,0 +1,432 @@
+"""In-process benchmarks for matching, the ride lifecycle, ride offers, fare estimates, bulk import, zones, memory and sharding.
+
+Usage:
+    python -m benchmarks.suite                          # 1k, 10k, 100k and 1M drivers
+    python -m benchmarks.suite --sizes 1000 10000 --output results.json
+    python -m benchmarks.suite --baseline baseline.json --fail-on-regression
+    python -m benchmarks.suite --sizes 10000 --storage sqlite  # lifecycle with SQLite persistence only
+    python -m benchmarks.suite --shards 1 2 4 8                # sharded lifecycle throughput per shard count
+
+Results are written as JSON: one entry per metric with its value, unit and
+whether higher is better, so two runs can be compared key by key.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import csv
+import gc
+import io
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.city import (CITY_CENTER, CITY_RADIUS_KM, generate_drivers, generate_riders, generate_trips,
+                             random_point, random_vehicle_type, VEHICLE_CAPACITY)
+from managers.ride_manager import RideManager
+from managers.user_manager import UserManager
+from models.ride import Ride
+from models.user import Rider
+from spatial.geo import degree_span
+from spatial.zones import RATE_CARD, Zone, ZoneIndex
+from strategies.driver_matching import NearestDriverStrategy, HighestRatedDriverStrategy
+from strategies.pricing import BasePricingStrategy
+from storage.bulk_import import DRIVER_FIELDS, import_drivers
+from sharding.router import ShardRouter
+from sharding.shard_map import GeoShardMap
+from simulation.clock import EventClock
+from storage.sqlite import SQLiteRepository
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+# Lifecycle throughput is measured fully in memory and again writing to SQLite
+STORAGES = ["memory", "sqlite"]
+
+# Shard counts to measure sharded lifecycle throughput at
+DEFAULT_SHARD_COUNTS = [1, 2, 4]
+
+Results = Dict[str, Dict[str, Any]]
+
+def fresh_managers() -> Tuple[UserManager, RideManager]:
+    """Reset the singletons so each benchmark starts from an empty system"""
+    UserManager._instance = None
+    RideManager._instance = None
+    return UserManager(), RideManager()
+
+def record(results: Results, name: str, value: float, unit: str, higher_is_better: bool = False) -> None:
+    results[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+def record_latencies(results: Results, name: str, samples_ns: List[int]) -> None:
+    """Record mean, p50 and p95 of per-call timings in microseconds"""
+    samples_us = sorted(sample / 1000 for sample in samples_ns)
+    record(results, f"{name}.mean", statistics.fmean(samples_us), "us")
+    record(results, f"{name}.p50", samples_us[len(samples_us) // 2], "us")
+    record(results, f"{name}.p95", samples_us[int(len(samples_us) * 0.95)], "us")
+
+def time_calls(fn: Callable, args_list: List[tuple]) -> List[int]:
+    samples = []
+    for args in args_list:
+        started = time.perf_counter_ns()
+        fn(*args)
+        samples.append(time.perf_counter_ns() - started)
+    return samples
+
+def bench_find(results: Results, size: int, seed: int) -> None:
+    """Time one find_driver call per strategy, with and without the spatial index"""
+    user_manager, ride_manager = fresh_managers()
+    for driver in generate_drivers(user_manager, size, seed):
+        ride_manager.register_driver(driver)
+
+    # Full scans get slow on big fleets; keep each run to a few million driver visits
+    queries = max(20, min(500, 5000000 // size))
+    probe = Rider("Probe", "0000000000")
+    rides = [Ride(probe, pickup, dropoff, vehicle_type)
+             for pickup, dropoff, vehicle_type in generate_trips(queries, seed)]
+
+    for label, strategy, use_index in [
+        ("nearest", NearestDriverStrategy(), False),
+        ("nearest.index", NearestDriverStrategy(), True),
+        ("highest_rated.scan", HighestRatedDriverStrategy(), False),
+        ("highest_rated.index", HighestRatedDriverStrategy(), True)
+    ]:
+        driver_index = ride_manager.driver_index if use_index else None
+        samples = time_calls(strategy.find_driver,
+                             [(ride, ride_manager.available_drivers, driver_index) for ride in rides])
+        record_latencies(results, f"find.{label}.n={size}", samples)
+
+def bench_lifecycle(results: Results, size: int, seed: int, storage: str = "memory") -> None:
+    """Measure request_ride -> start -> pickup -> complete lifecycles per second"""
+    user_manager, ride_manager = fresh_managers()
+    for driver in generate_drivers(user_manager, size, seed):
+        ride_manager.register_driver(driver)
+    riders = generate_riders(user_manager, 100, seed)
+    ride_manager.set_driver_matching_strategy(HighestRatedDriverStrategy())
+
+    repository = None
+    if storage == "sqlite":
+        directory = tempfile.TemporaryDirectory()
+        repository = SQLiteRepository(os.path.join(directory.name, "bench.db"))
+        user_manager.set_repository(repository)
+        ride_manager.set_repository(repository, user_manager.riders, user_manager.drivers)
+        repository.flush()
+
+    lifecycles = max(50, min(2000, 2000000 // size))
+    trips = generate_trips(lifecycles, seed)
+
+    # Observers print every transition; keep the console out of the measurement
+    with redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for i, (pickup, dropoff, vehicle_type) in enumerate(trips):
+            ride = ride_manager.request_ride(riders[i % len(riders)], pickup, dropoff, vehicle_type)
+            ride_manager.start_ride(ride.id)
+            ride_manager.pickup_rider(ride.id)
+            ride_manager.complete_ride(ride.id)
+        if repository is not None:
+            # Count the time to get every write onto disk
+            repository.flush()
+        elapsed = time.perf_counter() - started
+
+    label = "lifecycle" if storage == "memory" else f"lifecycle.{storage}"
+    record(results, f"{label}.n={size}", lifecycles / elapsed, "rides/s", higher_is_better=True)
+    if repository is not None:
+        repository.close()
+        directory.cleanup()
+
+def bench_offers(results: Results, seed: int, count: int = 1000, fanout: int = 3,
+                 accept_probability: float = 0.4, timeout: float = 15.0) -> None:
+    """Simulate seconds from request to acceptance, offering rides one driver at a time and fanout at a time.
+
+    Each offered driver answers after 2-12 virtual seconds: they accept with
+    accept_probability, otherwise decline or, half the time, never answer
+    and let the offer expire.
+    """
+    for label, k in [("sequential", 1), ("parallel", fanout)]:
+        rng = random.Random(seed + 5)
+        user_manager, ride_manager = fresh_managers()
+        for driver in generate_drivers(user_manager, 5000, seed):
+            ride_manager.register_driver(driver)
+        riders = generate_riders(user_manager, 100, seed)
+        ride_manager.set_driver_matching_strategy(HighestRatedDriverStrategy())
+        clock = EventClock()
+        ride_manager.set_offer_dispatch(k, timeout, clock=lambda: clock.now)
+        requested: Dict[str, float] = {}
+        answered = set()
+        waits = []
+
+        def schedule_answers(ride_id: str) -> None:
+            for offer in ride_manager.offers.open_for_ride(ride_id):
+                if offer.id in answered:
+                    continue
+                answered.add(offer.id)
+                if rng.random() < accept_probability:
+                    clock.schedule(rng.uniform(2, 12), accept, offer.id, ride_id)
+                elif rng.random() < 0.5:
+                    clock.schedule(rng.uniform(2, 12), decline, offer.id, ride_id)
+
+        def accept(offer_id: str, ride_id: str) -> None:
+            if ride_manager.accept_offer(offer_id):
+                waits.append(clock.now - requested.pop(ride_id))
+            schedule_answers(ride_id)
+
+        def decline(offer_id: str, ride_id: str) -> None:
+            ride_manager.decline_offer(offer_id)
+            schedule_answers(ride_id)
+
+        def sweep() -> None:
+            ride_manager.expire_offers()
+            for ride_id in list(requested):
+                schedule_answers(ride_id)
+            clock.schedule(1.0, sweep)
+
+        def request(pickup, dropoff, vehicle_type, rider) -> None:
+            ride = ride_manager.request_ride(rider, pickup, dropoff, vehicle_type)
+            requested[ride.id] = clock.now
+            schedule_answers(ride.id)
+
+        for i, (pickup, dropoff, vehicle_type) in enumerate(generate_trips(count, seed)):
+            clock.schedule(i * 0.5, request, pickup, dropoff, vehicle_type, riders[i % len(riders)])
+        clock.schedule(1.0, sweep)
+        with redirect_stdout(io.StringIO()):
+            clock.run(count * 0.5 + 600)
+
+        waits.sort()
+        record(results, f"offers.{label}.accepted", len(waits) / count, "ratio", higher_is_better=True)
+        if waits:
+            record(results, f"offers.{label}.time_to_accept.mean", statistics.fmean(waits), "s")
+            record(results, f"offers.{label}.time_to_accept.p50", waits[len(waits) // 2], "s")
+            record(results, f"offers.{label}.time_to_accept.p95", waits[int(len(waits) * 0.95)], "s")
+
+def bench_estimate(results: Results, seed: int, count: int = 5000) -> None:
+    """Time a fare estimate: build the ride and price it"""
+    strategy = BasePricingStrategy()
+    probe = Rider("Probe", "0000000000")
+    estimate = lambda pickup, dropoff, vehicle_type: strategy.calculate_fare(
+        Ride(probe, pickup, dropoff, vehicle_type))
+    record_latencies(results, "estimate", time_calls(estimate, generate_trips(count, seed)))
+
+def bench_import(results: Results, seed: int, count: int = 100000) -> None:
+    """Measure drivers per second bulk imported from CSV and NDJSON files"""
+    rng = random.Random(seed + 3)
+    rows = []
+    for i in range(count):
+        vehicle_type = random_vehicle_type(rng)
+        latitude, longitude = random_point(rng)
+        rows.append({"name": f"Driver {i}", "phone": f"555-{i:07d}", "vehicle_id": f"VEH{i:07d}",
+                     "model": "Synthetic", "vehicle_type": vehicle_type.value,
+                     "capacity": VEHICLE_CAPACITY[vehicle_type], "latitude": latitude, "longitude": longitude})
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, "drivers.csv")
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=DRIVER_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        ndjson_path = os.path.join(directory, "drivers.ndjson")
+        with open(ndjson_path, "w") as f:
+            f.writelines(json.dumps(row) + "\n" for row in rows)
+        del rows
+
+        for label, path in [("csv", csv_path), ("ndjson", ndjson_path)]:
+            user_manager, ride_manager = fresh_managers()
+            report = import_drivers(path, user_manager, ride_manager)
+            record(results, f"import.{label}", report.rows_per_second, "rows/s", higher_is_better=True)
+
+def bench_zones(results: Results, seed: int, zone_count: int = 1000, count: int = 20000) -> None:
+    """Time zone lookups over many rate-card polygons, first seen and memoized"""
+    rng = random.Random(seed + 4)
+    zones = []
+    for i in range(zone_count):
+        center = random_point(rng)
+        lat_span, lon_span = degree_span(center[0], rng.uniform(0.5, 2.0))
+        outline = [(center[0] + lat_span * math.sin(angle), center[1] + lon_span * math.cos(angle))
+                   for angle in (2 * math.pi * k / 24 for k in range(24))]
+        zones.append(Zone(f"z{i}", f"Zone {i}", RATE_CARD, [[outline]]))
+    index = ZoneIndex(cache_size=count)
+    index.set_zones(zones)
+
+    points = [(random_point(rng),) for _ in range(count)]
+    record_latencies(results, "zones.lookup", time_calls(index.zones_at, points))
+    record_latencies(results, "zones.lookup.cached", time_calls(index.zones_at, points))
+
+def bench_memory(results: Results, seed: int, count: int = 10000) -> None:
+    """Measure traced bytes per rider, per available driver and per finished ride"""
+    user_manager, ride_manager = fresh_managers()
+
+    def measure(build: Callable[[], Any]) -> float:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del kept
+        return (after - before) / count
+
+    record(results, "memory.rider", measure(lambda: generate_riders(user_manager, count, seed)), "bytes")
+
+    def drivers_in_pool():
+        drivers = generate_drivers(user_manager, count, seed)
+        for driver in drivers:
+            ride_manager.register_driver(driver)
+        return drivers
+    record(results, "memory.driver", measure(drivers_in_pool), "bytes")
+
+    # Rides are measured against an empty pool so matching scans stay out of the trace
+    user_manager, ride_manager = fresh_managers()
+    riders = generate_riders(user_manager, count, seed)
+    trips = generate_trips(count, seed)
+
+    def finished_rides():
+        with redirect_stdout(io.StringIO()):
+            for rider, (pickup, dropoff, vehicle_type) in zip(riders, trips):
+                ride = ride_manager.request_ride(rider, pickup, dropoff, vehicle_type)
+                ride_manager.cancel_ride(ride.id)
+    record(results, "memory.ride", measure(finished_rides), "bytes")
+
+@contextmanager
+def quiet_file_descriptor(fd: int):
+    """Point a file descriptor at /dev/null, including for processes started meanwhile"""
+    saved = os.dup(fd)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), fd)
+    try:
+        yield
+    finally:
+        os.dup2(saved, fd)
+        os.close(saved)
+
+def bench_sharding(results: Results, seed: int, shard_counts: List[int], drivers: int = 10000,
+                   lifecycles: int = 2000, clients: int = 16) -> None:
+    """Measure lifecycles per second through a ShardRouter at each shard count.
+
+    The city is split into equal longitude bands and the same clients,
+    fleet and trips run against every shard count, so the speedup over one
+    shard shows how far throughput scales with processes. It cannot scale
+    past the number of CPUs, which the report records.
+    """
+    _, lon_span = degree_span(CITY_CENTER[0], CITY_RADIUS_KM)
+    rng = random.Random(seed)
+    fleet = []
+    for i in range(drivers):
+        vehicle_type = random_vehicle_type(rng)
+        fleet.append((f"Driver {i}", f"555-{i:07d}", f"VEH{i:07d}", "Synthetic", vehicle_type.value,
+                      VEHICLE_CAPACITY[vehicle_type], random_point(rng)))
+    trips = generate_trips(lifecycles, seed)
+
+    def lifecycle(router: ShardRouter, rider_id: str, trip) -> None:
+        pickup, dropoff, vehicle_type = trip
+        ride = router.request_ride(rider_id, pickup, dropoff, vehicle_type.value)
+        if ride["driver_id"] is None:
+            router.cancel_ride(ride["id"])
+            return
+        router.start_ride(ride["id"])
+        router.pickup_rider(ride["id"])
+        router.complete_ride(ride["id"])
+
+    baseline = None
+    # Shards print every transition from their own processes
+    with quiet_file_descriptor(sys.stdout.fileno()):
+        for shard_count in shard_counts:
+            shard_map = GeoShardMap.even(shard_count, CITY_CENTER[1] - lon_span, CITY_CENTER[1] + lon_span)
+            with ShardRouter(shard_map) as router, ThreadPoolExecutor(clients) as pool:
+                for driver in fleet:
+                    router.register_driver(*driver)
+                riders = [router.register_rider(f"Rider {i}", f"556-{i:07d}", CITY_CENTER) for i in range(clients)]
+
+                started = time.perf_counter()
+                list(pool.map(lambda i: lifecycle(router, riders[i % clients], trips[i]), range(lifecycles)))
+                elapsed = time.perf_counter() - started
+
+            throughput = lifecycles / elapsed
+            baseline = baseline or throughput
+            record(results, f"sharding.lifecycle.shards={shard_count}", throughput, "rides/s", higher_is_better=True)
+            record(results, f"sharding.speedup.shards={shard_count}", throughput / baseline, "x",
+                   higher_is_better=True)
+
+def run(sizes: List[int], seed: int, storages: List[str] = STORAGES,
+        shard_counts: List[int] = DEFAULT_SHARD_COUNTS) -> Dict[str, Any]:
+    results: Results = {}
+    for size in sizes:
+        print(f"Benchmarking {size} drivers...", file=sys.stderr)
+        bench_find(results, size, seed)
+        for storage in storages:
+            bench_lifecycle(results, size, seed, storage)
+    bench_offers(results, seed)
+    bench_estimate(results, seed)
+    bench_import(results, seed)
+    bench_zones(results, seed)
+    bench_memory(results, seed)
+    bench_sharding(results, seed, shard_counts)
+    fresh_managers()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": seed,
+            "sizes": sizes,
+            "storages": storages,
+            "shard_counts": shard_counts
+        },
+        "results": results
+    }
+
+def compare(current: Results, baseline: Results, threshold: float) -> List[str]:
+    """Print a comparison against a baseline and return the regressed metrics"""
+    regressions = []
+    print(f"{'metric':<45} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, metric in current.items():
+        if name not in baseline or not baseline[name]["value"]:
+            continue
+        before, after = baseline[name]["value"], metric["value"]
+        change = (after - before) / before
+        worse = -change if metric["higher_is_better"] else change
+        flag = ""
+        if worse > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<45} {before:>12.2f} {after:>12.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Ride-sharing platform benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Fleet sizes to benchmark")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the synthetic city")
+    parser.add_argument("--storage", nargs="+", choices=STORAGES, default=STORAGES,
+                        help="Storage modes to measure lifecycle throughput in")
+    parser.add_argument("--shards", type=int, nargs="+", default=DEFAULT_SHARD_COUNTS,
+                        help="Shard counts to measure sharded lifecycle throughput at")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results")
+    parser.add_argument("--baseline", help="Results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on any regression")
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.seed, args.storage, args.shards)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline["results"], args.threshold)
+        if regressions and args.fail_on_regression:
+            return 1
+    else:
+        for name, metric in report["results"].items():
+            print(f"{name:<45} {metric['value']:>12.2f} {metric['unit']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+from typing import Dict, List, Optional, Set, Tuple
+import heapq
+
+from models.offer import Offer, OfferStatus
+from models.user import Driver
+
+class OfferBook:
+    """Offers of rides to drivers: open ones by ride and by driver, and their deadlines.
+
+    A driver holds at most one open offer and is reserved for it, out of the
+    available pool, until they answer or it expires. The book only keeps
+    records; RideManager decides what happens next under its lock.
+    """
+
+    def __init__(self):
+        self._offers: Dict[str, Offer] = {}
+        self._by_ride: Dict[str, List[Offer]] = {}
+        self._reserved: Dict[str, Tuple[Offer, Driver]] = {}  # Driver ID -> their open offer
+        self._deadlines: List[Tuple[float, str]] = []  # (expires_at, offer ID) heap; answered offers are skipped
+        self._first_sent: Dict[str, float] = {}  # Ride ID -> when its first offer went out
+
+    def __len__(self) -> int:
+        return len(self._offers)
+
+    def get(self, offer_id: str) -> Optional[Offer]:
+        return self._offers.get(offer_id)
+
+    def add(self, offer: Offer, driver: Driver) -> None:
+        self._offers[offer.id] = offer
+        self._by_ride.setdefault(offer.ride_id, []).append(offer)
+        self._reserved[driver.id] = (offer, driver)
+        self._first_sent.setdefault(offer.ride_id, offer.created_at)
+        heapq.heappush(self._deadlines, (offer.expires_at, offer.id))
+
+    def close(self, offer: Offer, status: OfferStatus, timestamp: float) -> Driver:
+        """Answer an open offer and hand back the driver it reserved"""
+        offer.close(status, timestamp)
+        return self._reserved.pop(offer.driver_id)[1]
+
+    def is_reserved(self, driver_id: str) -> bool:
+        return driver_id in self._reserved
+
+    def open_for_driver(self, driver_id: str) -> Optional[Offer]:
+        reservation = self._reserved.get(driver_id)
+        return reservation[0] if reservation else None
+
+    def for_ride(self, ride_id: str) -> List[Offer]:
+        return list(self._by_ride.get(ride_id, ()))
+
+    def open_for_ride(self, ride_id: str) -> List[Offer]:
+        return [offer for offer in self._by_ride.get(ride_id, ()) if offer.is_open]
+
+    def offered_drivers(self, ride_id: str) -> Set[str]:
+        """IDs of every driver already offered a ride, whatever they answered"""
+        return {offer.driver_id for offer in self._by_ride.get(ride_id, ())}
+
+    def waves(self, ride_id: str) -> int:
+        offers = self._by_ride.get(ride_id)
+        return offers[-1].wave if offers else 0
+
+    def first_sent(self, ride_id: str) -> Optional[float]:
+        return self._first_sent.get(ride_id)
+
+    def due(self, now: float) -> List[Offer]:
+        """Open offers whose deadline has passed, earliest first"""
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, offer_id = heapq.heappop(self._deadlines)
+            offer = self._offers.get(offer_id)
+            if offer is not None and offer.is_open:
+                expired.append(offer)
+        return expired
+
+    def forget_ride(self, ride_id: str) -> None:
+        """Drop the offers of a finished ride; any still open must be closed first"""
+        for offer in self._by_ride.pop(ride_id, ()):
+            self._offers.pop(offer.id, None)
+        self._first_sent.pop(ride_id, None)
@@ -1,10 +1,35 @@
-from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import threading
+import time
+from models import ids
+from models.offer import Offer, OfferStatus
 from models.ride import Ride, RideStatus
+from models.stats import fleet_stats
 from models.user import Driver, Rider
 from strategies.driver_matching import DriverMatchingStrategy, NearestDriverStrategy
-from strategies.pricing import PricingStrategy, BasePricingStrategy
+from strategies.pricing import PricingStrategy, ZonePricingStrategy
 from observers.notification import RiderNotificationObserver, DriverNotificationObserver, SystemLogObserver
+from observers.change_log import change_log
 from factories.ride_factory import RideFactory
+from managers.offer_book import OfferBook
+from spatial.driver_index import DriverSpatialIndex
+from spatial.ride_index import ActiveRideIndex
+from spatial.zones import zone_index
+from monitoring.metrics import registry, ACCEPT_BUCKETS, CANDIDATE_BUCKETS
+from monitoring.profiler import span
+from routing.eta import eta_service
+from storage.repository import Repository, TERMINAL_STATUSES, ride_record
+
+MATCH_DURATION = registry.histogram(
+    "ride_matching_duration_seconds", "Time spent finding a driver for a ride", ["strategy"])
+MATCH_CANDIDATES = registry.histogram(
+    "ride_matching_candidates_scanned", "Drivers looked at per match", ["strategy"], CANDIDATE_BUCKETS)
+OFFERS = registry.counter(
+    "ride_offers_total", "Ride offers sent to drivers, by how they ended", ["outcome"])
+TIME_TO_ACCEPT = registry.histogram(
+    "ride_offer_time_to_accept_seconds", "Time from a ride's first offer to a driver accepting it",
+    ["dispatch"], ACCEPT_BUCKETS)
 
 class RideManager:
     """Singleton manager for handling rides in the system"""
@@ -22,18 +47,113 @@ class RideManager:
         self.rides: Dict[str, Ride] = {}  # Dictionary of all rides
         self.active_rides: Dict[str, Ride] = {}  # Dictionary of active rides
         self.available_drivers: List[Driver] = []  # List of available drivers
+        self.driver_index = DriverSpatialIndex()  # Spatial index over available_drivers
+        self.ride_index = ActiveRideIndex()  # Spatial index over active_rides
         self.driver_matching_strategy: DriverMatchingStrategy = NearestDriverStrategy()
-        self.pricing_strategy: PricingStrategy = BasePricingStrategy()
+        self.pricing_strategy: PricingStrategy = ZonePricingStrategy()
+        # Strategies a request chose for itself, by active ride ID; rides
+        # without one follow the manager's current strategies
+        self._ride_matching: Dict[str, DriverMatchingStrategy] = {}
+        self._ride_pricing: Dict[str, PricingStrategy] = {}
+        # Guards rides, the available pool and strategy changes when the API
+        # calls in from worker threads; re-entrant so callers can hold it
+        # across several calls
+        self.lock = threading.RLock()
+        # With a repository, finished rides are written out and dropped from
+        # memory; only active rides and the available pool stay resident
+        self.repository: Optional[Repository] = None
+        self._riders: Dict[str, Rider] = {}  # Live users to link rides read back from the repository
+        self._drivers: Dict[str, Driver] = {}
+        # With a fanout, rides are offered to that many drivers at once and the
+        # first to accept gets it; 0 assigns the best match without asking
+        self.offers = OfferBook()
+        self.offer_fanout = 0
+        self.offer_timeout = 15.0  # Seconds a driver has to answer
+        self._clock: Callable[[], float] = time.time
+        # Rides whose last wave found nobody to offer them to, oldest first;
+        # each offer sweep gives them another wave
+        self._waiting: Dict[str, None] = {}
+    
+    def set_repository(self, repository: Repository, riders: Dict[str, Rider],
+                       drivers: Dict[str, Driver]) -> None:
+        """Persist rides to a repository and resume the active rides it holds"""
+        with self.lock:
+            self.repository = repository
+            self._riders, self._drivers = riders, drivers
+            for ride in repository.load_active_rides(riders, drivers):
+                if ride.id in self.rides:
+                    continue
+                self._register_observers(ride)
+                self.rides[ride.id] = ride
+                self.active_rides[ride.id] = ride
+                self.ride_index.add(ride)
+                if ride.driver is not None and ride.driver in self.driver_index:
+                    self._remove_available_driver(ride.driver)
+            for ride in self.rides.values():
+                repository.save_ride(ride)
+    
+    def _persist(self, ride: Ride) -> None:
+        """Save a ride and, once it is finished, keep it on disk only"""
+        if self.repository is None:
+            return
+        self.repository.save_ride(ride)
+        if ride.status in TERMINAL_STATUSES:
+            # Completion changed both users' ride history
+            self.repository.save_rider(ride.rider)
+            if ride.driver is not None:
+                self.repository.save_driver(ride.driver)
+            self.rides.pop(ride.id, None)
+    
+    def _register_observers(self, ride: Ride) -> None:
+        """Add observers for notifications"""
+        ride.register_observer(RiderNotificationObserver())
+        ride.register_observer(DriverNotificationObserver())
+        ride.register_observer(SystemLogObserver())
+        ride.register_observer(change_log)
     
     def register_driver(self, driver: Driver) -> None:
         """Register a new driver in the system"""
-        if driver not in self.available_drivers and driver.is_available:
-            self.available_drivers.append(driver)
+        with self.lock:
+            if self._joins_pool(driver):
+                self._add_available_driver(driver)
+    
+    def register_drivers(self, drivers: List[Driver]) -> None:
+        """Register a batch of drivers, filling the pool and index under one lock"""
+        with self.lock:
+            added = {driver.id: driver for driver in drivers if self._joins_pool(driver)}
+            self._add_available_drivers(list(added.values()))
     
     def unregister_driver(self, driver: Driver) -> None:
         """Unregister a driver from the system"""
-        if driver in self.available_drivers:
-            self.available_drivers.remove(driver)
+        with self.lock:
+            if driver in self.driver_index:
+                self._remove_available_driver(driver)
+            # Going offline turns down the offer the driver was holding
+            offer = self.offers.open_for_driver(driver.id)
+            if offer is not None:
+                self._close_offer(offer, OfferStatus.DECLINED)
+                self._redispatch(offer.ride_id)
+    
+    def _joins_pool(self, driver: Driver) -> bool:
+        """Whether registering a driver puts them in the available pool"""
+        # The index mirrors the pool and answers membership in O(1); a
+        # driver holding an offer stays out of it until they answer
+        return driver.is_available and driver not in self.driver_index and not self.offers.is_reserved(driver.id)
+    
+    def _add_available_driver(self, driver: Driver) -> None:
+        """Put a driver in the available pool and its spatial index"""
+        self.available_drivers.append(driver)
+        self.driver_index.add(driver)
+    
+    def _add_available_drivers(self, drivers: List[Driver]) -> None:
+        """Put drivers in the available pool and its spatial index in bulk"""
+        self.available_drivers.extend(drivers)
+        self.driver_index.add_many(drivers)
+    
+    def _remove_available_driver(self, driver: Driver) -> None:
+        """Take a driver out of the available pool and its spatial index"""
+        self.available_drivers.remove(driver)
+        self.driver_index.remove(driver)
     
     def set_driver_matching_strategy(self, strategy: DriverMatchingStrategy) -> None:
         """Set the driver matching strategy"""
@@ -43,120 +163,347 @@ class RideManager:
         """Set the pricing strategy"""
         self.pricing_strategy = strategy
     
+    def set_offer_dispatch(self, fanout: int, timeout_seconds: float = 15.0,
+                           clock: Optional[Callable[[], float]] = None) -> None:
+        """Offer each ride to fanout drivers at once, or assign directly with 0; clock is for simulations"""
+        if fanout < 0:
+            raise ValueError("fanout must be 0 or more")
+        with self.lock:
+            self.offer_fanout = fanout
+            self.offer_timeout = timeout_seconds
+            self._clock = clock or time.time
+    
     def request_ride(self, rider: Rider, pickup_location: Tuple[float, float], 
-                    dropoff_location: Tuple[float, float], vehicle_type) -> Optional[Ride]:
-        """Request a new ride"""
-        # Create a new ride using the factory
-        ride = RideFactory.create_regular_ride(rider, pickup_location, dropoff_location, vehicle_type)
+                    dropoff_location: Tuple[float, float], vehicle_type,
+                    matching_strategy: Optional[DriverMatchingStrategy] = None,
+                    pricing_strategy: Optional[PricingStrategy] = None) -> Optional[Ride]:
+        """Request a new ride, optionally with its own matching and pricing strategies"""
+        # Raises ZoneError for a trip the service zones do not allow
+        zone_index.check_trip(pickup_location, dropoff_location)
         
-        # Add observers for notifications
-        ride.register_observer(RiderNotificationObserver())
-        ride.register_observer(DriverNotificationObserver())
-        ride.register_observer(SystemLogObserver())
-        
-        # Store the ride
-        self.rides[ride.id] = ride
-        self.active_rides[ride.id] = ride
-        
-        # Try to find a driver
-        self._assign_driver(ride)
-        
-        return ride
+        with self.lock, span("ride_manager.request_ride"):
+            # Create a new ride using the factory
+            with span("factory"):
+                ride = RideFactory.create_regular_ride(rider, pickup_location, dropoff_location, vehicle_type)
+            
+            # Add observers for notifications
+            with span("observers"):
+                self._register_observers(ride)
+            
+            # Store the ride
+            self.rides[ride.id] = ride
+            self.active_rides[ride.id] = ride
+            self.ride_index.add(ride)
+            change_log.update(ride)
+            self._set_ride_strategies(ride, matching_strategy, pricing_strategy)
+            
+            # Try to find a driver
+            with span("matching"):
+                self._assign_driver(ride)
+            
+            self._persist(ride)
+            return ride
     
     def request_carpool(self, rider: Rider, pickup_location: Tuple[float, float], 
-                       dropoff_location: Tuple[float, float], vehicle_type) -> Optional[Ride]:
-        """Request a new carpool ride"""
-        # Create a new carpool ride using the factory
-        ride = RideFactory.create_carpool_ride(rider, pickup_location, dropoff_location, vehicle_type)
-        
-        # Add observers for notifications
-        ride.register_observer(RiderNotificationObserver())
-        ride.register_observer(DriverNotificationObserver())
-        ride.register_observer(SystemLogObserver())
-        
-        # Store the ride
-        self.rides[ride.id] = ride
-        self.active_rides[ride.id] = ride
+                       dropoff_location: Tuple[float, float], vehicle_type,
+                       matching_strategy: Optional[DriverMatchingStrategy] = None,
+                       pricing_strategy: Optional[PricingStrategy] = None) -> Optional[Ride]:
+        """Request a new carpool ride, optionally with its own matching and pricing strategies"""
+        # Raises ZoneError for a trip the service zones do not allow
+        zone_index.check_trip(pickup_location, dropoff_location)
         
-        # Try to find a driver
-        self._assign_driver(ride)
-        
-        return ride
+        with self.lock, span("ride_manager.request_carpool"):
+            # Create a new carpool ride using the factory
+            with span("factory"):
+                ride = RideFactory.create_carpool_ride(rider, pickup_location, dropoff_location, vehicle_type)
+            
+            # Add observers for notifications
+            with span("observers"):
+                self._register_observers(ride)
+            
+            # Store the ride
+            self.rides[ride.id] = ride
+            self.active_rides[ride.id] = ride
+            self.ride_index.add(ride)
+            change_log.update(ride)
+            self._set_ride_strategies(ride, matching_strategy, pricing_strategy)
+            
+            # Try to find a driver
+            with span("matching"):
+                self._assign_driver(ride)
+            
+            self._persist(ride)
+            return ride
+    
+    def _set_ride_strategies(self, ride: Ride, matching_strategy: Optional[DriverMatchingStrategy],
+                             pricing_strategy: Optional[PricingStrategy]) -> None:
+        """Remember the strategies a request chose for its ride"""
+        if matching_strategy is not None:
+            self._ride_matching[ride.id] = matching_strategy
+        if pricing_strategy is not None:
+            self._ride_pricing[ride.id] = pricing_strategy
     
     def _assign_driver(self, ride: Ride) -> bool:
-        """Assign a driver to a ride using the current matching strategy"""
-        driver = self.driver_matching_strategy.find_driver(ride, self.available_drivers)
+        """Assign a driver to a ride using its matching strategy, or offer it to several"""
+        strategy = self._ride_matching.get(ride.id, self.driver_matching_strategy)
+        started = time.perf_counter()
+        if self.offer_fanout:
+            # Drivers who already had an offer for this ride may be back in
+            # the pool, so look past them
+            offered = self.offers.offered_drivers(ride.id)
+            candidates = strategy.find_drivers(ride, self.available_drivers, self.driver_index,
+                                               self.offer_fanout + len(offered))
+            drivers = [driver for driver in candidates if driver.id not in offered][:self.offer_fanout]
+        else:
+            driver = strategy.find_driver(ride, self.available_drivers, self.driver_index)
+            drivers = [driver] if driver else []
+        labels = (type(strategy).__name__,)
+        MATCH_DURATION.observe(time.perf_counter() - started, labels)
+        MATCH_CANDIDATES.observe(strategy.candidates_scanned, labels)
+        
+        if self.offer_fanout:
+            return self._send_offers(ride, drivers)
         
-        if driver:
+        if drivers:
+            driver = drivers[0]
+            ride.pickup_eta_seconds = eta_service.eta_seconds(driver.get_location(), ride.pickup_location)
             ride.assign_driver(driver)
-            self.available_drivers.remove(driver)
+            self._remove_available_driver(driver)
             return True
         
         return False
     
+    def _send_offers(self, ride: Ride, drivers: List[Driver]) -> bool:
+        """Offer a ride to drivers at once, reserving each until they answer"""
+        now = self._clock()
+        wave = self.offers.waves(ride.id) + 1
+        for driver in drivers:
+            self.offers.add(Offer(ride.id, driver.id, wave, now, now + self.offer_timeout), driver)
+            self._remove_available_driver(driver)
+            # Leaving the pool is a change for delta sync, though the driver did not change
+            change_log.record("driver", driver.id)
+            OFFERS.inc(labels=("sent",))
+        if drivers:
+            self._waiting.pop(ride.id, None)
+        else:
+            self._waiting[ride.id] = None
+        return bool(drivers)
+    
+    def _close_offer(self, offer: Offer, status: OfferStatus) -> Driver:
+        """Close an open offer and put its driver back in the pool unless they take the ride"""
+        driver = self.offers.close(offer, status, self._clock())
+        OFFERS.inc(labels=(status.value.lower(),))
+        if status != OfferStatus.ACCEPTED:
+            if driver.is_available and driver not in self.driver_index:
+                self._add_available_driver(driver)
+            change_log.record("driver", driver.id)
+        return driver
+    
+    def _redispatch(self, ride_id: str) -> None:
+        """Offer a ride to the next drivers once nobody holds an open offer for it"""
+        ride = self.active_rides.get(ride_id)
+        if ride is None or ride.status != RideStatus.REQUESTED:
+            self._waiting.pop(ride_id, None)
+            return
+        if self.offers.open_for_ride(ride_id):
+            return
+        self._assign_driver(ride)
+    
+    def accept_offer(self, offer_id: str) -> bool:
+        """Accept an offer; the first driver to accept gets the ride and the other offers are revoked"""
+        with self.lock:
+            self._expire_offers()
+            offer = self.offers.get(offer_id)
+            if offer is None or not offer.is_open:
+                return False
+            ride = self.active_rides.get(offer.ride_id)
+            if ride is None or ride.status != RideStatus.REQUESTED:
+                self._close_offer(offer, OfferStatus.REVOKED)
+                return False
+            
+            driver = self._close_offer(offer, OfferStatus.ACCEPTED)
+            for other in self.offers.open_for_ride(ride.id):
+                self._close_offer(other, OfferStatus.REVOKED)
+            dispatch = "parallel" if self.offer_fanout > 1 else "sequential"
+            TIME_TO_ACCEPT.observe(offer.answered_at - self.offers.first_sent(ride.id), (dispatch,))
+            
+            ride.pickup_eta_seconds = eta_service.eta_seconds(driver.get_location(), ride.pickup_location)
+            ride.assign_driver(driver)
+            self._persist(ride)
+            return True
+    
+    def decline_offer(self, offer_id: str) -> bool:
+        """Decline an offer; once every offer for the ride is answered, it goes to the next drivers"""
+        with self.lock:
+            self._expire_offers()
+            offer = self.offers.get(offer_id)
+            if offer is None or not offer.is_open:
+                return False
+            self._close_offer(offer, OfferStatus.DECLINED)
+            self._redispatch(offer.ride_id)
+            return True
+    
+    def expire_offers(self) -> int:
+        """Close offers past their deadline and re-offer their rides; returns how many expired.
+        
+        Rides that had nobody to offer them to get another wave as well, so
+        they reach drivers who came online since.
+        """
+        with self.lock:
+            expired = self._expire_offers()
+            for ride_id in list(self._waiting):
+                self._redispatch(ride_id)
+            return expired
+    
+    def _expire_offers(self) -> int:
+        expired = self.offers.due(self._clock())
+        for offer in expired:
+            self._close_offer(offer, OfferStatus.EXPIRED)
+        for ride_id in dict.fromkeys(offer.ride_id for offer in expired):
+            self._redispatch(ride_id)
+        return len(expired)
+    
+    def run_offer_sweeper(self, interval: float = 1.0) -> None:
+        """Expire offers every interval seconds, forever; run it on a daemon thread"""
+        while True:
+            time.sleep(interval)
+            self.expire_offers()
+    
+    def _finish_offers(self, ride: Ride) -> None:
+        """Revoke whatever is still open for a finished ride and forget its offers"""
+        for offer in self.offers.open_for_ride(ride.id):
+            self._close_offer(offer, OfferStatus.REVOKED)
+        self.offers.forget_ride(ride.id)
+        self._waiting.pop(ride.id, None)
+    
     def start_ride(self, ride_id: str) -> bool:
         """Start a ride (driver en route to pickup)"""
-        if ride_id in self.active_rides:
-            ride = self.active_rides[ride_id]
-            return ride.start_ride()
-        return False
+        with self.lock:
+            if ride_id in self.active_rides:
+                ride = self.active_rides[ride_id]
+                success = ride.start_ride()
+                if success:
+                    self._persist(ride)
+                return success
+            return False
     
     def pickup_rider(self, ride_id: str) -> bool:
         """Driver has picked up the rider"""
-        if ride_id in self.active_rides:
-            ride = self.active_rides[ride_id]
-            return ride.pickup_rider()
-        return False
+        with self.lock:
+            if ride_id in self.active_rides:
+                ride = self.active_rides[ride_id]
+                success = ride.pickup_rider()
+                if success:
+                    self._persist(ride)
+                return success
+            return False
     
     def complete_ride(self, ride_id: str) -> bool:
         """Complete a ride and calculate fare"""
-        if ride_id in self.active_rides:
-            ride = self.active_rides[ride_id]
-            
-            # Calculate fare
-            ride.fare = self.pricing_strategy.calculate_fare(ride)
-            
-            # Complete the ride
-            success = ride.complete_ride()
-            
-            if success:
-                # Add driver back to available pool
-                if ride.driver and ride.driver.is_available:
-                    self.available_drivers.append(ride.driver)
+        with self.lock:
+            if ride_id in self.active_rides:
+                ride = self.active_rides[ride_id]
+                
+                # Calculate fare; the trace already holds the distance driven
+                ride.fare = self._ride_pricing.get(ride_id, self.pricing_strategy).calculate_fare(ride)
                 
-                # Remove from active rides
-                del self.active_rides[ride_id]
+                # Complete the ride
+                success = ride.complete_ride()
+                
+                if success:
+                    fleet_stats.record_ride(ride.fare, ride.billable_distance, ride.busy_seconds)
+                    # Add driver back to available pool
+                    if ride.driver and ride.driver.is_available:
+                        self._add_available_driver(ride.driver)
+                    
+                    # Remove from active rides
+                    del self.active_rides[ride_id]
+                    self._finish_offers(ride)
+                    self._ride_matching.pop(ride_id, None)
+                    self._ride_pricing.pop(ride_id, None)
+                    self._persist(ride)
+                
+                return success
             
-            return success
-        
-        return False
+            return False
     
     def cancel_ride(self, ride_id: str) -> bool:
         """Cancel a ride"""
-        if ride_id in self.active_rides:
-            ride = self.active_rides[ride_id]
-            success = ride.cancel_ride()
-            
-            if success:
-                # Add driver back to available pool if there was one
-                if ride.driver and ride.driver.is_available:
-                    self.available_drivers.append(ride.driver)
+        with self.lock:
+            if ride_id in self.active_rides:
+                ride = self.active_rides[ride_id]
+                success = ride.cancel_ride()
+                
+                if success:
+                    # Add driver back to available pool if there was one
+                    if ride.driver and ride.driver.is_available:
+                        self._add_available_driver(ride.driver)
+                    
+                    # Remove from active rides
+                    del self.active_rides[ride_id]
+                    self._finish_offers(ride)
+                    self._ride_matching.pop(ride_id, None)
+                    self._ride_pricing.pop(ride_id, None)
+                    self._persist(ride)
                 
-                # Remove from active rides
-                del self.active_rides[ride_id]
+                return success
             
-            return success
-        
-        return False
+            return False
     
     def get_ride(self, ride_id: str) -> Optional[Ride]:
         """Get a ride by ID"""
-        return self.rides.get(ride_id)
+        ride = self.rides.get(ride_id)
+        if ride is None and self.repository is not None:
+            ride = self.repository.get_ride(ride_id, self._riders, self._drivers)
+        return ride
+    
+    def find_rides(self, rider_id: Optional[str] = None, driver_id: Optional[str] = None,
+                   status: Optional[RideStatus] = None, limit: Optional[int] = None,
+                   before: Optional[str] = None) -> List[Ride]:
+        """Get rides matching every given filter, newest first; before pages on from a ride ID"""
+        if before is not None and not ids.id_generator.sortable:
+            raise ValueError("Paging by ride ID needs time-ordered IDs")
+        if self.repository is not None:
+            rides = self.repository.find_rides(rider_id, driver_id, status, limit=limit,
+                                               riders=self._riders, drivers=self._drivers, before=before)
+            # Hand out the live object of a ride still in memory
+            with self.lock:
+                return [self.rides.get(ride.id, ride) for ride in rides]
+        
+        rides = []
+        with self.lock:
+            # Rides are kept in creation order, so a page stops as soon as it is full
+            for ride in reversed(self.rides.values()):
+                if limit is not None and len(rides) >= limit:
+                    break
+                if ((before is None or ride.id < before)
+                        and (rider_id is None or ride.rider.id == rider_id)
+                        and (driver_id is None or (ride.driver is not None and ride.driver.id == driver_id))
+                        and (status is None or ride.status == status)):
+                    rides.append(ride)
+        return rides
+    
+    def iter_ride_records(self, status: Optional[RideStatus] = None, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+        """Stream rides requested in [since, until) as export records, oldest first"""
+        if self.repository is not None:
+            return self.repository.iter_ride_records(status, since, until)
+        
+        with self.lock:
+            rides = [
+                ride for ride in self.rides.values()
+                if (status is None or ride.status == status)
+                and (since is None or ride.request_time >= since)
+                and (until is None or ride.request_time < until)
+            ]
+        return (ride_record(ride) for ride in rides)
     
     def get_active_rides(self) -> List[Ride]:
         """Get all active rides"""
-        return list(self.active_rides.values())
+        with self.lock:
+            return list(self.active_rides.values())
     
     def get_available_drivers(self) -> List[Driver]:
         """Get all available drivers"""
-        return self.available_drivers 
\ No newline at end of file
+        with self.lock:
+            return list(self.available_drivers) 
\ No newline at end of file
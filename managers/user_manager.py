@@ -1,6 +1,9 @@
 from typing import Dict, List, Optional, Tuple
 from models.user import User, Rider, Driver, Vehicle
 from models.ride import VehicleType
+from observers.change_log import change_log
+from routing.eta import eta_service
+from storage.repository import Repository
 
 class UserManager:
     """Singleton manager for handling users in the system"""
@@ -17,11 +20,39 @@ class UserManager:
         """Initialize the user manager"""
         self.riders: Dict[str, Rider] = {}  # Dictionary of all riders
         self.drivers: Dict[str, Driver] = {}  # Dictionary of all drivers
+        self.repository: Optional[Repository] = None  # Persistent copy of the users, if any
+    
+    def set_repository(self, repository: Repository) -> None:
+        """Persist users to a repository, first loading the ones it already holds"""
+        self.repository = repository
+        for rider in repository.load_riders():
+            self.riders.setdefault(rider.id, rider)
+        for driver in repository.load_drivers():
+            self.drivers.setdefault(driver.id, driver)
+        for rider in self.riders.values():
+            self._save_rider(rider)
+        for driver in self.drivers.values():
+            self._track_driver(driver)
+    
+    def _track_driver(self, driver: Driver) -> None:
+        """Log and save a driver now and again after every change"""
+        change_log.update(driver)
+        driver.register_observer(change_log)
+        if self.repository is not None:
+            self.repository.save_driver(driver)
+            driver.register_observer(self.repository)
+    
+    def _save_rider(self, rider: Rider) -> None:
+        """Log and save a rider after it is added or changed"""
+        change_log.update(rider)
+        if self.repository is not None:
+            self.repository.save_rider(rider)
     
     def register_rider(self, name: str, phone: str, default_location: Tuple[float, float] = (0.0, 0.0)) -> Rider:
         """Register a new rider in the system"""
         rider = Rider(name, phone, default_location)
         self.riders[rider.id] = rider
+        self._save_rider(rider)
         return rider
     
     def register_driver(self, name: str, phone: str, vehicle_id: str, model: str, 
@@ -31,6 +62,41 @@ class UserManager:
         vehicle = Vehicle(vehicle_id, model, vehicle_type, capacity)
         driver = Driver(name, phone, vehicle, location)
         self.drivers[driver.id] = driver
+        self._track_driver(driver)
+        return driver
+    
+    def add_rider(self, rider: Rider) -> None:
+        """Add an already constructed rider, keeping its ID"""
+        self.riders[rider.id] = rider
+        self._save_rider(rider)
+    
+    def add_driver(self, driver: Driver) -> None:
+        """Add an already constructed driver, keeping its ID"""
+        self.drivers[driver.id] = driver
+        self._track_driver(driver)
+    
+    def add_riders(self, riders: List[Rider]) -> None:
+        """Add a batch of already constructed riders, e.g. from a bulk import"""
+        for rider in riders:
+            self.riders[rider.id] = rider
+            self._save_rider(rider)
+    
+    def add_drivers(self, drivers: List[Driver]) -> None:
+        """Add a batch of already constructed drivers, e.g. from a bulk import"""
+        for driver in drivers:
+            self.drivers[driver.id] = driver
+            self._track_driver(driver)
+    
+    def remove_driver(self, driver_id: str) -> Optional[Driver]:
+        """Remove a driver from the system and return it"""
+        eta_service.forget_driver(driver_id)
+        driver = self.drivers.pop(driver_id, None)
+        if driver is not None:
+            driver.remove_observer(change_log)
+            change_log.record("driver", driver_id)
+        if driver is not None and self.repository is not None:
+            driver.remove_observer(self.repository)
+            self.repository.delete_driver(driver_id)
         return driver
     
     def get_rider(self, rider_id: str) -> Optional[Rider]:
@@ -54,6 +120,7 @@ class UserManager:
         rider = self.get_rider(rider_id)
         if rider:
             rider.update_location(location)
+            self._save_rider(rider)
             return True
         return False
     
@@ -62,5 +129,7 @@ class UserManager:
         driver = self.get_driver(driver_id)
         if driver:
             driver.update_location(location)
+            # Consecutive pings teach the ETA service how fast traffic moves
+            eta_service.record_ping(driver_id, location)
             return True
         return False 
\ No newline at end of file
@@ -0,0 +1,115 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+from uuid import uuid4
+import itertools
+import threading
+import time
+
+# IDs are 64-bit integers laid out as | milliseconds since EPOCH_MS (41) |
+# worker (10) | sequence within the millisecond (12) |, which lasts until 2089
+EPOCH_MS = 1577836800000  # 2020-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# Crockford base32: digits and capitals in ASCII order, so a fixed-width
+# string sorts exactly like the integer it encodes
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+ID_LENGTH = 13  # 65 bits
+_DIGITS = {character: value for value, character in enumerate(ALPHABET)}
+
+_versions = itertools.count(1)  # next() on a count is atomic under the GIL
+
+class IdGenerator(ABC):
+    """Source of user and ride IDs"""
+
+    sortable = False  # Whether IDs sort in creation order
+
+    @abstractmethod
+    def new_id(self) -> str:
+        pass
+
+class UuidIdGenerator(IdGenerator):
+    """Random uuid4 strings; 36 characters and no order"""
+
+    def new_id(self) -> str:
+        return str(uuid4())
+
+class SnowflakeIdGenerator(IdGenerator):
+    """Time-ordered 64-bit IDs written as 13 Crockford base32 characters.
+
+    Each generator hands out up to 4096 IDs per millisecond; give every
+    process that creates IDs for the same store its own worker_id. The
+    clock never runs backwards: after a wall-clock step back, or once a
+    millisecond's sequence is used up, IDs carry on from the last one.
+    """
+
+    sortable = True
+
+    def __init__(self, worker_id: int = 0):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker_id must be between 0 and {MAX_WORKER_ID}, got {worker_id}")
+        self.worker_id = worker_id
+        self._last_ms = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def new_int(self) -> int:
+        with self._lock:
+            now = max(int(time.time() * 1000) - EPOCH_MS, self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    now += 1  # Borrow the next millisecond
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (now << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self._sequence
+
+    def new_id(self) -> str:
+        return encode_id(self.new_int())
+
+    def first_id_at(self, timestamp: float) -> str:
+        """Smallest ID that can be generated at or after a Unix time, e.g. as a before cursor"""
+        return encode_id(max(0, int(timestamp * 1000) - EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS))
+
+def encode_id(value: int) -> str:
+    characters = []
+    for _ in range(ID_LENGTH):
+        characters.append(ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(characters))
+
+def decode_id(id_string: str) -> int:
+    value = 0
+    for character in id_string:
+        value = (value << 5) | _DIGITS[character]
+    return value
+
+def id_timestamp(id_string: str) -> Optional[float]:
+    """Unix time at which a sortable ID was generated; None for any other ID"""
+    if len(id_string) != ID_LENGTH or any(character not in _DIGITS for character in id_string):
+        return None
+    return ((decode_id(id_string) >> (WORKER_BITS + SEQUENCE_BITS)) + EPOCH_MS) / 1000
+
+def new_version() -> int:
+    """Next number of the process-wide version sequence.
+
+    Entities take a new version on every change. Drawing them all from one
+    sequence means an object rebuilt from storage never repeats a version an
+    earlier copy of it had.
+    """
+    return next(_versions)
+
+def new_id() -> str:
+    """Next ID from the process-wide generator"""
+    return id_generator.new_id()
+
+def set_id_generator(generator: IdGenerator) -> None:
+    """Replace the process-wide generator, e.g. with one carrying this process's worker ID"""
+    global id_generator
+    id_generator = generator
+
+# Process-wide generator used for every new user and ride
+id_generator: IdGenerator = SnowflakeIdGenerator()
@@ -0,0 +1,31 @@
+from enum import Enum
+from typing import Optional
+from models.ids import new_id
+
+class OfferStatus(Enum):
+    PENDING = "PENDING"
+    ACCEPTED = "ACCEPTED"
+    DECLINED = "DECLINED"
+    EXPIRED = "EXPIRED"
+    REVOKED = "REVOKED"  # Another driver accepted first, or the ride was cancelled
+
+class Offer:
+    """A ride offered to one driver, open until they answer or its deadline passes"""
+
+    def __init__(self, ride_id: str, driver_id: str, wave: int, created_at: float, expires_at: float):
+        self.id = new_id()
+        self.ride_id = ride_id
+        self.driver_id = driver_id
+        self.wave = wave  # 1 for the first round of offers for the ride, 2 for the next, ...
+        self.created_at = created_at
+        self.expires_at = expires_at
+        self.status = OfferStatus.PENDING
+        self.answered_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.status == OfferStatus.PENDING
+
+    def close(self, status: OfferStatus, timestamp: float) -> None:
+        self.status = status
+        self.answered_at = timestamp
@@ -1,9 +1,12 @@
 from enum import Enum
 from typing import Tuple, List, Optional
-from uuid import uuid4
+from models.ids import new_id, new_version
 from datetime import datetime
-from models.user import Rider, Driver
-import math
+import time
+from models.user import Rider, Driver, OBSERVER_DISPATCH
+from models.trace import TripTrace
+from routing.engine import routing_engine
+from spatial.geo import haversine_km
 
 class RideStatus(Enum):
     REQUESTED = "REQUESTED"
@@ -28,7 +31,7 @@ class Ride:
                  dropoff_location: Tuple[float, float], 
                  vehicle_type: VehicleType = VehicleType.SEDAN,
                  ride_type: RideType = RideType.REGULAR):
-        self.id = str(uuid4())
+        self.id = new_id()
         self._rider = rider
         self._driver = None
         self._pickup_location = pickup_location
@@ -37,30 +40,51 @@ class Ride:
         self._ride_type = ride_type
         self._status = RideStatus.REQUESTED
         self._request_time = datetime.now()
+        self._assigned_time = None  # When the driver was assigned; the start of their busy time
         self._start_time = None
         self._end_time = None
         self._fare = 0.0
         self._distance = self._calculate_distance(pickup_location, dropoff_location)
+        self._pickup_eta_seconds = None  # Driver's estimated time to the pickup when assigned
+        self._trace: Optional[TripTrace] = None  # Driver's locations from pickup on
+        self.version = new_version()  # Renewed by every change, so cached views know when they are stale
         self._observers = []
     
+    @classmethod
+    def restore(cls, ride_id: str, rider: Rider, driver: Optional[Driver],
+                pickup_location: Tuple[float, float], dropoff_location: Tuple[float, float],
+                vehicle_type: VehicleType, ride_type: RideType, status: "RideStatus",
+                request_time: datetime, start_time: Optional[datetime], end_time: Optional[datetime],
+                fare: float, distance: float, pickup_eta_seconds: Optional[float] = None,
+                trace: Optional[TripTrace] = None, assigned_time: Optional[datetime] = None) -> "Ride":
+        """Rebuild a stored ride as it was, without routing it again or notifying anyone"""
+        ride = cls.__new__(cls)
+        ride.id = ride_id
+        ride._rider = rider
+        ride._driver = driver
+        ride._pickup_location = pickup_location
+        ride._dropoff_location = dropoff_location
+        ride._vehicle_type = vehicle_type
+        ride._ride_type = ride_type
+        ride._status = status
+        ride._request_time = request_time
+        ride._assigned_time = assigned_time
+        ride._start_time = start_time
+        ride._end_time = end_time
+        ride._fare = fare
+        ride._distance = distance
+        ride._pickup_eta_seconds = pickup_eta_seconds
+        ride._trace = trace
+        ride.version = new_version()
+        ride._observers = []
+        # A trip still under way keeps tracing its driver
+        if trace is not None and driver is not None and status == RideStatus.RIDE_IN_PROGRESS:
+            driver.register_observer(trace)
+        return ride
+    
     def _calculate_distance(self, point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
-        """Calculate distance in kilometers between two points using the Haversine formula"""
-        # Unpack the coordinates
-        lat1, lon1 = point1
-        lat2, lon2 = point2
-        
-        # Convert latitude and longitude from degrees to radians
-        lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-        
-        # Haversine formula
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        
-        # Radius of Earth in kilometers
-        r = 6371.0
-        return c * r
+        """Calculate distance in kilometers between two points by road, or by the Haversine formula without a road graph"""
+        return routing_engine.distance_km(point1, point2)
     
     def assign_driver(self, driver: Driver) -> bool:
         if self._status != RideStatus.REQUESTED:
@@ -68,6 +92,7 @@ class Ride:
         
         self._driver = driver
         self._status = RideStatus.DRIVER_ASSIGNED
+        self._assigned_time = datetime.now()
         driver.set_availability(False)
         self._notify_observers()
         return True
@@ -86,6 +111,10 @@ class Ride:
         
         self._status = RideStatus.RIDE_IN_PROGRESS
         self._start_time = datetime.now()
+        # Trace the trip from the pickup through the driver's location updates
+        self._trace = TripTrace(self._pickup_location)
+        if self._driver:
+            self._driver.register_observer(self._trace)
         self._notify_observers()
         return True
     
@@ -95,9 +124,16 @@ class Ride:
         
         self._status = RideStatus.COMPLETED
         self._end_time = datetime.now()
+        # The trip ends at the dropoff whether or not the driver reported it
+        if self._trace.point_count > 1:
+            self._trace.append(self._dropoff_location)
         if self._driver:
-            self._driver.set_availability(True)
+            self._driver.remove_observer(self._trace)
+            # Record the ride before freeing the driver, so the driver's
+            # observers see the history and totals that go with the change
             self._driver.ride_history.append(self.id)
+            self._driver.stats.record_ride(self._fare, self.billable_distance, self.busy_seconds)
+            self._driver.set_availability(True)
         
         self._rider.ride_history.append(self.id)
         self._notify_observers()
@@ -109,6 +145,7 @@ class Ride:
         
         self._status = RideStatus.CANCELLED
         if self._driver:
+            self._driver.remove_observer(self._trace)
             self._driver.set_availability(True)
         
         self._notify_observers()
@@ -122,8 +159,11 @@ class Ride:
             self._observers.remove(observer)
     
     def _notify_observers(self):
+        self.version = new_version()
+        started = time.perf_counter()
         for observer in self._observers:
             observer.update(self)
+        OBSERVER_DISPATCH.observe(time.perf_counter() - started, ("ride",))
             
     # Properties to access private attributes
     @property
@@ -158,6 +198,10 @@ class Ride:
     def request_time(self):
         return self._request_time
     
+    @property
+    def assigned_time(self):
+        return self._assigned_time
+    
     @property
     def start_time(self):
         return self._start_time
@@ -173,11 +217,39 @@ class Ride:
     @fare.setter
     def fare(self, value):
         self._fare = value
+        self.version = new_version()
     
     @property
     def distance(self):
         return self._distance
     
+    @property
+    def trace(self):
+        return self._trace
+    
+    @property
+    def billable_distance(self):
+        """Distance driven according to the trace, or the planned distance if nothing was traced"""
+        if self._trace is not None and self._trace.point_count > 1:
+            # The last update may come before the dropoff; bill the rest of the way
+            return self._trace.distance_km + haversine_km(self._trace.last_location, self._dropoff_location)
+        return self._distance
+    
+    @property
+    def busy_seconds(self):
+        """Time the driver has spent on this ride, from assignment to completion or now"""
+        started = self._assigned_time or self._start_time or self._request_time
+        return ((self._end_time or datetime.now()) - started).total_seconds()
+    
+    @property
+    def pickup_eta_seconds(self):
+        return self._pickup_eta_seconds
+    
+    @pickup_eta_seconds.setter
+    def pickup_eta_seconds(self, value):
+        self._pickup_eta_seconds = value
+        self.version = new_version()
+    
     @property
     def observers(self):
         return self._observers 
\ No newline at end of file
@@ -0,0 +1,128 @@
+from array import array
+from typing import Any, Dict, Optional, Sequence
+import math
+import threading
+import time
+
+class DriverStats:
+    """Running totals of completed rides and ratings, for a driver or the whole fleet"""
+
+    def __init__(self):
+        self.ride_count = 0
+        self.earnings = 0.0
+        self.distance_km = 0.0
+        self.busy_seconds = 0.0  # From being assigned a ride to completing it
+        self.rating_count = 0
+        self.rating_sum = 0.0
+
+    def record_ride(self, fare: float, distance_km: float, busy_seconds: float) -> None:
+        self.ride_count += 1
+        self.earnings += fare
+        self.distance_km += distance_km
+        self.busy_seconds += busy_seconds
+
+    def record_rating(self, rating: float) -> None:
+        self.rating_count += 1
+        self.rating_sum += rating
+
+    @property
+    def average_rating(self) -> Optional[float]:
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ride_count": self.ride_count,
+            "earnings": self.earnings,
+            "distance_km": self.distance_km,
+            "busy_seconds": self.busy_seconds,
+            "rating_count": self.rating_count,
+            "rating_sum": self.rating_sum
+        }
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> "DriverStats":
+        stats = cls()
+        for name, value in values.items():
+            if hasattr(stats, name):
+                setattr(stats, name, value)
+        return stats
+
+class RollingWindow:
+    """Sums of ride figures over the last window_seconds, in a ring of time buckets.
+
+    Each bucket covers bucket_seconds. Running totals are kept for the whole
+    ring: a bucket's figures are taken off as it is reused, so reading the
+    window never adds up buckets. The window's edge moves a bucket at a time.
+    """
+
+    FIELDS = ("rides", "earnings", "distance_km", "busy_seconds")
+
+    def __init__(self, window_seconds: float, bucket_seconds: float):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self._size = max(1, math.ceil(window_seconds / bucket_seconds))
+        self._bucket_ids = array("q", [-1]) * self._size  # Bucket number held in each slot
+        self._values = [array("d", [0.0]) * self._size for _ in self.FIELDS]
+        self._totals = [0.0] * len(self.FIELDS)
+        self._current = -1  # Newest bucket number seen
+
+    def add(self, values: Sequence[float], timestamp: float) -> None:
+        bucket = int(timestamp // self.bucket_seconds)
+        self._advance(bucket)
+        if bucket <= self._current - self._size:
+            return  # Too old for the window
+        slot = bucket % self._size
+        for i, value in enumerate(values):
+            self._values[i][slot] += value
+            self._totals[i] += value
+
+    def totals(self, timestamp: float) -> Dict[str, float]:
+        self._advance(int(timestamp // self.bucket_seconds))
+        return dict(zip(self.FIELDS, self._totals))
+
+    def _advance(self, bucket: int) -> None:
+        if bucket <= self._current:
+            return
+        # Clear the slots of buckets that have slid out; at most one lap
+        for stale in range(max(self._current + 1, bucket - self._size + 1), bucket + 1):
+            slot = stale % self._size
+            if self._bucket_ids[slot] != -1:
+                for i in range(len(self.FIELDS)):
+                    self._totals[i] -= self._values[i][slot]
+                    self._values[i][slot] = 0.0
+            self._bucket_ids[slot] = stale
+        self._current = bucket
+
+class FleetStats:
+    """Fleet-wide ride figures over rolling windows plus lifetime totals"""
+
+    def __init__(self, windows: Optional[Dict[str, tuple]] = None):
+        # Window name -> (window seconds, bucket seconds)
+        windows = windows or {"5m": (300, 10), "1h": (3600, 60)}
+        self.windows = {name: RollingWindow(*spec) for name, spec in windows.items()}
+        self.lifetime = DriverStats()
+        self._lock = threading.Lock()
+
+    def record_ride(self, fare: float, distance_km: float, busy_seconds: float,
+                    timestamp: Optional[float] = None) -> None:
+        timestamp = time.time() if timestamp is None else timestamp
+        values = (1, fare, distance_km, busy_seconds)
+        with self._lock:
+            self.lifetime.record_ride(fare, distance_km, busy_seconds)
+            for window in self.windows.values():
+                window.add(values, timestamp)
+
+    def snapshot(self, driver_count: int = 0, timestamp: Optional[float] = None) -> Dict[str, Any]:
+        """Totals per window; utilization is busy time over the window times driver_count"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            windows = {}
+            for name, window in self.windows.items():
+                totals = window.totals(timestamp)
+                capacity = window.window_seconds * driver_count
+                totals["utilization"] = totals["busy_seconds"] / capacity if capacity else 0.0
+                windows[name] = totals
+            return {"lifetime": self.lifetime.to_dict(), "windows": windows}
+
+# Process-wide fleet figures, fed by RideManager as rides complete
+fleet_stats = FleetStats()
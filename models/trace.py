@@ -0,0 +1,121 @@
+from typing import Iterator, Optional, Tuple
+import threading
+import time
+from spatial.geo import haversine_km
+
+# Coordinates are stored in steps of 1e-5 degrees, about a meter
+COORDINATE_SCALE = 100000
+
+class TripTrace:
+    """Driver locations recorded during a trip, stored compactly.
+
+    Each point is stored as its change from the previous one: whole seconds,
+    then latitude and longitude in 1e-5 degree steps, each zigzag- and
+    varint-encoded. A ping a few hundred meters on takes about 6 bytes
+    instead of three boxed floats. The distance driven is added up as points
+    arrive, so reading it never walks the buffer.
+    """
+
+    def __init__(self, start: Tuple[float, float], timestamp: Optional[float] = None):
+        self.started_at = time.time() if timestamp is None else timestamp
+        self.distance_km = 0.0
+        self.point_count = 0
+        self._buffer = bytearray()
+        self._last_encoded = (0, 0, 0)  # (seconds, latitude steps, longitude steps)
+        self._last_location: Optional[Tuple[float, float]] = None
+        self._lock = threading.Lock()
+        self.append(start, self.started_at)
+
+    @classmethod
+    def restore(cls, started_at: float, data: bytes, distance_km: float) -> "TripTrace":
+        """Rebuild a trace from its stored buffer; further points append to it"""
+        trace = cls.__new__(cls)
+        trace.started_at = started_at
+        trace.distance_km = distance_km
+        trace.point_count = 0
+        trace._buffer = bytearray(data)
+        trace._last_encoded = (0, 0, 0)
+        trace._last_location = None
+        trace._lock = threading.Lock()
+        for timestamp, location in trace.points():
+            trace.point_count += 1
+            trace._last_location = location
+        if trace._last_location is not None:
+            trace._last_encoded = (round(timestamp - started_at), round(location[0] * COORDINATE_SCALE),
+                                   round(location[1] * COORDINATE_SCALE))
+        return trace
+
+    def to_bytes(self) -> bytes:
+        with self._lock:
+            return bytes(self._buffer)
+
+    def append(self, location: Tuple[float, float], timestamp: Optional[float] = None) -> bool:
+        """Record a location; False if the driver has not moved since the last one"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            if location == self._last_location:
+                return False
+
+            encoded = (round(timestamp - self.started_at), round(location[0] * COORDINATE_SCALE),
+                       round(location[1] * COORDINATE_SCALE))
+            for value, last in zip(encoded, self._last_encoded):
+                _write_varint(self._buffer, _zigzag(value - last))
+
+            if self._last_location is not None:
+                self.distance_km += haversine_km(self._last_location, location)
+            self._last_encoded = encoded
+            self._last_location = location
+            self.point_count += 1
+            return True
+
+    @property
+    def last_location(self) -> Optional[Tuple[float, float]]:
+        return self._last_location
+
+    def update(self, driver) -> None:
+        """Observer hook: record the driver's location after it changes"""
+        self.append(driver.get_location())
+
+    def points(self) -> Iterator[Tuple[float, Tuple[float, float]]]:
+        """Decode the trace as (timestamp, (latitude, longitude)) pairs, oldest first"""
+        with self._lock:
+            buffer = bytes(self._buffer)
+        position = 0
+        seconds = latitude = longitude = 0
+        while position < len(buffer):
+            delta, position = _read_varint(buffer, position)
+            seconds += _unzigzag(delta)
+            delta, position = _read_varint(buffer, position)
+            latitude += _unzigzag(delta)
+            delta, position = _read_varint(buffer, position)
+            longitude += _unzigzag(delta)
+            yield (self.started_at + seconds,
+                   (latitude / COORDINATE_SCALE, longitude / COORDINATE_SCALE))
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._buffer)
+
+def _zigzag(value: int) -> int:
+    # Interleave signs so small negative deltas stay small: 0, -1, 1, -2 -> 0, 1, 2, 3
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+def _write_varint(buffer: bytearray, value: int) -> None:
+    # Seven bits per byte, low bits first; the high bit marks a continuation
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+def _read_varint(buffer: bytes, position: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
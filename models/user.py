@@ -1,13 +1,22 @@
 from abc import ABC
 from typing import Tuple, List, Optional
-from uuid import uuid4
+from models.ids import new_id, new_version
+import time
+from models.stats import DriverStats
+from monitoring.metrics import registry
 
 # this contain User class , Vehicle 
 # and there are two type of user rider and driver
 
+OBSERVER_DISPATCH = registry.histogram(
+    "observer_dispatch_seconds", "Time spent notifying the observers of a subject", ["subject"])
+
+# Rating of a driver who has not been rated yet
+DEFAULT_RATING = 4.5
+
 class User(ABC):
     def __init__(self, name: str, phone: str):
-        self.id = str(uuid4())  # Keep public as it's needed for identification
+        self.id = new_id()  # Keep public as it's needed for identification
         self._name = name
         self._phone = phone
         
@@ -69,25 +78,48 @@ class Driver(User):
         self.vehicle = vehicle  # Keep public as it's a complex object often accessed directly
         self._current_location = location
         self._is_available = True
-        self._rating = 4.5  # Default rating
+        self._rating = DEFAULT_RATING
         self._ride_history = []
+        self.stats = DriverStats()  # Running totals, so figures never walk the ride history
+        self.version = new_version()  # Renewed by every change, so cached views know when they are stale
+        self._observers = []
     
     def update_location(self, location: Tuple[float, float]):
         self._current_location = location
+        self._notify_observers()
     
     def get_location(self) -> Tuple[float, float]:
         return self._current_location
     
     def set_availability(self, is_available: bool):
         self._is_available = is_available
+        self._notify_observers()
     
     def update_rating(self, new_rating: float):
-        # Simple average rating calculation
-        total_rides = len(self._ride_history)
-        if total_rides == 0:
-            self._rating = new_rating
-        else:
-            self._rating = (self._rating * total_rides + new_rating) / (total_rides + 1)
+        # Average of every rating received; the first replaces the default,
+        # but a rating set directly, e.g. by an import, counts as one rating
+        if self.stats.rating_count == 0 and self._rating != DEFAULT_RATING:
+            self.stats.record_rating(self._rating)
+        self.stats.record_rating(new_rating)
+        self._rating = self.stats.average_rating
+        self._notify_observers()
+    
+    def register_observer(self, observer):
+        if observer not in self._observers:
+            self._observers.append(observer)
+    
+    def remove_observer(self, observer):
+        if observer in self._observers:
+            self._observers.remove(observer)
+    
+    def _notify_observers(self):
+        self.version = new_version()
+        if not self._observers:
+            return
+        started = time.perf_counter()
+        for observer in self._observers:
+            observer.update(self)
+        OBSERVER_DISPATCH.observe(time.perf_counter() - started, ("driver",))
             
     @property
     def current_location(self):
@@ -104,6 +136,7 @@ class Driver(User):
     @rating.setter
     def rating(self, value):
         self._rating = value
+        self._notify_observers()
         
     @property
     def ride_history(self):
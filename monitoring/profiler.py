@@ -0,0 +1,187 @@
+"""Opt-in tracing spans and a sampling profiler writing collapsed-stack files.
+
+Hot paths wrap their phases in ``with span("name"):``. Unless a profiling
+window is open or the current request is being traced, span() returns a
+shared no-op object, so the disabled cost is one context variable read.
+
+Output files use the collapsed-stack format ("outer;inner weight" per line)
+read by flamegraph.pl, speedscope and most other flame graph viewers. Span
+files weigh each stack by its self time in microseconds; sample files by
+the number of samples that caught a thread in it.
+"""
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+import itertools
+import os
+import sys
+import threading
+import time
+
+class SpanRecorder:
+    """Folds finished spans into collapsed stacks weighted by self time"""
+
+    def __init__(self):
+        self.folded: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stack: str, micros: int) -> None:
+        with self._lock:
+            self.folded[stack] = self.folded.get(stack, 0) + micros
+
+    def write(self, path: str) -> str:
+        return write_folded(path, self.folded, self._lock)
+
+# Recorder of the request being traced, if any; copied into worker threads
+# along with the rest of the request's context
+_request_recorder: ContextVar[Optional[SpanRecorder]] = ContextVar("profiler_request_recorder", default=None)
+# Innermost open span of the current context
+_open_span: ContextVar[Optional["_Span"]] = ContextVar("profiler_open_span", default=None)
+
+class _Span:
+    __slots__ = ("name", "recorder", "stack", "started", "child_time", "parent", "token")
+
+    def __init__(self, name: str, recorder: SpanRecorder):
+        self.name = name
+        self.recorder = recorder
+
+    def __enter__(self) -> "_Span":
+        self.parent = _open_span.get()
+        self.stack = f"{self.parent.stack};{self.name}" if self.parent else self.name
+        self.child_time = 0.0
+        self.token = _open_span.set(self)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        elapsed = time.perf_counter() - self.started
+        _open_span.reset(self.token)
+        if self.parent is not None:
+            self.parent.child_time += elapsed
+        self.recorder.add(self.stack, int((elapsed - self.child_time) * 1000000))
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+_NO_SPAN = _NoSpan()
+
+class Profiler:
+    """Time-boxed profiling windows and per-request traces.
+
+    A window records every span in the process and samples the stacks of all
+    threads every interval; a trace records only the spans of one request.
+    """
+
+    def __init__(self, output_dir: str = "profiles"):
+        self.output_dir = output_dir
+        self.window_recorder: Optional[SpanRecorder] = None  # Set while a window is open
+        self._window_until = 0.0
+        self._files: deque = deque(maxlen=100)  # Most recent output files
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._trace_ids = itertools.count(1)
+
+    def span(self, name: str):
+        """Context manager timing a named phase when profiling is on"""
+        recorder = _request_recorder.get() or self.window_recorder
+        if recorder is None:
+            return _NO_SPAN
+        return _Span(name, recorder)
+
+    @property
+    def running(self) -> bool:
+        return self._sampler is not None and self._sampler.is_alive()
+
+    def start(self, seconds: float, interval: float = 0.005) -> bool:
+        """Open a profiling window for seconds; False if one is already open"""
+        with self._lock:
+            if self.running:
+                return False
+            self._stop.clear()
+            self.window_recorder = SpanRecorder()
+            self._window_until = time.monotonic() + seconds
+            self._sampler = threading.Thread(target=self._sample, args=(interval,),
+                                             name="profiler", daemon=True)
+            self._sampler.start()
+            return True
+
+    def stop(self) -> None:
+        """Close the open window early; its files are still written"""
+        sampler = self._sampler
+        if sampler is not None:
+            self._stop.set()
+            sampler.join()
+
+    def status(self) -> Dict[str, object]:
+        return {
+            "running": self.running,
+            "seconds_left": max(0.0, self._window_until - time.monotonic()) if self.running else 0.0,
+            "files": list(self._files)
+        }
+
+    def begin_trace(self) -> "RequestTrace":
+        """Start tracing the spans of the current context, usually one request"""
+        return RequestTrace(self, next(self._trace_ids))
+
+    def _sample(self, interval: float) -> None:
+        folded: Dict[str, int] = {}
+        me = threading.get_ident()
+        while time.monotonic() < self._window_until and not self._stop.wait(interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+                stack = ";".join(reversed(frames))
+                folded[stack] = folded.get(stack, 0) + 1
+
+        recorder, self.window_recorder = self.window_recorder, None
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self._files.append(write_folded(os.path.join(self.output_dir, f"samples-{stamp}.folded"), folded))
+        self._files.append(recorder.write(os.path.join(self.output_dir, f"spans-{stamp}.folded")))
+
+class RequestTrace:
+    """Span recording for one request, written to its own file when finished"""
+
+    def __init__(self, profiler: Profiler, trace_id: int):
+        self.recorder = SpanRecorder()
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(profiler.output_dir, f"trace-{stamp}-{trace_id}.folded")
+        self._profiler = profiler
+        self._token = _request_recorder.set(self.recorder)
+
+    def finish(self) -> str:
+        _request_recorder.reset(self._token)
+        self._profiler._files.append(self.recorder.write(self.path))
+        return self.path
+
+def write_folded(path: str, folded: Dict[str, int], lock: Optional[threading.Lock] = None) -> str:
+    """Write collapsed stacks, heaviest first"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if lock is not None:
+        with lock:
+            folded = dict(folded)
+    with open(path, "w") as f:
+        for stack, weight in sorted(folded.items(), key=lambda item: -item[1]):
+            f.write(f"{stack} {weight}\n")
+    return path
+
+# Process-wide profiler; the API points output_dir at PROFILE_OUTPUT_DIR
+profiler = Profiler()
+
+def span(name: str):
+    """Time a named phase with the process-wide profiler"""
+    return profiler.span(name)
@@ -0,0 +1,62 @@
+from typing import List, Optional, Tuple
+import threading
+
+# Changes remembered; a client further behind than this must refetch in full
+CHANGE_LOG_SIZE = 100000
+
+class ChangeLog:
+    """Bounded record of which riders, drivers and rides changed, in order.
+
+    Every change takes the next number of one global sequence, and the last
+    `capacity` of them are kept in a ring indexed by sequence number. A
+    client that remembers the sequence of its last fetch asks for what
+    changed after it and gets each entity ID once, at a cost proportional to
+    the number of changes rather than to the number of entities.
+    """
+
+    def __init__(self, capacity: int = CHANGE_LOG_SIZE):
+        self.capacity = capacity
+        self._sequence = 0
+        self._kinds: List[Optional[str]] = [None] * capacity
+        self._ids: List[Optional[str]] = [None] * capacity
+        self._lock = threading.Lock()
+
+    @property
+    def sequence(self) -> int:
+        """Number of the latest change; 0 before any"""
+        return self._sequence
+
+    def record(self, kind: str, entity_id: str) -> int:
+        with self._lock:
+            self._sequence += 1
+            slot = self._sequence % self.capacity
+            self._kinds[slot] = kind
+            self._ids[slot] = entity_id
+            return self._sequence
+
+    def update(self, subject) -> None:
+        """Observer hook: log a change to a ride, driver or rider"""
+        self.record(type(subject).__name__.lower(), subject.id)
+
+    def changed_since(self, since: int, kind: str) -> Optional[Tuple[int, List[str]]]:
+        """(latest sequence, IDs of the kind changed after since), or None if the log no longer reaches back that far"""
+        # Only the slots are copied under the lock; recorders never wait on
+        # the filtering, which may cover the whole ring
+        with self._lock:
+            latest = self._sequence
+            if since > latest or since < latest - self.capacity:
+                # A sequence from a restarted server, or changes already overwritten
+                return None
+            start, count = (since + 1) % self.capacity, latest - since
+            end = start + count
+            if end <= self.capacity:
+                kinds, ids = self._kinds[start:end], self._ids[start:end]
+            else:
+                end -= self.capacity
+                kinds = self._kinds[start:] + self._kinds[:end]
+                ids = self._ids[start:] + self._ids[:end]
+        changed = dict.fromkeys(entity_id for entity_kind, entity_id in zip(kinds, ids) if entity_kind == kind)
+        return latest, list(changed)
+
+# Process-wide change log behind the ?since= delta mode of the list endpoints
+change_log = ChangeLog()
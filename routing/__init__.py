@@ -0,0 +1 @@
+# Routing package
\ No newline at end of file
@@ -0,0 +1,227 @@
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+import heapq
+import math
+import threading
+
+from routing.graph import RoadGraph
+from spatial.geo import haversine_km
+
+INFINITY = math.inf
+
+class LandmarkIndex:
+    """ALT (A*, landmarks, triangle inequality) lower bounds for a road graph.
+
+    For each landmark L the shortest distances from L and to L are stored for
+    every node. By the triangle inequality d(v, t) >= d(L, t) - d(L, v) and
+    d(v, t) >= d(v, L) - d(t, L), which gives A* a heuristic far tighter
+    than straight-line distance on a real street grid.
+    """
+
+    def __init__(self, graph: RoadGraph, landmark_count: int = 8):
+        self.graph = graph
+        self.landmarks: List[int] = []
+        self.from_landmark: List[array] = []
+        self.to_landmark: List[array] = []
+        if graph.node_count == 0:
+            return
+
+        # Farthest-point selection: each new landmark is the node farthest
+        # from the ones already chosen, which spreads them around the edge
+        closest = array("d", [INFINITY]) * graph.node_count
+        candidate = 0
+        for _ in range(min(landmark_count, graph.node_count)):
+            self.landmarks.append(candidate)
+            forward = dijkstra(graph.offsets, graph.targets, graph.weights, candidate)
+            self.from_landmark.append(forward)
+            self.to_landmark.append(dijkstra(graph.reverse_offsets, graph.reverse_targets,
+                                             graph.reverse_weights, candidate))
+            best, candidate = -1.0, None
+            for node in range(graph.node_count):
+                if forward[node] < closest[node]:
+                    closest[node] = forward[node]
+                if closest[node] != INFINITY and closest[node] > best and node not in self.landmarks:
+                    best, candidate = closest[node], node
+            if candidate is None:
+                break
+
+    def lower_bound(self, node: int, target: int) -> float:
+        bound = 0.0
+        for from_l, to_l in zip(self.from_landmark, self.to_landmark):
+            forward = from_l[target] - from_l[node]
+            backward = to_l[node] - to_l[target]
+            # Terms with an unreachable side say nothing; skip them
+            if forward > bound and forward != INFINITY and from_l[node] != INFINITY:
+                bound = forward
+            if backward > bound and backward != INFINITY and to_l[target] != INFINITY:
+                bound = backward
+        return bound
+
+class RoutingEngine:
+    """Road distances between locations, falling back to straight lines.
+
+    Locations are snapped to their nearest graph node; the straight-line
+    snapping legs are added to the road distance between the nodes. With no
+    graph loaded, or for a location off the network or a pair the network
+    does not connect, the haversine distance is used instead.
+    """
+
+    def __init__(self, max_snap_km: float = 2.0, landmark_count: int = 8):
+        self.max_snap_km = max_snap_km
+        self.landmark_count = landmark_count
+        self.graph: Optional[RoadGraph] = None
+        self.landmarks: Optional[LandmarkIndex] = None
+        self._lock = threading.Lock()  # Guards graph switches and fallbacks
+        self.fallbacks = 0  # Queries answered with haversine while a graph was loaded
+
+    @property
+    def loaded(self) -> bool:
+        return self.graph is not None
+
+    def load(self, path: str) -> None:
+        """Load a graph file and precompute its landmarks"""
+        self.set_graph(RoadGraph.load(path))
+
+    def set_graph(self, graph: Optional[RoadGraph]) -> None:
+        """Switch to a new graph, or back to straight lines with None"""
+        landmarks = LandmarkIndex(graph, self.landmark_count) if graph is not None else None
+        with self._lock:
+            self.graph, self.landmarks = graph, landmarks
+
+    def distance_km(self, origin: Tuple[float, float], destination: Tuple[float, float]) -> float:
+        """Road distance from origin to destination in km"""
+        graph, landmarks = self.graph, self.landmarks
+        if graph is None:
+            return haversine_km(origin, destination)
+
+        start = graph.nearest_node(origin, self.max_snap_km)
+        end = graph.nearest_node(destination, self.max_snap_km)
+        if start is None or end is None:
+            return self._fallback(origin, destination)
+
+        road = self._astar(graph, landmarks, start[0], end[0])
+        if road == INFINITY:
+            return self._fallback(origin, destination)
+        return start[1] + road + end[1]
+
+    def distances_to(self, sources: Sequence[Tuple[float, float]], destination: Tuple[float, float],
+                     max_km: float = INFINITY) -> List[float]:
+        """Road distance from each source to one destination, e.g. drivers to a pickup.
+
+        One backward Dijkstra from the destination settles every source node,
+        which is far cheaper than a point-to-point query per source. Sources
+        further than max_km by road come back as infinity. A source the
+        network does not connect to the destination gets the straight-line
+        distance, as distance_km gives it.
+        """
+        graph, landmarks = self.graph, self.landmarks
+        if graph is None:
+            return [_within(haversine_km(source, destination), max_km) for source in sources]
+
+        end = graph.nearest_node(destination, self.max_snap_km)
+        if end is None:
+            self._count_fallbacks(len(sources))
+            return [_within(haversine_km(source, destination), max_km) for source in sources]
+
+        # The graph raises every edge to at least the straight line between
+        # its ends, and snapping legs are straight lines, so no route is
+        # shorter than the straight line: sources already out of range as the
+        # crow flies are not routed at all
+        straight = [haversine_km(source, destination) for source in sources]
+        snapped = [graph.nearest_node(source, self.max_snap_km) if crow <= max_km else None
+                   for source, crow in zip(sources, straight)]
+        wanted = {node_and_leg[0] for node_and_leg in snapped if node_and_leg is not None}
+        road = dijkstra(graph.reverse_offsets, graph.reverse_targets, graph.reverse_weights,
+                        end[0], stop_at=wanted, max_distance=max_km)
+
+        distances = []
+        for source, crow, node_and_leg in zip(sources, straight, snapped):
+            if crow > max_km:
+                distance = INFINITY
+            elif node_and_leg is None:
+                distance = self._fallback(source, destination)
+            elif road[node_and_leg[0]] != INFINITY:
+                distance = node_and_leg[1] + road[node_and_leg[0]] + end[1]
+            elif max_km != INFINITY and self._connected(graph, landmarks, node_and_leg[0], end[0]):
+                # Reachable, just further than max_km by road
+                distance = INFINITY
+            else:
+                distance = self._fallback(source, destination)
+            distances.append(_within(distance, max_km))
+        return distances
+
+    def _fallback(self, origin: Tuple[float, float], destination: Tuple[float, float]) -> float:
+        self._count_fallbacks(1)
+        return haversine_km(origin, destination)
+
+    def _count_fallbacks(self, count: int) -> None:
+        with self._lock:
+            self.fallbacks += count
+
+    @classmethod
+    def _connected(cls, graph: RoadGraph, landmarks: LandmarkIndex, start: int, end: int) -> bool:
+        """Whether the network has any route from start to end"""
+        # A landmark that start reaches and that reaches end proves a route
+        # without a search; only pairs no landmark links are searched
+        for from_l, to_l in zip(landmarks.from_landmark, landmarks.to_landmark):
+            if to_l[start] != INFINITY and from_l[end] != INFINITY:
+                return True
+        return cls._astar(graph, landmarks, start, end) != INFINITY
+
+    @staticmethod
+    def _astar(graph: RoadGraph, landmarks: LandmarkIndex, start: int, end: int) -> float:
+        if start == end:
+            return 0.0
+        offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+        bound = landmarks.lower_bound
+        best: Dict[int, float] = {start: 0.0}
+        heap = [(bound(start, end), 0.0, start)]
+        settled = set()
+        while heap:
+            _, distance, node = heapq.heappop(heap)
+            if node == end:
+                return distance
+            if node in settled:
+                continue
+            settled.add(node)
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbour = targets[edge]
+                candidate = distance + weights[edge]
+                if candidate < best.get(neighbour, INFINITY):
+                    best[neighbour] = candidate
+                    heapq.heappush(heap, (candidate + bound(neighbour, end), candidate, neighbour))
+        return INFINITY
+
+def dijkstra(offsets: array, targets: array, weights: array, source: int,
+             stop_at: Optional[set] = None, max_distance: float = INFINITY) -> array:
+    """Shortest distances from source over a CSR graph, infinity where unreached.
+
+    Stops early once every node in stop_at is settled or the search passes max_distance.
+    """
+    distances = array("d", [INFINITY]) * (len(offsets) - 1)
+    distances[source] = 0.0
+    remaining = set(stop_at) if stop_at is not None else None
+    heap = [(0.0, source)]
+    while heap:
+        distance, node = heapq.heappop(heap)
+        if distance > distances[node]:
+            continue
+        if distance > max_distance:
+            break
+        if remaining is not None:
+            remaining.discard(node)
+            if not remaining:
+                break
+        for edge in range(offsets[node], offsets[node + 1]):
+            neighbour = targets[edge]
+            candidate = distance + weights[edge]
+            if candidate < distances[neighbour]:
+                distances[neighbour] = candidate
+                heapq.heappush(heap, (candidate, neighbour))
+    return distances
+
+def _within(distance: float, max_km: float) -> float:
+    return distance if distance <= max_km else INFINITY
+
+# Process-wide engine used for ride distances and matching
+routing_engine = RoutingEngine()
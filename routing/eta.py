@@ -0,0 +1,135 @@
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+import math
+import threading
+import time
+
+from routing.engine import RoutingEngine, routing_engine
+from spatial.geo import haversine_km
+
+HOURS_PER_DAY = 24
+
+class SpeedGrid:
+    """Average driving speed per grid cell and hour of day.
+
+    Each cell keeps 24 running averages, so a lookup is two dictionary/array
+    reads. A cell-hour with too few samples falls back to the city-wide
+    average for that hour, then to default_speed_kmh.
+    """
+
+    def __init__(self, cell_size: float = 0.01, default_speed_kmh: float = 25.0,
+                 smoothing: float = 0.05, min_samples: int = 3):
+        self.cell_size = cell_size
+        self.default_speed_kmh = default_speed_kmh
+        self.smoothing = smoothing  # Weight of a new sample once a cell-hour has 1/smoothing of them
+        self.min_samples = min_samples
+        # No cell average can exceed the fastest sample, so ETAs never beat
+        # distance / fastest_kmh; matching uses that to stop searching early
+        self.fastest_kmh = default_speed_kmh
+        # Cell -> (speed per hour in km/h, samples per hour); None is the whole city
+        self._cells: Dict[Optional[Tuple[int, int]], Tuple[array, array]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, location: Tuple[float, float], hour: int, speed_kmh: float) -> None:
+        """Fold one observed speed into the location's cell and the city average"""
+        with self._lock:
+            self.fastest_kmh = max(self.fastest_kmh, speed_kmh)
+            for key in (self.cell_for(location), None):
+                speeds, counts = self._cells.get(key) or self._new_cell(key)
+                counts[hour] += 1
+                # Plain mean at first, then an exponential moving average that
+                # follows changes in traffic
+                weight = max(self.smoothing, 1.0 / counts[hour])
+                speeds[hour] += weight * (speed_kmh - speeds[hour])
+
+    def speed_kmh(self, location: Tuple[float, float], hour: int) -> float:
+        for key in (self.cell_for(location), None):
+            cell = self._cells.get(key)
+            if cell is not None and cell[1][hour] >= self.min_samples:
+                return cell[0][hour]
+        return self.default_speed_kmh
+
+    def cell_for(self, location: Tuple[float, float]) -> Tuple[int, int]:
+        return (math.floor(location[0] / self.cell_size), math.floor(location[1] / self.cell_size))
+
+    def _new_cell(self, key: Optional[Tuple[int, int]]) -> Tuple[array, array]:
+        cell = self._cells[key] = (array("d", [0.0]) * HOURS_PER_DAY, array("i", [0]) * HOURS_PER_DAY)
+        return cell
+
+class EtaService:
+    """Travel time estimates from road distance and the learned speed grid.
+
+    A trip is taken to cover its first half at the speed of the origin's
+    cell and its second half at the speed of the destination's, so a
+    one-to-many query costs one distances_to() call plus two grid reads per
+    source instead of a timed route per source.
+    """
+
+    def __init__(self, grid: Optional[SpeedGrid] = None, engine: Optional[RoutingEngine] = None,
+                 min_ping_seconds: float = 5.0, max_ping_seconds: float = 600.0,
+                 min_move_km: float = 0.02, max_speed_kmh: float = 150.0):
+        self.grid = grid or SpeedGrid()
+        self.engine = engine or routing_engine
+        self.min_ping_seconds = min_ping_seconds
+        self.max_ping_seconds = max_ping_seconds
+        self.min_move_km = min_move_km  # Smaller moves are GPS jitter of a parked car
+        self.max_speed_kmh = max_speed_kmh
+        self._last_ping: Dict[str, Tuple[Tuple[float, float], float]] = {}
+        self._lock = threading.Lock()
+
+    def record_ping(self, driver_id: str, location: Tuple[float, float],
+                    timestamp: Optional[float] = None) -> Optional[float]:
+        """Learn from a driver's location ping; returns the speed recorded, if any"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            previous = self._last_ping.get(driver_id)
+            self._last_ping[driver_id] = (location, timestamp)
+        if previous is None:
+            return None
+
+        elapsed = timestamp - previous[1]
+        if not self.min_ping_seconds <= elapsed <= self.max_ping_seconds:
+            return None
+        moved = haversine_km(previous[0], location)
+        speed = moved / elapsed * 3600
+        if moved < self.min_move_km or speed > self.max_speed_kmh:
+            return None
+
+        midpoint = ((previous[0][0] + location[0]) / 2, (previous[0][1] + location[1]) / 2)
+        self.grid.record(midpoint, _hour_of(timestamp), speed)
+        return speed
+
+    def forget_driver(self, driver_id: str) -> None:
+        with self._lock:
+            self._last_ping.pop(driver_id, None)
+
+    def eta_seconds(self, origin: Tuple[float, float], destination: Tuple[float, float],
+                    timestamp: Optional[float] = None) -> float:
+        """Estimated driving time from origin to destination in seconds"""
+        distance = self.engine.distance_km(origin, destination)
+        return self._travel_seconds(distance, origin, destination, _hour_of(timestamp))
+
+    def etas_to(self, sources: Sequence[Tuple[float, float]], destination: Tuple[float, float],
+                max_km: float = math.inf, timestamp: Optional[float] = None) -> List[float]:
+        """Estimated driving time from each source to one destination, e.g. drivers to a pickup.
+
+        Sources further than max_km by road come back as infinity.
+        """
+        hour = _hour_of(timestamp)
+        distances = self.engine.distances_to(sources, destination, max_km)
+        return [self._travel_seconds(distance, source, destination, hour)
+                for source, distance in zip(sources, distances)]
+
+    def _travel_seconds(self, distance: float, origin: Tuple[float, float],
+                        destination: Tuple[float, float], hour: int) -> float:
+        if distance == math.inf:
+            return math.inf
+        half = distance / 2
+        hours = half / self.grid.speed_kmh(origin, hour) + half / self.grid.speed_kmh(destination, hour)
+        return hours * 3600
+
+def _hour_of(timestamp: Optional[float]) -> int:
+    return time.localtime(timestamp).tm_hour
+
+# Process-wide ETA service; learns from the driver location pings the API receives
+eta_service = EtaService()
@@ -0,0 +1 @@
+# Sharding package
\ No newline at end of file
@@ -0,0 +1,267 @@
+from typing import Any, Dict, List, Optional, Tuple
+import multiprocessing
+import threading
+
+from models.ids import new_id
+from sharding.shard_map import GeoShardMap
+from sharding.worker import serve
+from strategies.driver_matching import max_match_distance
+
+class ShardError(Exception):
+    """Raised when a shard fails to execute a command"""
+
+    def __init__(self, message: str, reason: str = ""):
+        super().__init__(message)
+        self.reason = reason  # The shard's exception message, without its traceback
+
+class _ShardClient:
+    """Connection to one shard process; one command in flight at a time"""
+
+    def __init__(self, context, index: int, road_graph_path: Optional[str], zones_path: Optional[str]):
+        self.index = index
+        self._connection, child = context.Pipe()
+        # Worker 0 is the router itself, which names riders and drivers
+        self._process = context.Process(target=serve, args=(child, index + 1, road_graph_path, zones_path),
+                                        name=f"shard-{index}", daemon=True)
+        self._process.start()
+        child.close()
+        self._lock = threading.Lock()
+
+    def call(self, command: str, *args) -> Any:
+        with self._lock:
+            self._connection.send((command, args))
+            status, result = self._connection.recv()
+        if status != "ok":
+            reason, trace = result
+            raise ShardError(f"Shard {self.index} failed on {command}:\n{trace}", reason)
+        return result
+
+    def stop(self) -> None:
+        if self._process.is_alive():
+            self.call("stop")
+        self._process.join()
+
+class ShardRouter:
+    """Routes rider, driver and ride operations to geo-partitioned shard processes.
+
+    Every shard is a separate process with its own RideManager and
+    UserManager. Drivers live in the shard that owns their location and rides
+    in the shard that owns their pickup. A pickup within matching range of
+    another shard also asks that shard for its best driver; if that driver
+    wins it is handed over to the pickup's shard before the ride is matched.
+
+    Calls block until the shard answers and may come from several threads
+    at once; each shard runs one command at a time, so shards work in
+    parallel while calls to one shard queue up. The HTTP API serves its
+    core routes through a router when SHARD_COUNT is set.
+    """
+
+    def __init__(self, shard_map: GeoShardMap, start_method: str = "spawn",
+                 road_graph_path: Optional[str] = None, zones_path: Optional[str] = None):
+        self.shard_map = shard_map
+        context = multiprocessing.get_context(start_method)
+        self._shards = [_ShardClient(context, i, road_graph_path, zones_path)
+                        for i in range(shard_map.shard_count)]
+        # Directories of which shard holds what; riders are copied to every
+        # shard they request rides in, so only their profile is kept here
+        self._riders: Dict[str, Tuple[str, str, Tuple[float, float]]] = {}
+        self._rider_shards: Dict[str, set] = {}
+        self._rider_locations: Dict[str, Tuple[float, float]] = {}
+        self._driver_shard: Dict[str, int] = {}
+        self._ride_shard: Dict[str, int] = {}
+        self._directory_lock = threading.Lock()
+        self.handoffs = 0
+
+    def __enter__(self) -> "ShardRouter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stop every shard process"""
+        for shard in self._shards:
+            shard.stop()
+
+    def register_rider(self, name: str, phone: str,
+                       default_location: Tuple[float, float] = (0.0, 0.0)) -> str:
+        """Register a rider and return its ID"""
+        rider_id = new_id()
+        with self._directory_lock:
+            self._riders[rider_id] = (name, phone, default_location)
+            self._rider_shards[rider_id] = set()
+            self._rider_locations[rider_id] = default_location
+        return rider_id
+
+    def get_rider(self, rider_id: str) -> Optional[Dict[str, Any]]:
+        """Get a rider's profile with the rides of every shard they rode in"""
+        if rider_id not in self._riders:
+            return None
+        name, phone, default_location = self._riders[rider_id]
+        ride_history = []
+        for shard in sorted(self._rider_shards[rider_id]):
+            ride_history.extend(self._shards[shard].call("get_rider", rider_id)["ride_history"])
+        return {
+            "id": rider_id, "name": name, "phone": phone, "default_location": default_location,
+            "current_location": self._rider_locations[rider_id], "ride_history": ride_history
+        }
+
+    def update_rider_location(self, rider_id: str, location: Tuple[float, float]) -> bool:
+        """Update a rider's location here and in every shard holding a copy"""
+        if rider_id not in self._riders:
+            return False
+        with self._directory_lock:
+            self._rider_locations[rider_id] = location
+            shards = sorted(self._rider_shards[rider_id])
+        for shard in shards:
+            self._shards[shard].call("update_rider_location", rider_id, location)
+        return True
+
+    def register_driver(self, name: str, phone: str, vehicle_id: str, model: str,
+                        vehicle_type: str, capacity: int,
+                        location: Tuple[float, float] = (0.0, 0.0)) -> str:
+        """Register a driver in the shard owning its location and return its ID"""
+        state = {
+            "id": new_id(), "name": name, "phone": phone,
+            "vehicle_id": vehicle_id, "model": model, "vehicle_type": vehicle_type,
+            "capacity": capacity, "location": location, "rating": 4.5,
+            "is_available": True, "ride_history": []
+        }
+        shard = self.shard_map.shard_for(location)
+        self._shards[shard].call("add_driver", state)
+        with self._directory_lock:
+            self._driver_shard[state["id"]] = shard
+        return state["id"]
+
+    def get_driver(self, driver_id: str) -> Optional[Dict[str, Any]]:
+        """Get the state of a driver from their shard"""
+        shard = self._driver_shard.get(driver_id)
+        if shard is None:
+            return None
+        return self._shards[shard].call("get_driver", driver_id)
+
+    def update_driver_location(self, driver_id: str, location: Tuple[float, float]) -> bool:
+        """Update a driver's location, moving idle drivers to the shard that now owns it"""
+        shard = self._driver_shard.get(driver_id)
+        if shard is None:
+            return False
+
+        self._shards[shard].call("update_driver_location", driver_id, location)
+        target = self.shard_map.shard_for(location)
+        if target != shard:
+            self._move_driver(driver_id, shard, target)
+        return True
+
+    def set_driver_availability(self, driver_id: str, is_available: bool) -> bool:
+        """Take a driver in or out of their shard's available pool"""
+        shard = self._driver_shard.get(driver_id)
+        if shard is None:
+            return False
+        return self._shards[shard].call("set_driver_availability", driver_id, is_available)
+
+    def request_ride(self, rider_id: str, pickup_location: Tuple[float, float],
+                     dropoff_location: Tuple[float, float], vehicle_type: str = "SEDAN",
+                     ride_type: str = "REGULAR", strategy: str = "NEAREST", pricing: str = "BASE",
+                     surge_multiplier: Optional[float] = None,
+                     discount_percentage: Optional[float] = None) -> Dict[str, Any]:
+        """Request a ride in the shard owning the pickup and return a snapshot of it"""
+        if rider_id not in self._riders:
+            raise KeyError(f"Unknown rider {rider_id}")
+
+        shards = self.shard_map.shards_near(pickup_location, max_match_distance(vehicle_type))
+        owner = shards[0]
+        self._ensure_rider(rider_id, owner)
+        handoff = None
+        if len(shards) > 1:
+            handoff = self._pull_best_driver(shards, pickup_location, vehicle_type, strategy)
+
+        # A handed over driver rides along with the request, so the owner
+        # adopts and matches them in one command and no other request on
+        # that shard can take them in between
+        ride = self._shards[owner].call("request_ride", rider_id, pickup_location, dropoff_location,
+                                        vehicle_type, ride_type, strategy, handoff,
+                                        (pricing, surge_multiplier, discount_percentage))
+        with self._directory_lock:
+            self._ride_shard[ride["id"]] = owner
+        return ride
+
+    def start_ride(self, ride_id: str) -> bool:
+        return self.transition("start_ride", ride_id)[0]
+
+    def pickup_rider(self, ride_id: str) -> bool:
+        return self.transition("pickup_rider", ride_id)[0]
+
+    def complete_ride(self, ride_id: str) -> bool:
+        return self.transition("complete_ride", ride_id)[0]
+
+    def cancel_ride(self, ride_id: str) -> bool:
+        return self.transition("cancel_ride", ride_id)[0]
+
+    def transition(self, operation: str, ride_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Apply a RideManager transition such as start_ride and snapshot the ride after it"""
+        shard = self._ride_shard.get(ride_id)
+        if shard is None:
+            return False, None
+        return self._shards[shard].call("transition", operation, ride_id)
+
+    def get_ride(self, ride_id: str) -> Optional[Dict[str, Any]]:
+        """Get a snapshot of a ride from its shard"""
+        shard = self._ride_shard.get(ride_id)
+        if shard is None:
+            return None
+        return self._shards[shard].call("get_ride", ride_id)
+
+    def stats(self) -> List[Dict[str, int]]:
+        """Get entity counts per shard"""
+        return [shard.call("stats") for shard in self._shards]
+
+    def _ensure_rider(self, rider_id: str, shard: int) -> None:
+        with self._directory_lock:
+            if shard in self._rider_shards[rider_id]:
+                return
+        # Only recorded once the shard has the rider, so a failed copy is
+        # retried by the next request; add_rider ignores a second copy
+        self._shards[shard].call("add_rider", rider_id, *self._riders[rider_id])
+        with self._directory_lock:
+            self._rider_shards[rider_id].add(shard)
+
+    def _pull_best_driver(self, shards: List[int], pickup_location: Tuple[float, float],
+                          vehicle_type: str, strategy: str) -> Optional[Dict[str, Any]]:
+        """Release the best driver across the nearby shards if another shard than the pickup's holds them.
+
+        Returns the released driver's state for the pickup's shard to adopt.
+        A candidate taken by its own shard before the release is simply not
+        handed over, and the ride is matched within the pickup's shard.
+        """
+        candidates = []
+        for shard in shards:
+            candidate = self._shards[shard].call("best_candidate", strategy, pickup_location, vehicle_type)
+            if candidate:
+                candidates.append((shard, candidate))
+        if not candidates:
+            return None
+
+        if strategy == "HIGHEST_RATED":
+            rank = lambda item: (-item[1]["rating"], item[1]["distance"])
+        else:
+            rank = lambda item: item[1]["distance"]
+        shard, best = min(candidates, key=rank)
+        if shard == shards[0]:
+            return None
+
+        state = self._shards[shard].call("release_driver", best["id"])
+        if state is not None:
+            with self._directory_lock:
+                self._driver_shard[best["id"]] = shards[0]
+                self.handoffs += 1
+        return state
+
+    def _move_driver(self, driver_id: str, source: int, target: int) -> None:
+        # release_driver refuses drivers on a ride; they move on a later update
+        state = self._shards[source].call("release_driver", driver_id)
+        if state is None:
+            return
+        self._shards[target].call("add_driver", state)
+        with self._directory_lock:
+            self._driver_shard[driver_id] = target
+            self.handoffs += 1
@@ -0,0 +1,36 @@
+from bisect import bisect_right
+from typing import List, Sequence, Tuple
+
+from spatial.geo import degree_span
+
+class GeoShardMap:
+    """Partitions the map into longitude bands, one shard per band.
+
+    split_longitudes are the band edges in increasing order, so N edges give
+    N + 1 shards: shard 0 is west of the first edge and shard N east of the last.
+    """
+
+    def __init__(self, split_longitudes: Sequence[float]):
+        self.split_longitudes: List[float] = sorted(split_longitudes)
+
+    @classmethod
+    def even(cls, shard_count: int, min_longitude: float, max_longitude: float) -> "GeoShardMap":
+        """Split [min_longitude, max_longitude] into shard_count equal bands"""
+        width = (max_longitude - min_longitude) / shard_count
+        return cls([min_longitude + width * i for i in range(1, shard_count)])
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.split_longitudes) + 1
+
+    def shard_for(self, location: Tuple[float, float]) -> int:
+        """Get the shard owning a location"""
+        return bisect_right(self.split_longitudes, location[1])
+
+    def shards_near(self, location: Tuple[float, float], radius_km: float) -> List[int]:
+        """Get every shard with territory within radius_km of a location, owner first"""
+        _, lon_span = degree_span(location[0], radius_km)
+        owner = self.shard_for(location)
+        first = bisect_right(self.split_longitudes, location[1] - lon_span)
+        last = bisect_right(self.split_longitudes, location[1] + lon_span)
+        return [owner] + [shard for shard in range(first, last + 1) if shard != owner]
@@ -0,0 +1,221 @@
+from typing import Any, Dict, Optional, Tuple
+import traceback
+
+from managers.ride_manager import RideManager
+from managers.user_manager import UserManager
+from models.ids import SnowflakeIdGenerator, set_id_generator
+from models.ride import Ride, RideStatus, RideType, VehicleType
+from models.stats import DriverStats
+from models.user import Driver, Rider, Vehicle
+from routing.engine import routing_engine
+from spatial.zones import zone_index
+from strategies.driver_matching import MATCHING_STRATEGIES
+from strategies.pricing import pricing_strategy_for
+
+def serve(connection, worker_id: int = 0, road_graph_path: Optional[str] = None,
+          zones_path: Optional[str] = None) -> None:
+    """Entry point of a shard process: answer commands until told to stop"""
+    # Shards create rides side by side; distinct workers keep their IDs apart
+    set_id_generator(SnowflakeIdGenerator(worker_id))
+    # A spawned process starts without the parent's road graph and zones
+    if road_graph_path:
+        routing_engine.load(road_graph_path)
+    if zones_path:
+        zone_index.load(zones_path)
+    shard = ShardWorker()
+    while True:
+        command, args = connection.recv()
+        if command == "stop":
+            connection.send(("ok", None))
+            break
+        try:
+            connection.send(("ok", shard.handle(command, args)))
+        except Exception as e:
+            connection.send(("error", (str(e), traceback.format_exc())))
+    connection.close()
+
+def driver_state(driver: Driver) -> Dict[str, Any]:
+    """Serialize a driver so another shard can adopt it"""
+    return {
+        "id": driver.id,
+        "name": driver.name,
+        "phone": driver.phone,
+        "vehicle_id": driver.vehicle.vehicle_id,
+        "model": driver.vehicle.model,
+        "vehicle_type": driver.vehicle.vehicle_type,
+        "capacity": driver.vehicle.capacity,
+        "location": driver.current_location,
+        "rating": driver.rating,
+        "is_available": driver.is_available,
+        "ride_history": list(driver.ride_history),
+        "stats": driver.stats.to_dict()
+    }
+
+def rider_state(rider: Rider) -> Dict[str, Any]:
+    """Serialize the fields of a rider the router hands back to callers"""
+    return {
+        "id": rider.id,
+        "name": rider.name,
+        "phone": rider.phone,
+        "default_location": rider.default_location,
+        "current_location": rider.current_location,
+        "ride_history": list(rider.ride_history)
+    }
+
+def ride_snapshot(ride: Ride) -> Dict[str, Any]:
+    """Serialize the fields of a ride the router hands back to callers"""
+    driver = ride.driver
+    return {
+        "id": ride.id,
+        "rider_id": ride.rider.id,
+        "driver_id": driver.id if driver else None,
+        "driver": {
+            "id": driver.id,
+            "name": driver.name,
+            "phone": driver.phone,
+            "vehicle_id": driver.vehicle.vehicle_id,
+            "vehicle_model": driver.vehicle.model,
+            "vehicle_type": driver.vehicle.vehicle_type,
+            "rating": driver.rating
+        } if driver else None,
+        "pickup_location": ride.pickup_location,
+        "dropoff_location": ride.dropoff_location,
+        "vehicle_type": ride.vehicle_type.value,
+        "ride_type": ride.ride_type.value,
+        "status": ride.status.value,
+        "request_time": ride.request_time,
+        "start_time": ride.start_time,
+        "end_time": ride.end_time,
+        "fare": ride.fare,
+        "distance": ride.distance,
+        "eta_seconds": ride.pickup_eta_seconds
+        if ride.status in (RideStatus.DRIVER_ASSIGNED, RideStatus.DRIVER_EN_ROUTE) else None,
+        "driven_distance": ride.trace.distance_km if ride.trace else None
+    }
+
+class ShardWorker:
+    """Owns the managers of one shard and applies router commands to them"""
+
+    def __init__(self):
+        # Each shard process has its own singletons
+        self.user_manager = UserManager()
+        self.ride_manager = RideManager()
+
+    def handle(self, command: str, args: Tuple) -> Any:
+        return getattr(self, f"_cmd_{command}")(*args)
+
+    def _cmd_add_rider(self, rider_id: str, name: str, phone: str, location: Tuple[float, float]) -> None:
+        if self.user_manager.get_rider(rider_id):
+            return
+        rider = Rider(name, phone, location)
+        rider.id = rider_id
+        self.user_manager.add_rider(rider)
+
+    def _cmd_add_driver(self, state: Dict[str, Any]) -> None:
+        self._adopt(state)
+
+    def _adopt(self, state: Dict[str, Any]) -> None:
+        vehicle = Vehicle(state["vehicle_id"], state["model"], state["vehicle_type"], state["capacity"])
+        driver = Driver(state["name"], state["phone"], vehicle, state["location"])
+        driver.id = state["id"]
+        driver.rating = state["rating"]
+        driver.ride_history.extend(state["ride_history"])
+        driver.stats = DriverStats.from_dict(state.get("stats", {}))
+        driver.set_availability(state["is_available"])
+        self.user_manager.add_driver(driver)
+        self.ride_manager.register_driver(driver)
+
+    def _cmd_release_driver(self, driver_id: str) -> Optional[Dict[str, Any]]:
+        """Hand a driver over to another shard; only idle drivers can move"""
+        with self.ride_manager.lock:
+            driver = self.user_manager.get_driver(driver_id)
+            # The index mirrors the available pool and answers in O(1)
+            if driver is None or driver not in self.ride_manager.driver_index:
+                return None
+            self.ride_manager.unregister_driver(driver)
+            self.user_manager.remove_driver(driver_id)
+            return driver_state(driver)
+
+    def _cmd_update_rider_location(self, rider_id: str, location: Tuple[float, float]) -> bool:
+        return self.user_manager.update_rider_location(rider_id, location)
+
+    def _cmd_get_rider(self, rider_id: str) -> Optional[Dict[str, Any]]:
+        rider = self.user_manager.get_rider(rider_id)
+        return rider_state(rider) if rider else None
+
+    def _cmd_get_driver(self, driver_id: str) -> Optional[Dict[str, Any]]:
+        driver = self.user_manager.get_driver(driver_id)
+        return driver_state(driver) if driver else None
+
+    def _cmd_update_driver_location(self, driver_id: str, location: Tuple[float, float]) -> bool:
+        return self.user_manager.update_driver_location(driver_id, location)
+
+    def _cmd_set_driver_availability(self, driver_id: str, is_available: bool) -> bool:
+        driver = self.user_manager.get_driver(driver_id)
+        if driver is None:
+            return False
+        driver.set_availability(is_available)
+        if is_available:
+            self.ride_manager.register_driver(driver)
+        else:
+            self.ride_manager.unregister_driver(driver)
+        return True
+
+    def _cmd_best_candidate(self, strategy: str, pickup_location: Tuple[float, float],
+                            vehicle_type: str) -> Optional[Dict[str, Any]]:
+        """Get the driver this shard would match to a pickup, without assigning it"""
+        probe = Ride(Rider("Probe", "0000000000"), pickup_location, pickup_location, VehicleType[vehicle_type])
+        with self.ride_manager.lock:
+            driver = MATCHING_STRATEGIES[strategy]().find_driver(
+                probe, self.ride_manager.available_drivers, self.ride_manager.driver_index)
+            if driver is None:
+                return None
+            return {
+                "id": driver.id,
+                "rating": driver.rating,
+                "distance": probe._calculate_distance(driver.get_location(), pickup_location)
+            }
+
+    def _cmd_request_ride(self, rider_id: str, pickup_location: Tuple[float, float],
+                          dropoff_location: Tuple[float, float], vehicle_type: str,
+                          ride_type: str, strategy: str, handoff: Optional[Dict[str, Any]] = None,
+                          pricing: Tuple[str, Optional[float], Optional[float]] = ("BASE", None, None)
+                          ) -> Dict[str, Any]:
+        """Request a ride, first adopting a driver another shard released for it.
+
+        Commands run one at a time, so no other request can take the handed
+        over driver between its adoption and this match. pricing is the
+        pricing strategy's API name with its surge multiplier and discount.
+        """
+        if handoff is not None:
+            self._adopt(handoff)
+        rider = self.user_manager.get_rider(rider_id)
+        matching_strategy = MATCHING_STRATEGIES[strategy]()
+        pricing_strategy = pricing_strategy_for(*pricing)
+        if RideType[ride_type] == RideType.CARPOOL:
+            ride = self.ride_manager.request_carpool(rider, pickup_location, dropoff_location,
+                                                     VehicleType[vehicle_type], matching_strategy,
+                                                     pricing_strategy)
+        else:
+            ride = self.ride_manager.request_ride(rider, pickup_location, dropoff_location,
+                                                  VehicleType[vehicle_type], matching_strategy,
+                                                  pricing_strategy)
+        return ride_snapshot(ride)
+
+    def _cmd_transition(self, operation: str, ride_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        success = getattr(self.ride_manager, operation)(ride_id)
+        ride = self.ride_manager.get_ride(ride_id)
+        return success, ride_snapshot(ride) if ride else None
+
+    def _cmd_get_ride(self, ride_id: str) -> Optional[Dict[str, Any]]:
+        ride = self.ride_manager.get_ride(ride_id)
+        return ride_snapshot(ride) if ride else None
+
+    def _cmd_stats(self) -> Dict[str, int]:
+        return {
+            "riders": len(self.user_manager.riders),
+            "drivers": len(self.user_manager.drivers),
+            "available_drivers": len(self.ride_manager.available_drivers),
+            "rides": len(self.ride_manager.rides),
+            "active_rides": len(self.ride_manager.active_rides)
+        }
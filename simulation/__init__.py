@@ -0,0 +1 @@
+# Simulation package
\ No newline at end of file
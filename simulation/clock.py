@@ -0,0 +1,38 @@
+from typing import Any, Callable, List, Tuple
+import heapq
+
+class EventClock:
+    """Virtual clock driven by a priority queue of timestamped events.
+
+    Time only moves when the next event is popped, so an idle hour costs
+    nothing and a busy one costs exactly its events. Events scheduled for the
+    same instant run in the order they were scheduled.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+        self.events_processed = 0
+        self._queue: List[Tuple[float, int, Callable, tuple]] = []
+        self._sequence = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def schedule(self, delay: float, handler: Callable[..., Any], *args) -> None:
+        """Run handler(*args) delay seconds from now"""
+        self.schedule_at(self.now + max(0.0, delay), handler, *args)
+
+    def schedule_at(self, when: float, handler: Callable[..., Any], *args) -> None:
+        """Run handler(*args) at an absolute virtual time"""
+        heapq.heappush(self._queue, (when, self._sequence, handler, args))
+        self._sequence += 1
+
+    def run(self, until: float) -> None:
+        """Process events in time order up to and including until"""
+        queue = self._queue
+        while queue and queue[0][0] <= until:
+            when, _, handler, args = heapq.heappop(queue)
+            self.now = when
+            handler(*args)
+            self.events_processed += 1
+        self.now = max(self.now, until)
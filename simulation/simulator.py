@@ -0,0 +1,232 @@
+"""Discrete-event city simulator driving RideManager in virtual time.
+
+Usage:
+    python -m simulation.simulator                          # one simulated day
+    python -m simulation.simulator --hours 1000 --drivers 300 --demand 200
+    python -m simulation.simulator --strategy HIGHEST_RATED --output report.json
+
+Riders request rides as a Poisson process whose rate follows a time-of-day
+profile, idle drivers wander around the city, and every trip moves through
+request -> start -> pickup -> complete on the real managers. Travel times come
+from distances and a log-normally jittered speed, so nothing ever sleeps.
+"""
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Optional, Sequence
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from benchmarks.city import (CITY_CENTER, CITY_RADIUS_KM, generate_drivers, generate_riders,
+                             random_point, random_vehicle_type)
+from benchmarks.suite import fresh_managers
+from models.ride import Ride
+from models.user import Driver
+from simulation.clock import EventClock
+from spatial.geo import degree_span, haversine_km
+from strategies.driver_matching import MATCHING_STRATEGIES
+
+# Demand multiplier per hour of the day: quiet nights, morning and evening peaks
+DEFAULT_DEMAND_PROFILE = [
+    0.3, 0.2, 0.15, 0.15, 0.2, 0.4, 0.8, 1.5, 1.9, 1.4, 1.0, 1.0,
+    1.1, 1.0, 0.9, 1.0, 1.3, 1.8, 2.0, 1.6, 1.2, 1.0, 0.8, 0.5
+]
+
+class SimulationConfig:
+    """Fleet, demand and movement parameters of a simulation run"""
+
+    def __init__(self, drivers: int = 200, riders: int = 1000, hours: float = 24.0,
+                 demand_per_hour: float = 120.0, demand_profile: Optional[Sequence[float]] = None,
+                 speed_kmh: float = 25.0, speed_sigma: float = 0.25, boarding_minutes: float = 2.0,
+                 wander_minutes: float = 20.0, wander_km: float = 0.5,
+                 strategy: str = "NEAREST", seed: int = 42):
+        self.drivers = drivers
+        self.riders = riders
+        self.hours = hours
+        self.demand_per_hour = demand_per_hour  # Mean requests per hour before the profile
+        self.demand_profile = list(demand_profile or DEFAULT_DEMAND_PROFILE)
+        self.speed_kmh = speed_kmh  # Median driving speed
+        self.speed_sigma = speed_sigma  # Log-normal spread of the speed of each leg
+        self.boarding_minutes = boarding_minutes  # Wait between arriving and the rider getting in
+        self.wander_minutes = wander_minutes  # Mean time between moves of an idle driver
+        self.wander_km = wander_km  # Standard deviation of one move
+        self.strategy = strategy
+        self.seed = seed
+
+class CitySimulator:
+    """Runs a synthetic city against fresh RideManager and UserManager singletons"""
+
+    def __init__(self, config: SimulationConfig):
+        if config.strategy not in MATCHING_STRATEGIES:
+            raise ValueError(f"Unknown matching strategy {config.strategy}")
+
+        self.config = config
+        self.clock = EventClock()
+        self.rng = random.Random(config.seed)
+        self.user_manager, self.ride_manager = fresh_managers()
+        self.ride_manager.set_driver_matching_strategy(MATCHING_STRATEGIES[config.strategy]())
+
+        self.drivers = generate_drivers(self.user_manager, config.drivers, config.seed)
+        for driver in self.drivers:
+            self.ride_manager.register_driver(driver)
+        self.riders = generate_riders(self.user_manager, config.riders, config.seed)
+
+        hourly = [config.demand_per_hour * share / 3600 for share in config.demand_profile]
+        self._rates = hourly  # Requests per second for each hour of the day
+        self._max_rate = max(hourly)
+
+        self.requests = 0
+        self.matched = 0
+        self.completed = 0
+        self.revenue = 0.0
+        self.manager_ops = 0
+        self.pickup_distances: List[float] = []
+        self._busy_seconds = 0.0
+        self._in_flight: Dict[str, float] = {}  # Ride ID -> virtual time its driver was matched
+
+    def run(self) -> Dict[str, Any]:
+        """Simulate config.hours of city time and return the report"""
+        duration = self.config.hours * 3600
+        if self._max_rate > 0:
+            self.clock.schedule(self.rng.expovariate(self._max_rate), self._on_arrival)
+        for driver in self.drivers:
+            self.clock.schedule(self._wander_delay(), self._on_wander, driver)
+
+        # Ride observers print every transition; nobody is reading them here
+        with open(os.devnull, "w") as sink, redirect_stdout(sink):
+            started = time.perf_counter()
+            self.clock.run(duration)
+            wall_seconds = time.perf_counter() - started
+
+        busy = self._busy_seconds + sum(duration - matched_at for matched_at in self._in_flight.values())
+        return self._report(duration, wall_seconds, busy)
+
+    def _on_arrival(self) -> None:
+        # Non-homogeneous Poisson arrivals by thinning: draw at the peak rate
+        # and keep each candidate with probability rate(now) / peak
+        self.clock.schedule(self.rng.expovariate(self._max_rate), self._on_arrival)
+        hour = int(self.clock.now // 3600) % len(self._rates)
+        if self.rng.random() * self._max_rate < self._rates[hour]:
+            self._request_ride()
+
+    def _request_ride(self) -> None:
+        rng = self.rng
+        rider = rng.choice(self.riders)
+        pickup, dropoff = random_point(rng), random_point(rng)
+        ride = self.ride_manager.request_ride(rider, pickup, dropoff, random_vehicle_type(rng))
+        self.requests += 1
+        self.manager_ops += 1
+
+        if ride.driver is None:
+            # Riders do not wait for a driver to free up
+            self.ride_manager.cancel_ride(ride.id)
+            self.manager_ops += 1
+            self._forget(ride)
+            return
+
+        pickup_km = haversine_km(ride.driver.get_location(), pickup)
+        self.pickup_distances.append(pickup_km)
+        self.matched += 1
+        self._in_flight[ride.id] = self.clock.now
+
+        self.ride_manager.start_ride(ride.id)
+        self.manager_ops += 1
+        delay = self._travel_seconds(pickup_km) + self.config.boarding_minutes * 60
+        self.clock.schedule(delay, self._on_pickup, ride)
+
+    def _on_pickup(self, ride: Ride) -> None:
+        ride.driver.update_location(ride.pickup_location)
+        self.ride_manager.pickup_rider(ride.id)
+        self.manager_ops += 1
+        self.clock.schedule(self._travel_seconds(ride.distance), self._on_dropoff, ride)
+
+    def _on_dropoff(self, ride: Ride) -> None:
+        ride.driver.update_location(ride.dropoff_location)
+        self.ride_manager.complete_ride(ride.id)
+        self.manager_ops += 1
+
+        self.completed += 1
+        self.revenue += ride.fare
+        self._busy_seconds += self.clock.now - self._in_flight.pop(ride.id)
+        self._forget(ride)
+
+    def _on_wander(self, driver: Driver) -> None:
+        self.clock.schedule(self._wander_delay(), self._on_wander, driver)
+        if driver not in self.ride_manager.driver_index:
+            return
+
+        latitude, longitude = driver.get_location()
+        lat_span, lon_span = degree_span(latitude, self.config.wander_km)
+        location = (latitude + self.rng.gauss(0.0, lat_span), longitude + self.rng.gauss(0.0, lon_span))
+        # Drivers heading out of town turn back towards the centre instead
+        if haversine_km(location, CITY_CENTER) > CITY_RADIUS_KM:
+            location = ((latitude + CITY_CENTER[0]) / 2, (longitude + CITY_CENTER[1]) / 2)
+        self.user_manager.update_driver_location(driver.id, location)
+        self.manager_ops += 1
+
+    def _travel_seconds(self, distance_km: float) -> float:
+        speed = self.config.speed_kmh * self.rng.lognormvariate(0.0, self.config.speed_sigma)
+        return distance_km / speed * 3600
+
+    def _wander_delay(self) -> float:
+        return self.rng.expovariate(1 / (self.config.wander_minutes * 60))
+
+    def _forget(self, ride: Ride) -> None:
+        """Drop a finished ride so memory stays flat over long runs"""
+        self.ride_manager.rides.pop(ride.id, None)
+        ride.rider.ride_history.clear()
+        if ride.driver:
+            ride.driver.ride_history.clear()
+
+    def _report(self, duration: float, wall_seconds: float, busy_seconds: float) -> Dict[str, Any]:
+        distances = sorted(self.pickup_distances)
+        wall_seconds = max(wall_seconds, 1e-9)
+        return {
+            "simulated_hours": duration / 3600,
+            "wall_seconds": wall_seconds,
+            "simulated_hours_per_wall_minute": duration / 3600 / wall_seconds * 60,
+            "events": self.clock.events_processed,
+            "events_per_second": self.clock.events_processed / wall_seconds,
+            "manager_ops": self.manager_ops,
+            "ops_per_second": self.manager_ops / wall_seconds,
+            "requests": self.requests,
+            "matched": self.matched,
+            "match_rate": self.matched / self.requests if self.requests else 0.0,
+            "completed": self.completed,
+            "pickup_km_mean": sum(distances) / len(distances) if distances else 0.0,
+            "pickup_km_p95": distances[int(len(distances) * 0.95)] if distances else 0.0,
+            "utilization": busy_seconds / (duration * len(self.drivers)) if self.drivers and duration else 0.0,
+            "revenue": self.revenue
+        }
+
+def main(argv: List[str] = None) -> int:
+    defaults = SimulationConfig()
+    parser = argparse.ArgumentParser(description="Ride-sharing city simulator")
+    parser.add_argument("--hours", type=float, default=defaults.hours, help="Simulated hours to run")
+    parser.add_argument("--drivers", type=int, default=defaults.drivers, help="Fleet size")
+    parser.add_argument("--riders", type=int, default=defaults.riders, help="Rider population")
+    parser.add_argument("--demand", type=float, default=defaults.demand_per_hour, help="Mean requests per hour")
+    parser.add_argument("--speed", type=float, default=defaults.speed_kmh, help="Median speed in km/h")
+    parser.add_argument("--strategy", choices=sorted(MATCHING_STRATEGIES), default=defaults.strategy,
+                        help="Driver matching strategy")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="Seed for the city and demand")
+    parser.add_argument("--output", help="Also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    config = SimulationConfig(drivers=args.drivers, riders=args.riders, hours=args.hours,
+                              demand_per_hour=args.demand, speed_kmh=args.speed,
+                              strategy=args.strategy, seed=args.seed)
+    report = CitySimulator(config).run()
+    fresh_managers()
+
+    for name, value in report.items():
+        print(f"{name:<35} {value:>14.3f}" if isinstance(value, float) else f"{name:<35} {value:>14}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
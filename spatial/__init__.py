@@ -0,0 +1 @@
+# Spatial package
\ No newline at end of file
@@ -0,0 +1,223 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+from bisect import bisect_left, bisect_right, insort
+import heapq
+import itertools
+import math
+import threading
+
+from models.user import Driver
+from spatial.geo import haversine_km, degree_span
+from spatial.viewport import Viewport, cells_in_box
+
+CellKey = Tuple[int, int]
+BucketKey = Tuple[str, CellKey]  # (vehicle type, grid cell)
+Entry = Tuple[float, int, str]  # (-rating, insertion sequence, driver id)
+
+class DriverSpatialIndex:
+    """Grid index of available drivers keeping each cell ordered by rating"""
+
+    def __init__(self, cell_size: float = 0.05, ring_cell_size: float = 0.01):
+        self.cell_size = cell_size  # Cell edge in degrees (~5.5 km of latitude)
+        self.ring_cell_size = ring_cell_size  # Finer grid for ring searches (~1.1 km)
+        self._cells: Dict[BucketKey, List[Entry]] = {}  # Entries sorted best rating first
+        self._entries: Dict[str, Tuple[BucketKey, Entry]] = {}  # Current entry of each driver
+        self._drivers: Dict[str, Driver] = {}
+        self._occupied: Dict[str, Set[CellKey]] = {}  # Non-empty cells per vehicle type
+        self._ring_cells: Dict[BucketKey, Dict[str, int]] = {}  # Driver ID -> insertion sequence
+        self._ring_occupied: Dict[str, Set[CellKey]] = {}
+        self._ring_bucket: Dict[str, BucketKey] = {}  # Current fine cell of each driver
+        self._sequence = itertools.count()
+        self.last_visited = 0  # Entries looked at by the most recent highest_rated search
+        # Drivers report location changes from whichever thread updates them
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._drivers)
+
+    def __contains__(self, driver: Driver) -> bool:
+        return driver.id in self._drivers
+
+    def cell_for(self, location: Tuple[float, float]) -> CellKey:
+        """Get the grid cell containing a location"""
+        return (math.floor(location[0] / self.cell_size), math.floor(location[1] / self.cell_size))
+
+    def add(self, driver: Driver) -> None:
+        """Add a driver to the index and start tracking its changes"""
+        with self._lock:
+            if driver.id in self._drivers:
+                return
+
+            self._drivers[driver.id] = driver
+            self._place(driver, next(self._sequence))
+            driver.register_observer(self)
+
+    def add_many(self, drivers: Iterable[Driver]) -> None:
+        """Add drivers in bulk, taking the lock once rather than per driver"""
+        with self._lock:
+            for driver in drivers:
+                if driver.id in self._drivers:
+                    continue
+
+                self._drivers[driver.id] = driver
+                self._place(driver, next(self._sequence))
+                driver.register_observer(self)
+
+    def remove(self, driver: Driver) -> None:
+        """Remove a driver from the index"""
+        with self._lock:
+            if driver.id not in self._drivers:
+                return
+
+            self._unplace(driver.id)
+            del self._drivers[driver.id]
+            driver.remove_observer(self)
+
+    def update(self, driver: Driver) -> None:
+        """Observer hook: re-position a driver after a rating or location change"""
+        with self._lock:
+            current = self._entries.get(driver.id)
+            if current is None:
+                return
+
+            bucket, entry = current
+            sequence = entry[1]
+            if (bucket == self._bucket_for(driver) and entry[0] == -driver.rating
+                    and self._ring_bucket[driver.id] == self._ring_bucket_for(driver)):
+                return
+
+            # Keep the original sequence so ties still resolve in pool order
+            self._unplace(driver.id)
+            self._place(driver, sequence)
+
+    def counts_by_vehicle_type(self) -> Dict[str, int]:
+        """Count indexed drivers per vehicle type"""
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for (vehicle_type, _), entries in self._cells.items():
+                counts[vehicle_type] = counts.get(vehicle_type, 0) + len(entries)
+            return counts
+
+    def highest_rated(self, location: Tuple[float, float], vehicle_type: str,
+                      max_distance: float, k: int = 1) -> List[Tuple[Driver, float]]:
+        """Find up to k highest rated drivers within max_distance km, best first"""
+        with self._lock:
+            # Best-first merge across the cells in range: the heap holds the next
+            # unvisited entry of each cell, so drivers are distance-checked in
+            # rating order and the search stops as soon as k are in range
+            heap = []
+            for bucket in self._buckets_in_range(location, vehicle_type, max_distance):
+                heap.append((self._cells[bucket][0], 0, bucket))
+            heapq.heapify(heap)
+
+            matches = []
+            visited = 0
+            while heap and len(matches) < k:
+                entry, position, bucket = heapq.heappop(heap)
+                driver = self._drivers[entry[2]]
+                distance = haversine_km(driver.get_location(), location)
+                if distance <= max_distance:
+                    matches.append((driver, distance))
+
+                entries = self._cells[bucket]
+                if position + 1 < len(entries):
+                    heapq.heappush(heap, (entries[position + 1], position + 1, bucket))
+                visited += 1
+
+            self.last_visited = visited
+            return matches
+
+    def rings(self, location: Tuple[float, float], vehicle_type: str,
+              radii: Sequence[float]) -> Iterator[Tuple[float, List[Tuple[Driver, float]]]]:
+        """Yield (radius, drivers newly within it) for growing radii, nearest first.
+
+        Rings read the finer ring grid, each cell once across all rings: drivers
+        in a visited cell that lie beyond the current radius wait in a pending
+        list for a later ring, so widening the search only reads the cells the
+        previous ring missed.
+        """
+        visited: Set[CellKey] = set()
+        seen: Set[str] = set()
+        pending: List[Tuple[float, int, Driver]] = []
+        for radius in radii:
+            # Lock per ring so a caller that stops early never holds the index
+            with self._lock:
+                occupied = self._ring_occupied.get(vehicle_type) or set()
+                lat_span, lon_span = degree_span(location[0], radius)
+                box = (location[0] - lat_span, location[1] - lon_span,
+                       location[0] + lat_span, location[1] + lon_span)
+                for cell in cells_in_box(box, self.ring_cell_size, occupied):
+                    if cell in visited:
+                        continue
+                    visited.add(cell)
+                    for driver_id, sequence in self._ring_cells[(vehicle_type, cell)].items():
+                        # A driver moving between rings could show up in two cells
+                        if driver_id in seen:
+                            continue
+                        seen.add(driver_id)
+                        driver = self._drivers[driver_id]
+                        pending.append((haversine_km(driver.get_location(), location), sequence, driver))
+
+            pending.sort(key=lambda item: (item[0], item[1]))
+            split = bisect_right([item[0] for item in pending], radius)
+            yield radius, [(driver, distance) for distance, _, driver in pending[:split]]
+            pending = pending[split:]
+
+    def in_viewport(self, viewport: Viewport, vehicle_type: Optional[str] = None) -> List[Driver]:
+        """Get the available drivers inside a map viewport, of one vehicle type or all"""
+        with self._lock:
+            vehicle_types = [vehicle_type] if vehicle_type else list(self._occupied)
+            drivers = []
+            for current_type in vehicle_types:
+                occupied = self._occupied.get(current_type)
+                if not occupied:
+                    continue
+                for cell in cells_in_box(viewport.box, self.cell_size, occupied):
+                    for entry in self._cells[(current_type, cell)]:
+                        driver = self._drivers[entry[2]]
+                        if viewport.contains(driver.get_location()):
+                            drivers.append(driver)
+            return drivers
+
+    def _bucket_for(self, driver: Driver) -> BucketKey:
+        return (driver.vehicle.vehicle_type, self.cell_for(driver.get_location()))
+
+    def _ring_bucket_for(self, driver: Driver) -> BucketKey:
+        location = driver.get_location()
+        return (driver.vehicle.vehicle_type, (math.floor(location[0] / self.ring_cell_size),
+                                              math.floor(location[1] / self.ring_cell_size)))
+
+    def _place(self, driver: Driver, sequence: int) -> None:
+        bucket = self._bucket_for(driver)
+        entry = (-driver.rating, sequence, driver.id)
+        insort(self._cells.setdefault(bucket, []), entry)
+        self._occupied.setdefault(bucket[0], set()).add(bucket[1])
+        self._entries[driver.id] = (bucket, entry)
+        ring_bucket = self._ring_bucket_for(driver)
+        self._ring_cells.setdefault(ring_bucket, {})[driver.id] = sequence
+        self._ring_occupied.setdefault(ring_bucket[0], set()).add(ring_bucket[1])
+        self._ring_bucket[driver.id] = ring_bucket
+
+    def _unplace(self, driver_id: str) -> None:
+        bucket, entry = self._entries.pop(driver_id)
+        entries = self._cells[bucket]
+        del entries[bisect_left(entries, entry)]
+        if not entries:
+            del self._cells[bucket]
+            self._occupied[bucket[0]].discard(bucket[1])
+        ring_bucket = self._ring_bucket.pop(driver_id)
+        ring_cell = self._ring_cells[ring_bucket]
+        del ring_cell[driver_id]
+        if not ring_cell:
+            del self._ring_cells[ring_bucket]
+            self._ring_occupied[ring_bucket[0]].discard(ring_bucket[1])
+
+    def _buckets_in_range(self, location: Tuple[float, float], vehicle_type: str,
+                          max_distance: float) -> Iterable[BucketKey]:
+        """Get the non-empty cells overlapping the bounding box of the search radius"""
+        occupied = self._occupied.get(vehicle_type)
+        if not occupied:
+            return []
+
+        lat_span, lon_span = degree_span(location[0], max_distance)
+        box = (location[0] - lat_span, location[1] - lon_span, location[0] + lat_span, location[1] + lon_span)
+        return [(vehicle_type, cell) for cell in cells_in_box(box, self.cell_size, occupied)]
@@ -0,0 +1,38 @@
+from typing import Tuple
+import math
+
+# Radius of Earth in kilometers
+EARTH_RADIUS_KM = 6371.0
+
+# Length of one degree of latitude on the same sphere haversine_km measures on
+KM_PER_DEGREE_LAT = math.radians(1) * EARTH_RADIUS_KM
+
+def haversine_km(point1: Tuple[float, float], point2: Tuple[float, float]) -> float:
+    """Calculate distance in kilometers between two points using the Haversine formula"""
+    # Unpack the coordinates
+    lat1, lon1 = point1
+    lat2, lon2 = point2
+    
+    # Convert latitude and longitude from degrees to radians
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    
+    # Haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    
+    return c * EARTH_RADIUS_KM
+
+def degree_span(latitude: float, radius_km: float) -> Tuple[float, float]:
+    """Get the (latitude, longitude) degree span covering radius_km around a latitude"""
+    lat_span = radius_km / KM_PER_DEGREE_LAT
+    # A circle is widest in longitude north or south of its centre, where the
+    # meridians are closer together: asin(sin(radius) / cos(latitude)) wide
+    angle = radius_km / EARTH_RADIUS_KM
+    cos_lat = math.cos(math.radians(latitude))
+    if math.sin(angle) >= cos_lat:
+        # The circle reaches over a pole and covers every longitude
+        return lat_span, 180.0
+    lon_span = math.degrees(math.asin(math.sin(angle) / cos_lat))
+    return lat_span, lon_span
@@ -0,0 +1,136 @@
+from typing import Dict, List, Optional, Set, Tuple
+import math
+import threading
+
+from models.ride import Ride, RideStatus
+from models.user import Driver
+from spatial.viewport import Viewport, cells_in_box
+
+CellKey = Tuple[int, int]
+Location = Tuple[float, float]
+
+class _PointGrid:
+    """Grid of keyed points, each remembered with the cell it sits in"""
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self._cells: Dict[CellKey, Dict[str, Location]] = {}
+        self._cell_of: Dict[str, CellKey] = {}
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def put(self, key: str, location: Location) -> None:
+        cell = (math.floor(location[0] / self.cell_size), math.floor(location[1] / self.cell_size))
+        previous = self._cell_of.get(key)
+        if previous is not None and previous != cell:
+            self.discard(key)
+        self._cells.setdefault(cell, {})[key] = location
+        self._cell_of[key] = cell
+
+    def discard(self, key: str) -> None:
+        cell = self._cell_of.pop(key, None)
+        if cell is None:
+            return
+        points = self._cells[cell]
+        del points[key]
+        if not points:
+            del self._cells[cell]
+
+    def within(self, viewport: Viewport) -> List[Tuple[str, Location]]:
+        return [(key, location)
+                for cell in cells_in_box(viewport.box, self.cell_size, self._cells)
+                for key, location in self._cells[cell].items()
+                if viewport.contains(location)]
+
+class ActiveRideIndex:
+    """Grid indexes of active rides by pickup location and by their driver's current position.
+
+    The index observes the rides it holds and drops them once they complete
+    or are cancelled. It also observes each ride's driver while the ride is
+    active, so driver location updates move the ride in the position grid.
+    """
+
+    def __init__(self, cell_size: float = 0.05):
+        self._rides: Dict[str, Ride] = {}
+        self._pickups = _PointGrid(cell_size)
+        self._positions = _PointGrid(cell_size)  # Rides with a driver only
+        self._driver_rides: Dict[str, Set[str]] = {}  # Driver ID -> IDs of their active rides, several in a carpool
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._rides)
+
+    def __contains__(self, ride: Ride) -> bool:
+        return ride.id in self._rides
+
+    def add(self, ride: Ride) -> None:
+        """Index an active ride and start tracking its changes"""
+        with self._lock:
+            if ride.id in self._rides or _is_finished(ride):
+                return
+
+            self._rides[ride.id] = ride
+            self._pickups.put(ride.id, ride.pickup_location)
+            self._follow_driver(ride)
+            ride.register_observer(self)
+
+    def remove(self, ride: Ride) -> None:
+        """Drop a ride from the index"""
+        with self._lock:
+            if ride.id in self._rides:
+                self._drop(ride)
+                ride.remove_observer(self)
+
+    def update(self, subject) -> None:
+        """Observer hook: follow ride status changes and driver moves"""
+        with self._lock:
+            if isinstance(subject, Driver):
+                for ride_id in self._driver_rides.get(subject.id, ()):
+                    self._positions.put(ride_id, subject.get_location())
+            elif subject.id in self._rides:
+                # A finished ride never notifies again, so it keeps this
+                # observer rather than having its list changed mid-dispatch
+                if _is_finished(subject):
+                    self._drop(subject)
+                else:
+                    self._follow_driver(subject)
+
+    def in_viewport(self, viewport: Viewport, by: str = "pickup") -> List[Tuple[Ride, Location]]:
+        """Get the active rides inside a viewport, with the location that placed them there.
+
+        by="pickup" places every ride at its pickup; by="driver" places rides
+        with a driver at the driver's current position and leaves out the rest.
+        """
+        if by not in ("pickup", "driver"):
+            raise ValueError(f"Unknown ride position {by!r}; use 'pickup' or 'driver'")
+        grid = self._pickups if by == "pickup" else self._positions
+        with self._lock:
+            return [(self._rides[ride_id], location) for ride_id, location in grid.within(viewport)]
+
+    def _drop(self, ride: Ride) -> None:
+        del self._rides[ride.id]
+        self._pickups.discard(ride.id)
+        self._positions.discard(ride.id)
+        driver = ride.driver
+        if driver is not None and driver.id in self._driver_rides:
+            ride_ids = self._driver_rides[driver.id]
+            ride_ids.discard(ride.id)
+            if not ride_ids:
+                del self._driver_rides[driver.id]
+                driver.remove_observer(self)
+
+    def _follow_driver(self, ride: Ride) -> None:
+        driver: Optional[Driver] = ride.driver
+        if driver is None:
+            return
+
+        ride_ids = self._driver_rides.get(driver.id)
+        if ride_ids is None:
+            ride_ids = self._driver_rides[driver.id] = set()
+            driver.register_observer(self)
+        ride_ids.add(ride.id)
+        self._positions.put(ride.id, driver.get_location())
+
+def _is_finished(ride: Ride) -> bool:
+    return ride.status in (RideStatus.COMPLETED, RideStatus.CANCELLED)
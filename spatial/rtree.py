@@ -0,0 +1,59 @@
+from typing import Any, Generic, Iterator, List, Sequence, Tuple, TypeVar
+import math
+
+T = TypeVar("T")
+Box = Tuple[float, float, float, float]  # (min latitude, min longitude, max latitude, max longitude)
+
+class RTree(Generic[T]):
+    """Static R-tree of bounding boxes, bulk loaded with Sort-Tile-Recursive packing.
+
+    STR sorts the boxes by longitude into vertical slices, sorts each slice
+    by latitude and cuts it into full nodes, then packs the nodes the same
+    way level by level. Nodes end up nearly full and barely overlapping, so
+    a point query descends only the few branches whose boxes hold it. The
+    tree is immutable: rebuild it to change its contents.
+    """
+
+    def __init__(self, entries: Sequence[Tuple[Box, T]], node_capacity: int = 16):
+        self.node_capacity = max(2, node_capacity)
+        self.size = len(entries)
+        # A node is (box, children, is_leaf); leaf children are the (box, item) entries
+        level: List[Tuple[Box, Any, bool]] = [(box, item, True) for box, item in entries]
+        while len(level) > self.node_capacity:
+            level = self._pack(level)
+        self._root = (_union([node[0] for node in level]), level, False) if level else None
+
+    def __len__(self) -> int:
+        return self.size
+
+    def at(self, location: Tuple[float, float]) -> Iterator[T]:
+        """Items whose boxes contain a point"""
+        if self._root is None:
+            return
+        lat, lon = location
+        stack = [self._root]
+        while stack:
+            box, children, is_leaf = stack.pop()
+            if not (box[0] <= lat <= box[2] and box[1] <= lon <= box[3]):
+                continue
+            if is_leaf:
+                yield children
+            else:
+                stack.extend(children)
+
+    def _pack(self, nodes: List[Tuple[Box, Any, bool]]) -> List[Tuple[Box, Any, bool]]:
+        capacity = self.node_capacity
+        node_count = math.ceil(len(nodes) / capacity)
+        slice_size = math.ceil(math.sqrt(node_count)) * capacity
+        by_lon = sorted(nodes, key=lambda node: node[0][1] + node[0][3])
+        parents = []
+        for start in range(0, len(by_lon), slice_size):
+            column = sorted(by_lon[start:start + slice_size], key=lambda node: node[0][0] + node[0][2])
+            for group_start in range(0, len(column), capacity):
+                group = column[group_start:group_start + capacity]
+                parents.append((_union([node[0] for node in group]), group, False))
+        return parents
+
+def _union(boxes: Sequence[Box]) -> Box:
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
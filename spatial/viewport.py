@@ -0,0 +1,75 @@
+from typing import Collection, Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+
+Box = Tuple[float, float, float, float]  # (min latitude, min longitude, max latitude, max longitude)
+
+class Viewport:
+    """Map area to query: a bounding box, or a polygon tested inside its bounding box"""
+
+    def __init__(self, box: Optional[Box] = None, polygon: Optional[Sequence[Tuple[float, float]]] = None):
+        if polygon is not None:
+            if len(polygon) < 3:
+                raise ValueError("A polygon needs at least 3 points")
+            self.polygon: Optional[List[Tuple[float, float]]] = [tuple(point) for point in polygon]
+            latitudes = [point[0] for point in self.polygon]
+            longitudes = [point[1] for point in self.polygon]
+            box = (min(latitudes), min(longitudes), max(latitudes), max(longitudes))
+        elif box is not None:
+            self.polygon = None
+        else:
+            raise ValueError("A viewport needs a bounding box or a polygon")
+        if box[0] > box[2] or box[1] > box[3]:
+            raise ValueError("A bounding box runs from its minimum corner to its maximum corner")
+        self.box: Box = tuple(box)
+
+    def contains(self, location: Tuple[float, float]) -> bool:
+        min_lat, min_lon, max_lat, max_lon = self.box
+        if not (min_lat <= location[0] <= max_lat and min_lon <= location[1] <= max_lon):
+            return False
+        return self.polygon is None or _in_polygon(location, self.polygon)
+
+def cells_in_box(box: Box, cell_size: float, occupied: Collection[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Get the non-empty grid cells overlapping a box"""
+    min_row, min_col = math.floor(box[0] / cell_size), math.floor(box[1] / cell_size)
+    max_row, max_col = math.floor(box[2] / cell_size), math.floor(box[3] / cell_size)
+
+    # For very wide boxes it is cheaper to filter the occupied cells
+    if (max_row - min_row + 1) * (max_col - min_col + 1) > len(occupied):
+        return [cell for cell in occupied if min_row <= cell[0] <= max_row and min_col <= cell[1] <= max_col]
+
+    return [(row, col)
+            for row in range(min_row, max_row + 1)
+            for col in range(min_col, max_col + 1)
+            if (row, col) in occupied]
+
+def cluster_cell_size(zoom: int) -> float:
+    """Cluster cell edge in degrees for a web map zoom level: an eighth of a map tile"""
+    return 360.0 / (2 ** zoom) / 8
+
+def cluster_points(points: Iterable[Tuple[Tuple[float, float], str]], cell_size: float) -> List[Dict]:
+    """Group (location, label) points into grid cells: a count per label around their mean position"""
+    cells: Dict[Tuple[int, int], list] = {}
+    for location, label in points:
+        key = (math.floor(location[0] / cell_size), math.floor(location[1] / cell_size))
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = [0, 0.0, 0.0, {}]
+        cell[0] += 1
+        cell[1] += location[0]
+        cell[2] += location[1]
+        cell[3][label] = cell[3].get(label, 0) + 1
+    return [{"location": (lat_sum / count, lon_sum / count), "count": count, "counts": counts}
+            for count, lat_sum, lon_sum, counts in cells.values()]
+
+def _in_polygon(location: Tuple[float, float], polygon: List[Tuple[float, float]]) -> bool:
+    # Ray casting along the longitude axis: an odd number of edge crossings is inside
+    lat, lon = location
+    inside = False
+    previous = polygon[-1]
+    for point in polygon:
+        if (point[0] > lat) != (previous[0] > lat):
+            crossing = point[1] + (lat - point[0]) * (previous[1] - point[1]) / (previous[0] - point[0])
+            if lon < crossing:
+                inside = not inside
+        previous = point
+    return inside
@@ -0,0 +1,191 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import json
+import threading
+
+from spatial.rtree import RTree
+
+Location = Tuple[float, float]
+Ring = Sequence[Location]
+
+# Zone kinds
+SERVICE_AREA = "service_area"  # Once any exist, pickups and dropoffs must fall inside one
+NO_PICKUP = "no_pickup"  # Rides may end here but not start here
+AIRPORT = "airport"  # Carries a surcharge on pickups and dropoffs
+RATE_CARD = "rate_card"  # City-specific base fares and per-km rates
+ZONE_KINDS = (SERVICE_AREA, NO_PICKUP, AIRPORT, RATE_CARD)
+
+# Decimal places kept when memoizing lookups; 6 is about 0.1 m
+LOOKUP_PRECISION = 6
+
+class ZoneError(ValueError):
+    """A pickup or dropoff that the service zones do not allow"""
+
+class PreparedPolygon:
+    """Polygon with holes, preprocessed for fast point-in-polygon tests.
+
+    The edges of every ring are sorted into horizontal latitude bands, so a
+    test ray-casts only against the edges crossing the point's band rather
+    than against the whole outline. Rings are (latitude, longitude) lists;
+    the first is the outline and any others are holes.
+    """
+
+    def __init__(self, rings: Sequence[Ring]):
+        if not rings or len(rings[0]) < 3:
+            raise ValueError("A polygon needs an outline of at least 3 points")
+        edges = []
+        for ring in rings:
+            for i, start in enumerate(ring):
+                end = ring[(i + 1) % len(ring)]
+                if start[0] != end[0]:  # Horizontal edges never cross a horizontal ray
+                    edges.append((start[0], start[1], end[0], end[1]))
+
+        outline = rings[0]
+        self.box = (min(point[0] for point in outline), min(point[1] for point in outline),
+                    max(point[0] for point in outline), max(point[1] for point in outline))
+        self._band_count = max(1, len(edges) // 4)
+        self._band_height = (self.box[2] - self.box[0]) / self._band_count or 1.0
+        self._bands: List[List[Tuple[float, float, float, float]]] = [[] for _ in range(self._band_count)]
+        for edge in edges:
+            first, last = self._band(min(edge[0], edge[2])), self._band(max(edge[0], edge[2]))
+            for band in range(first, last + 1):
+                self._bands[band].append(edge)
+
+    def contains(self, location: Location) -> bool:
+        lat, lon = location
+        box = self.box
+        if not (box[0] <= lat <= box[2] and box[1] <= lon <= box[3]):
+            return False
+        inside = False
+        for lat1, lon1, lat2, lon2 in self._bands[self._band(lat)]:
+            if (lat1 > lat) != (lat2 > lat) and lon < lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1):
+                inside = not inside
+        return inside
+
+    def _band(self, lat: float) -> int:
+        return min(self._band_count - 1, max(0, int((lat - self.box[0]) / self._band_height)))
+
+class Zone:
+    """Named area of one kind, made of one or more polygons"""
+
+    def __init__(self, zone_id: str, name: str, kind: str, polygons: Sequence[Sequence[Ring]],
+                 priority: int = 0, base_fares: Optional[Dict[str, float]] = None,
+                 per_km_rates: Optional[Dict[str, float]] = None, surcharge: float = 0.0):
+        if kind not in ZONE_KINDS:
+            raise ValueError(f"Unknown zone kind {kind!r}; expected one of {', '.join(ZONE_KINDS)}")
+        self.id = zone_id
+        self.name = name
+        self.kind = kind
+        self.polygons = [PreparedPolygon(rings) for rings in polygons]
+        self.priority = priority  # Among overlapping zones of a kind, the highest wins
+        self.base_fares = base_fares or {}  # Vehicle type name -> base fare, for rate cards
+        self.per_km_rates = per_km_rates or {}
+        self.surcharge = surcharge
+
+    def contains(self, location: Location) -> bool:
+        return any(polygon.contains(location) for polygon in self.polygons)
+
+    @classmethod
+    def from_feature(cls, feature: Dict[str, Any]) -> "Zone":
+        """Build a zone from a GeoJSON Polygon or MultiPolygon feature"""
+        properties = feature.get("properties") or {}
+        geometry = feature["geometry"]
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry["type"] == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            raise ValueError(f"Zones must be polygons, not {geometry['type']}")
+        # GeoJSON positions are [longitude, latitude]
+        polygons = [[[(point[1], point[0]) for point in ring] for ring in rings] for rings in polygons]
+        zone_id = str(properties.get("id", feature.get("id", "")))
+        return cls(zone_id, properties.get("name", zone_id), properties.get("kind", SERVICE_AREA), polygons,
+                   int(properties.get("priority", 0)), properties.get("base_fares"),
+                   properties.get("per_km_rates"), float(properties.get("surcharge", 0.0)))
+
+class ZoneIndex:
+    """Service zones in an R-tree, with memoized lookups by location.
+
+    Each polygon's bounding box is an R-tree entry, so a lookup tests only
+    the polygons whose boxes hold the point. Results are kept in an LRU keyed
+    by the location rounded to LOOKUP_PRECISION places, since pickups repeat
+    at stations, airports and popular addresses.
+    """
+
+    def __init__(self, cache_size: int = 100000):
+        self.cache_size = cache_size
+        self.zones: List[Zone] = []
+        self._tree: RTree[Tuple[int, Zone, PreparedPolygon]] = RTree([])
+        self._has_service_areas = False
+        self._cache: "OrderedDict[Location, List[Zone]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __len__(self) -> int:
+        return len(self.zones)
+
+    def load(self, path: str) -> None:
+        """Load zones from a GeoJSON FeatureCollection file"""
+        with open(path) as f:
+            collection = json.load(f)
+        self.set_zones([Zone.from_feature(feature) for feature in collection["features"]])
+
+    def set_zones(self, zones: Sequence[Zone]) -> None:
+        """Replace every zone, rebuilding the tree and emptying the lookup cache"""
+        entries = [(polygon.box, (position, zone, polygon))
+                   for position, zone in enumerate(zones) for polygon in zone.polygons]
+        tree = RTree(entries)
+        with self._lock:
+            self.zones = list(zones)
+            self._tree = tree
+            self._has_service_areas = any(zone.kind == SERVICE_AREA for zone in zones)
+            self._cache.clear()
+
+    def zones_at(self, location: Location) -> List[Zone]:
+        """Zones containing a location, highest priority first"""
+        key = (round(location[0], LOOKUP_PRECISION), round(location[1], LOOKUP_PRECISION))
+        with self._lock:
+            zones = self._cache.get(key)
+            if zones is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return zones
+            tree = self._tree
+
+        found = {}
+        for position, zone, polygon in tree.at(key):
+            if position not in found and polygon.contains(key):
+                found[position] = zone
+        # Equal priorities keep the order the zones were given in
+        order = sorted(found, key=lambda position: (-found[position].priority, position))
+        zones = [found[position] for position in order]
+
+        with self._lock:
+            if tree is self._tree:  # Not cached across a reload
+                self.cache_misses += 1
+                self._cache[key] = zones
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return zones
+
+    def zone_of_kind(self, location: Location, kind: str) -> Optional[Zone]:
+        """Highest priority zone of a kind containing a location"""
+        return next((zone for zone in self.zones_at(location) if zone.kind == kind), None)
+
+    def check_trip(self, pickup: Location, dropoff: Location) -> None:
+        """Raise ZoneError unless a trip may start at pickup and end at dropoff"""
+        if not self.zones:
+            return
+        pickup_zones = self.zones_at(pickup)
+        if self._has_service_areas:
+            if not any(zone.kind == SERVICE_AREA for zone in pickup_zones):
+                raise ZoneError("Pickup location is outside the service area")
+            if not any(zone.kind == SERVICE_AREA for zone in self.zones_at(dropoff)):
+                raise ZoneError("Dropoff location is outside the service area")
+        no_pickup = next((zone for zone in pickup_zones if zone.kind == NO_PICKUP), None)
+        if no_pickup is not None:
+            raise ZoneError(f"Pickups are not allowed in {no_pickup.name}")
+
+# Process-wide zones used to validate trips and by zone pricing
+zone_index = ZoneIndex()
@@ -0,0 +1,257 @@
+"""Streaming bulk import of drivers and riders from CSV or NDJSON files.
+
+Usage:
+    python -m storage.bulk_import --drivers drivers.csv --riders riders.ndjson
+    python -m storage.bulk_import --drivers drivers.ndjson.gz --db ride_sharing.db
+
+Driver rows carry name, phone, vehicle_id, model, vehicle_type, capacity,
+latitude and longitude, plus an optional id and rating; rider rows carry
+name, phone, latitude and longitude, plus an optional id. Files are read a
+batch at a time and each row is checked with plain comparisons instead of
+a request model, so memory stays flat and 100k drivers load in seconds.
+The API runs the same import at startup from BULK_IMPORT_DRIVERS_PATH and
+BULK_IMPORT_RIDERS_PATH.
+"""
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+import argparse
+import csv
+import gzip
+import io
+import json
+import math
+import sys
+import time
+
+from managers.ride_manager import RideManager
+from managers.user_manager import UserManager
+from models.ride import VehicleType
+from models.user import Driver, Rider, Vehicle
+
+DRIVER_FIELDS = ("name", "phone", "vehicle_id", "model", "vehicle_type", "capacity", "latitude", "longitude")
+RIDER_FIELDS = ("name", "phone", "latitude", "longitude")
+
+# Rows validated and registered together
+BATCH_SIZE = 5000
+
+# Rejected rows beyond this many are counted but not described
+MAX_REPORTED_ERRORS = 100
+
+VEHICLE_TYPES = frozenset(vehicle_type.value for vehicle_type in VehicleType)
+
+Row = Dict[str, Any]
+
+class ImportReport:
+    """Outcome of importing one file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.imported = 0
+        self.rejected = 0
+        self.errors: List[Tuple[int, str]] = []  # (line number, reason) of the first rejected rows
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return (self.imported + self.rejected) / self.seconds if self.seconds else 0.0
+
+    def reject(self, line: int, reason: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, reason))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "errors": [{"line": line, "reason": reason} for line, reason in self.errors],
+            "seconds": self.seconds,
+            "rows_per_second": self.rows_per_second
+        }
+
+def read_rows(path: str) -> Iterator[Tuple[int, Optional[Row]]]:
+    """Stream (line number, row) pairs from a CSV or NDJSON file, gzip-compressed or not.
+
+    The format follows the extension once any .gz is stripped: .csv, or
+    .ndjson/.jsonl. A line that is not a JSON object comes back as None.
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(".csv"):
+        export_format = "csv"
+    elif name.endswith((".ndjson", ".jsonl")):
+        export_format = "ndjson"
+    else:
+        raise ValueError(f"Cannot tell the format of {path}; expected .csv, .ndjson or .jsonl")
+
+    raw = gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+    with io.TextIOWrapper(raw, encoding="utf-8", newline="") as f:
+        if export_format == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+def import_drivers(path: str, user_manager: UserManager, ride_manager: RideManager,
+                   batch_size: int = BATCH_SIZE) -> ImportReport:
+    """Register every valid driver in a file and put the available ones in the matching pool"""
+    report = ImportReport(path)
+    started = time.perf_counter()
+    for batch in _batches(read_rows(path), batch_size):
+        drivers, ids = [], set()
+        for line, row in batch:
+            driver = _driver_from_row(row, user_manager.drivers, ids, report, line)
+            if driver is not None:
+                drivers.append(driver)
+        user_manager.add_drivers(drivers)
+        ride_manager.register_drivers(drivers)
+        report.imported += len(drivers)
+    report.seconds = time.perf_counter() - started
+    return report
+
+def import_riders(path: str, user_manager: UserManager, batch_size: int = BATCH_SIZE) -> ImportReport:
+    """Register every valid rider in a file"""
+    report = ImportReport(path)
+    started = time.perf_counter()
+    for batch in _batches(read_rows(path), batch_size):
+        riders, ids = [], set()
+        for line, row in batch:
+            rider = _rider_from_row(row, user_manager.riders, ids, report, line)
+            if rider is not None:
+                riders.append(rider)
+        user_manager.add_riders(riders)
+        report.imported += len(riders)
+    report.seconds = time.perf_counter() - started
+    return report
+
+def _batches(rows: Iterator[Tuple[int, Optional[Row]]], size: int) -> Iterator[List[Tuple[int, Optional[Row]]]]:
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _driver_from_row(row: Optional[Row], registered: Dict[str, Driver], ids: Set[str],
+                     report: ImportReport, line: int) -> Optional[Driver]:
+    error = _missing_fields(row, DRIVER_FIELDS)
+    if error is None and _is_duplicate(row, registered, ids):
+        error = f"driver {row['id']} already exists"
+    if error is None and row["vehicle_type"] not in VEHICLE_TYPES:
+        error = f"unknown vehicle_type {row['vehicle_type']!r}"
+    if error is None:
+        capacity = _to_number(row["capacity"], int)
+        if capacity is None or capacity < 1:
+            error = f"capacity must be a positive integer, got {row['capacity']!r}"
+    if error is None:
+        location, error = _location(row)
+    rating = None
+    if error is None and row.get("rating") not in (None, ""):
+        rating = _to_number(row["rating"], float)
+        if rating is None or not 0.0 <= rating <= 5.0:
+            error = f"rating must be between 0 and 5, got {row['rating']!r}"
+    if error is not None:
+        report.reject(line, error)
+        return None
+
+    vehicle = Vehicle(str(row["vehicle_id"]), str(row["model"]), row["vehicle_type"], capacity)
+    driver = Driver(str(row["name"]), str(row["phone"]), vehicle, location)
+    if row.get("id"):
+        driver.id = str(row["id"])
+    if rating is not None:
+        driver.rating = rating
+    return driver
+
+def _rider_from_row(row: Optional[Row], registered: Dict[str, Rider], ids: Set[str],
+                    report: ImportReport, line: int) -> Optional[Rider]:
+    error = _missing_fields(row, RIDER_FIELDS)
+    if error is None and _is_duplicate(row, registered, ids):
+        error = f"rider {row['id']} already exists"
+    if error is None:
+        location, error = _location(row)
+    if error is not None:
+        report.reject(line, error)
+        return None
+
+    rider = Rider(str(row["name"]), str(row["phone"]), location)
+    if row.get("id"):
+        rider.id = str(row["id"])
+    return rider
+
+def _missing_fields(row: Optional[Row], fields: Tuple[str, ...]) -> Optional[str]:
+    if row is None:
+        return "not a JSON object"
+    missing = [field for field in fields if row.get(field) in (None, "")]
+    return f"missing {', '.join(missing)}" if missing else None
+
+def _is_duplicate(row: Row, registered: Dict[str, Any], ids: Set[str]) -> bool:
+    """Check a row's id against registered users and the rest of its batch, claiming it if new"""
+    # Rows without an id get a fresh one and can never clash
+    user_id = row.get("id")
+    if not user_id:
+        return False
+    user_id = str(user_id)
+    if user_id in registered or user_id in ids:
+        return True
+    ids.add(user_id)
+    return False
+
+def _location(row: Row) -> Tuple[Optional[Tuple[float, float]], Optional[str]]:
+    latitude = _to_number(row["latitude"], float)
+    longitude = _to_number(row["longitude"], float)
+    if latitude is None or not -90.0 <= latitude <= 90.0:
+        return None, f"latitude must be between -90 and 90, got {row['latitude']!r}"
+    if longitude is None or not -180.0 <= longitude <= 180.0:
+        return None, f"longitude must be between -180 and 180, got {row['longitude']!r}"
+    return (latitude, longitude), None
+
+def _to_number(value: Any, kind: type) -> Optional[float]:
+    # CSV gives strings and NDJSON numbers; booleans and fractional counts are never valid
+    if isinstance(value, bool) or (kind is int and isinstance(value, float) and not value.is_integer()):
+        return None
+    try:
+        number = kind(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+def main(argv: List[str] = None) -> int:
+    from storage.sqlite import SQLiteRepository
+
+    parser = argparse.ArgumentParser(description="Bulk import drivers and riders")
+    parser.add_argument("--drivers", help="CSV or NDJSON file of drivers")
+    parser.add_argument("--riders", help="CSV or NDJSON file of riders")
+    parser.add_argument("--db", help="SQLite database to write the users to; validate only when unset")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows validated and registered together")
+    args = parser.parse_args(argv)
+
+    user_manager, ride_manager = UserManager(), RideManager()
+    repository = SQLiteRepository(args.db) if args.db else None
+    if repository is not None:
+        user_manager.set_repository(repository)
+    try:
+        reports = []
+        if args.riders:
+            reports.append(import_riders(args.riders, user_manager, args.batch_size))
+        if args.drivers:
+            reports.append(import_drivers(args.drivers, user_manager, ride_manager, args.batch_size))
+    finally:
+        if repository is not None:
+            repository.close()
+
+    json.dump([report.to_dict() for report in reports], sys.stdout, indent=2)
+    print()
+    return 1 if any(report.rejected for report in reports) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
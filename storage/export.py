@@ -0,0 +1,102 @@
+"""Streaming export of rides as NDJSON or CSV, optionally gzip-compressed.
+
+Usage:
+    python -m storage.export --db ride_sharing.db --since 2026-10-18 --until 2026-10-19
+    python -m storage.export --db ride_sharing.db --format csv --gzip --output rides.csv.gz
+
+Records flow from the store through the encoder to the output one chunk at
+a time, so memory stays flat however many rides are exported. The API
+serves the same stream from GET /api/rides/export.
+"""
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List
+import argparse
+import csv
+import io
+import json
+import sys
+import zlib
+
+from models.ride import RideStatus
+from storage.repository import RIDE_RECORD_FIELDS
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Output is handed on in chunks of about this many bytes
+CHUNK_BYTES = 64 * 1024
+
+def ndjson_chunks(records: Iterable[Dict[str, Any]], chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """Encode records as one JSON object per line"""
+    lines: List[str] = []
+    size = 0
+    for record in records:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_bytes:
+            yield "".join(lines).encode()
+            lines, size = [], 0
+    if lines:
+        yield "".join(lines).encode()
+
+def csv_chunks(records: Iterable[Dict[str, Any]], chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    """Encode records as CSV with a header row"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=RIDE_RECORD_FIELDS, lineterminator="\n")
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        if buffer.tell() >= chunk_bytes:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a stream of chunks into one gzip stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 16 + 15 selects the gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_chunks(records: Iterable[Dict[str, Any]], export_format: str = "ndjson",
+                  compress: bool = False) -> Iterator[bytes]:
+    """Encode records in export_format, gzip-compressed if asked"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format {export_format}; expected one of {', '.join(EXPORT_FORMATS)}")
+    chunks = ndjson_chunks(records) if export_format == "ndjson" else csv_chunks(records)
+    return gzip_chunks(chunks) if compress else chunks
+
+def main(argv: List[str] = None) -> int:
+    from storage.sqlite import SQLiteRepository
+
+    parser = argparse.ArgumentParser(description="Export rides from the SQLite store")
+    parser.add_argument("--db", default="ride_sharing.db", help="SQLite database written by the API")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="First request time to include (ISO 8601)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Request time to stop before (ISO 8601)")
+    parser.add_argument("--status", choices=[status.value for status in RideStatus], default="COMPLETED",
+                        help="Ride status to export")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="ndjson", help="Output format")
+    parser.add_argument("--gzip", action="store_true", help="Compress the output with gzip")
+    parser.add_argument("--output", help="Output file; standard output by default")
+    args = parser.parse_args(argv)
+
+    repository = SQLiteRepository(args.db)
+    try:
+        records = repository.iter_ride_records(RideStatus(args.status), args.since, args.until)
+        output = open(args.output, "wb") if args.output else sys.stdout.buffer
+        try:
+            for chunk in export_chunks(records, args.format, args.gzip):
+                output.write(chunk)
+        finally:
+            if args.output:
+                output.close()
+    finally:
+        repository.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+from models.user import Rider, Driver
+from models.ride import Ride, RideStatus
+
+# Rides in these states never change again and need not stay in memory
+TERMINAL_STATUSES = (RideStatus.COMPLETED, RideStatus.CANCELLED)
+
+# Flat ride fields for exports, in column order
+RIDE_RECORD_FIELDS = ("id", "rider_id", "driver_id", "vehicle_type", "ride_type", "status",
+                      "pickup_lat", "pickup_lon", "dropoff_lat", "dropoff_lon", "request_time",
+                      "start_time", "end_time", "distance", "driven_distance", "fare")
+
+def ride_record(ride: Ride) -> Dict[str, Any]:
+    """Flatten a ride into an export record; times are ISO 8601 strings"""
+    return {
+        "id": ride.id,
+        "rider_id": ride.rider.id,
+        "driver_id": ride.driver.id if ride.driver else None,
+        "vehicle_type": ride.vehicle_type.value,
+        "ride_type": ride.ride_type.value,
+        "status": ride.status.value,
+        "pickup_lat": ride.pickup_location[0],
+        "pickup_lon": ride.pickup_location[1],
+        "dropoff_lat": ride.dropoff_location[0],
+        "dropoff_lon": ride.dropoff_location[1],
+        "request_time": ride.request_time.isoformat(),
+        "start_time": ride.start_time.isoformat() if ride.start_time else None,
+        "end_time": ride.end_time.isoformat() if ride.end_time else None,
+        "distance": ride.distance,
+        "driven_distance": ride.trace.distance_km if ride.trace else None,
+        "fare": ride.fare
+    }
+
+class Repository(ABC):
+    """Abstract persistent store for riders, drivers and rides.
+
+    The managers keep the live objects (users, active rides, the available
+    pool) in memory and hand every change to save_*; implementations may
+    buffer those writes. Terminal rides are read back through get_ride and
+    find_rides. A repository also observes drivers, saving them whenever
+    their location, availability or rating changes.
+    """
+
+    @abstractmethod
+    def save_rider(self, rider: Rider) -> None:
+        """Store the rider's current state"""
+        pass
+
+    @abstractmethod
+    def save_driver(self, driver: Driver) -> None:
+        """Store the driver's current state"""
+        pass
+
+    @abstractmethod
+    def delete_driver(self, driver_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def save_ride(self, ride: Ride) -> None:
+        """Store the ride's current state"""
+        pass
+
+    @abstractmethod
+    def load_riders(self) -> List[Rider]:
+        pass
+
+    @abstractmethod
+    def load_drivers(self) -> List[Driver]:
+        pass
+
+    @abstractmethod
+    def load_active_rides(self, riders: Dict[str, Rider], drivers: Dict[str, Driver]) -> List[Ride]:
+        """Rebuild the rides not yet completed or cancelled, linked to the given live users"""
+        pass
+
+    @abstractmethod
+    def get_ride(self, ride_id: str, riders: Optional[Dict[str, Rider]] = None,
+                 drivers: Optional[Dict[str, Driver]] = None) -> Optional[Ride]:
+        """Get a stored ride; its users come from the given maps when present there"""
+        pass
+
+    @abstractmethod
+    def find_rides(self, rider_id: Optional[str] = None, driver_id: Optional[str] = None,
+                   status: Optional[RideStatus] = None, since: Optional[datetime] = None,
+                   limit: Optional[int] = None, riders: Optional[Dict[str, Rider]] = None,
+                   drivers: Optional[Dict[str, Driver]] = None, before: Optional[str] = None) -> List[Ride]:
+        """Get stored rides matching every given filter, newest first; all of them without a limit.
+
+        before is a ride ID to page from: only rides created before it are
+        returned. It needs time-ordered IDs.
+        """
+        pass
+
+    @abstractmethod
+    def iter_ride_records(self, status: Optional[RideStatus] = None, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+        """Stream stored rides requested in [since, until) as export records, oldest first.
+
+        Records are produced as they are read, so the caller's memory does
+        not grow with the number of rides.
+        """
+        pass
+
+    def update(self, driver: Driver) -> None:
+        """Observer hook: persist a driver after any change"""
+        self.save_driver(driver)
+
+    def flush(self) -> None:
+        """Write out any buffered changes"""
+        pass
+
+    def close(self) -> None:
+        """Flush and release the store"""
+        self.flush()
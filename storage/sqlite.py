@@ -0,0 +1,424 @@
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+import json
+import logging
+import sqlite3
+import threading
+import time
+from models import ids
+from models.user import Rider, Driver, Vehicle
+from models.ride import Ride, RideStatus, RideType, VehicleType
+from models.stats import DriverStats
+from models.trace import TripTrace
+from monitoring.metrics import registry
+from storage.repository import Repository, TERMINAL_STATUSES, RIDE_RECORD_FIELDS
+
+FLUSH_DURATION = registry.histogram("storage_flush_seconds", "Time spent writing one batch to SQLite")
+ROWS_WRITTEN = registry.counter("storage_rows_written_total", "Rows written to SQLite", ["table"])
+FLUSH_ERRORS = registry.counter("storage_flush_errors_total", "Batches that failed to write to SQLite")
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS riders (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    default_lat REAL NOT NULL,
+    default_lon REAL NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    ride_history TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS drivers (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    phone TEXT NOT NULL,
+    vehicle_id TEXT NOT NULL,
+    vehicle_model TEXT NOT NULL,
+    vehicle_type TEXT NOT NULL,
+    capacity INTEGER NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    is_available INTEGER NOT NULL,
+    rating REAL NOT NULL,
+    stats TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rides (
+    id TEXT PRIMARY KEY,
+    rider_id TEXT NOT NULL,
+    driver_id TEXT,
+    vehicle_type TEXT NOT NULL,
+    ride_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    pickup_lat REAL NOT NULL,
+    pickup_lon REAL NOT NULL,
+    dropoff_lat REAL NOT NULL,
+    dropoff_lon REAL NOT NULL,
+    request_time REAL NOT NULL,
+    start_time REAL,
+    end_time REAL,
+    fare REAL NOT NULL,
+    distance REAL NOT NULL,
+    pickup_eta_seconds REAL,
+    trace_started_at REAL,
+    trace BLOB,
+    driven_distance REAL,
+    assigned_time REAL
+);
+CREATE INDEX IF NOT EXISTS rides_by_rider_id ON rides (rider_id, id);
+CREATE INDEX IF NOT EXISTS rides_by_driver_id ON rides (driver_id, id);
+CREATE INDEX IF NOT EXISTS rides_by_status_id ON rides (status, id);
+CREATE INDEX IF NOT EXISTS rides_by_time ON rides (request_time);
+"""
+
+def _add_driver_stats(connection: sqlite3.Connection) -> None:
+    """Databases created before driver statistics lack drivers.stats"""
+    if "stats" not in _columns(connection, "drivers"):
+        connection.execute("ALTER TABLE drivers ADD COLUMN stats TEXT NOT NULL DEFAULT '{}'")
+
+def _add_ride_assigned_time(connection: sqlite3.Connection) -> None:
+    """Databases created before driver statistics lack rides.assigned_time"""
+    if "assigned_time" not in _columns(connection, "rides"):
+        connection.execute("ALTER TABLE rides ADD COLUMN assigned_time REAL")
+
+def _drop_rides_by_request_time(connection: sqlite3.Connection) -> None:
+    """Databases created before time-ordered IDs index rides by (column, request_time)"""
+    for index in ("rides_by_rider", "rides_by_driver", "rides_by_status"):
+        connection.execute(f"DROP INDEX IF EXISTS {index}")
+
+def _drop_driver_ride_history(connection: sqlite3.Connection) -> None:
+    """Databases created before driver histories were read from the rides table keep them as JSON"""
+    if "ride_history" in _columns(connection, "drivers"):
+        connection.execute("ALTER TABLE drivers DROP COLUMN ride_history")
+
+# Schema changes for databases created by earlier versions, oldest first.
+# PRAGMA user_version counts those applied; each one also checks the schema
+# itself, since a new database gets the latest SCHEMA straight away.
+MIGRATIONS = [_add_driver_stats, _add_ride_assigned_time, _drop_rides_by_request_time, _drop_driver_ride_history]
+
+# One fixed SQL string per statement, so each connection's statement cache
+# compiles it once and executemany() reuses the prepared statement
+UPSERTS = {
+    "riders": "INSERT OR REPLACE INTO riders VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+    "drivers": "INSERT OR REPLACE INTO drivers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+    "rides": "INSERT OR REPLACE INTO rides VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+}
+DELETES = {table: f"DELETE FROM {table} WHERE id = ?" for table in UPSERTS}
+SELECT_BY_ID = {table: f"SELECT * FROM {table} WHERE id = ?" for table in UPSERTS}
+SELECT_RECORDS = ("SELECT id, rider_id, driver_id, vehicle_type, ride_type, status, pickup_lat, pickup_lon, "
+                  "dropoff_lat, dropoff_lon, request_time, start_time, end_time, distance, driven_distance, "
+                  "fare FROM rides")
+# A driver's ride history is their completed rides in the order they ended,
+# so it is read back from the rides table rather than rewritten with every
+# location update
+SELECT_DRIVER_HISTORIES = ("SELECT driver_id, id FROM rides WHERE status = 'COMPLETED' AND driver_id IS NOT NULL "
+                           "ORDER BY end_time")
+SELECT_DRIVER_HISTORY = "SELECT id FROM rides WHERE driver_id = ? AND status = 'COMPLETED' ORDER BY end_time"
+SELECT_ACTIVE_RIDES = "SELECT * FROM rides WHERE status NOT IN ({})".format(
+    ", ".join(f"'{status.value}'" for status in TERMINAL_STATUSES))
+
+class SQLiteRepository(Repository):
+    """Repository in a SQLite database in WAL mode, with write-behind batching.
+
+    save_* only snapshot the object into a row and queue it; repeated saves
+    of one object before a flush collapse into a single write. A background
+    thread writes the queue in one transaction every flush_interval seconds,
+    or as soon as batch_size rows are waiting. Reads look at the queue first,
+    so they always see the latest save. Each reading thread has its own
+    connection, which WAL lets run alongside the writer.
+    """
+
+    def __init__(self, path: str, batch_size: int = 500, flush_interval: float = 0.2):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+        _migrate(self._writer)
+        self._readers = threading.local()
+        # Table -> row ID -> row, or None for a delete
+        self._pending: Dict[str, Dict[str, Optional[tuple]]] = {table: {} for table in UPSERTS}
+        self._flushing: Dict[str, Dict[str, Optional[tuple]]] = {table: {} for table in UPSERTS}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="sqlite-flusher", daemon=True)
+        self._flusher.start()
+
+    def save_rider(self, rider: Rider) -> None:
+        self._queue("riders", rider.id, _rider_row(rider))
+
+    def save_driver(self, driver: Driver) -> None:
+        self._queue("drivers", driver.id, _driver_row(driver))
+
+    def delete_driver(self, driver_id: str) -> None:
+        self._queue("drivers", driver_id, None)
+
+    def save_ride(self, ride: Ride) -> None:
+        self._queue("rides", ride.id, _ride_row(ride))
+
+    def load_riders(self) -> List[Rider]:
+        self.flush()
+        return [_rider_from_row(row) for row in self._reader().execute("SELECT * FROM riders")]
+
+    def load_drivers(self) -> List[Driver]:
+        self.flush()
+        histories: Dict[str, List[str]] = {}
+        for driver_id, ride_id in self._reader().execute(SELECT_DRIVER_HISTORIES):
+            histories.setdefault(driver_id, []).append(ride_id)
+        return [_driver_from_row(row, histories.get(row[0], []))
+                for row in self._reader().execute("SELECT * FROM drivers")]
+
+    def load_active_rides(self, riders: Dict[str, Rider], drivers: Dict[str, Driver]) -> List[Ride]:
+        self.flush()
+        rows = self._reader().execute(SELECT_ACTIVE_RIDES).fetchall()
+        return [self._ride_from_row(row, riders, drivers) for row in rows]
+
+    def get_ride(self, ride_id: str, riders: Optional[Dict[str, Rider]] = None,
+                 drivers: Optional[Dict[str, Driver]] = None) -> Optional[Ride]:
+        row = self._lookup("rides", ride_id)
+        return self._ride_from_row(row, riders or {}, drivers or {}) if row is not None else None
+
+    def find_rides(self, rider_id: Optional[str] = None, driver_id: Optional[str] = None,
+                   status: Optional[RideStatus] = None, since: Optional[datetime] = None,
+                   limit: Optional[int] = None, riders: Optional[Dict[str, Rider]] = None,
+                   drivers: Optional[Dict[str, Driver]] = None, before: Optional[str] = None) -> List[Ride]:
+        # Queries see every save made before them
+        self.flush()
+        clauses, parameters = [], []
+        for column, value in (("rider_id", rider_id), ("driver_id", driver_id),
+                              ("status", status.value if status else None)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                parameters.append(value)
+        _time_range(clauses, parameters, since, None)
+        # Pages come straight off the (column, id) indexes when IDs follow
+        # time; a time range is answered from request_time instead
+        order = "id" if ids.id_generator.sortable and since is None else "request_time"
+        if before is not None:
+            clauses.append("id < ?")
+            parameters.append(before)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT * FROM rides{where} ORDER BY {order} DESC LIMIT ?"
+        rows = self._reader().execute(sql, parameters + [limit if limit is not None else -1]).fetchall()
+        return [self._ride_from_row(row, riders or {}, drivers or {}) for row in rows]
+
+    def iter_ride_records(self, status: Optional[RideStatus] = None, since: Optional[datetime] = None,
+                          until: Optional[datetime] = None, batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        self.flush()
+        clauses, parameters = [], []
+        if status is not None:
+            clauses.append("status = ?")
+            parameters.append(status.value)
+        _time_range(clauses, parameters, since, until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        # A connection of its own: the generator may be resumed from other
+        # threads, and the read transaction gives it one consistent snapshot
+        connection = self._connect()
+        try:
+            cursor = connection.execute(f"{SELECT_RECORDS}{where} ORDER BY request_time", parameters)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    record = dict(zip(RIDE_RECORD_FIELDS, row))
+                    for field in ("request_time", "start_time", "end_time"):
+                        moment = _from_epoch(record[field])
+                        record[field] = moment.isoformat() if moment else None
+                    yield record
+        finally:
+            connection.close()
+
+    def flush(self) -> None:
+        """Write every queued row in one transaction"""
+        with self._flush_lock:
+            with self._pending_lock:
+                batch = self._pending
+                if not any(batch.values()):
+                    return
+                self._pending = {table: {} for table in UPSERTS}
+                # Reads keep seeing the batch until it is committed
+                self._flushing = batch
+
+            started = time.perf_counter()
+            try:
+                with self._writer:
+                    for table, rows in batch.items():
+                        upserts = [row for row in rows.values() if row is not None]
+                        deletes = [(row_id,) for row_id, row in rows.items() if row is None]
+                        if upserts:
+                            self._writer.executemany(UPSERTS[table], upserts)
+                        if deletes:
+                            self._writer.executemany(DELETES[table], deletes)
+            except Exception:
+                # The transaction rolled back; put the batch back in front of
+                # the queue, behind any newer save of the same rows
+                with self._pending_lock:
+                    for table, rows in batch.items():
+                        self._pending[table] = {**rows, **self._pending[table]}
+                    self._flushing = {table: {} for table in UPSERTS}
+                raise
+            for table, rows in batch.items():
+                if rows:
+                    ROWS_WRITTEN.inc(len(rows), (table,))
+            FLUSH_DURATION.observe(time.perf_counter() - started)
+
+            with self._pending_lock:
+                self._flushing = {table: {} for table in UPSERTS}
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        self._flusher.join()
+        self.flush()
+        self._writer.close()
+
+    def _queue(self, table: str, row_id: str, row: Optional[tuple]) -> None:
+        with self._pending_lock:
+            self._pending[table][row_id] = row
+            backlog = sum(len(rows) for rows in self._pending.values())
+        if backlog >= self.batch_size:
+            self._wake.set()
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Keep flushing; the failed batch is queued again for the next try
+                FLUSH_ERRORS.inc()
+                logger.exception("Failed to write a batch to %s", self.path)
+
+    def _lookup(self, table: str, row_id: str) -> Optional[tuple]:
+        with self._pending_lock:
+            for queued in (self._pending[table], self._flushing[table]):
+                if row_id in queued:
+                    return queued[row_id]
+        return self._reader().execute(SELECT_BY_ID[table], (row_id,)).fetchone()
+
+    def _reader(self) -> sqlite3.Connection:
+        try:
+            return self._readers.connection
+        except AttributeError:
+            connection = self._readers.connection = self._connect()
+            return connection
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only syncs at checkpoints: a crash can lose the
+        # last commits but never corrupts the database
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _ride_from_row(self, row: tuple, riders: Dict[str, Rider], drivers: Dict[str, Driver]) -> Ride:
+        (ride_id, rider_id, driver_id, vehicle_type, ride_type, status, pickup_lat, pickup_lon,
+         dropoff_lat, dropoff_lon, request_time, start_time, end_time, fare, distance,
+         pickup_eta_seconds, trace_started_at, trace, driven_distance, assigned_time) = row
+        rider = riders.get(rider_id) or self._load_user("riders", rider_id, _rider_from_row)
+        driver = None
+        if driver_id is not None:
+            driver = drivers.get(driver_id) or self._load_user("drivers", driver_id, self._driver_from_row)
+        return Ride.restore(
+            ride_id, rider, driver, (pickup_lat, pickup_lon), (dropoff_lat, dropoff_lon),
+            VehicleType(vehicle_type), RideType(ride_type), RideStatus(status),
+            _from_epoch(request_time), _from_epoch(start_time), _from_epoch(end_time),
+            fare, distance, pickup_eta_seconds,
+            TripTrace.restore(trace_started_at, trace, driven_distance) if trace is not None else None,
+            _from_epoch(assigned_time)
+        )
+
+    def _driver_from_row(self, row: tuple) -> Driver:
+        history = [ride[0] for ride in self._reader().execute(SELECT_DRIVER_HISTORY, (row[0],))]
+        return _driver_from_row(row, history)
+
+    def _load_user(self, table: str, user_id: str, build):
+        row = self._lookup(table, user_id)
+        if row is not None:
+            return build(row)
+        # Users are never deleted while they have rides, except drivers
+        # removed from the platform; keep their rides readable
+        if table == "riders":
+            return _placeholder(Rider("Unknown", ""), user_id)
+        return _placeholder(Driver("Unknown", "", Vehicle("", "", "", 1)), user_id)
+
+def _migrate(connection: sqlite3.Connection) -> None:
+    """Apply the migrations a database has not had yet"""
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    with connection:
+        for migration in MIGRATIONS[version:]:
+            migration(connection)
+        connection.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+
+def _columns(connection: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+
+def _placeholder(user, user_id: str):
+    user.id = user_id
+    return user
+
+def _rider_row(rider: Rider) -> tuple:
+    return (rider.id, rider.name, rider.phone, rider.default_location[0], rider.default_location[1],
+            rider.current_location[0], rider.current_location[1], json.dumps(rider.ride_history))
+
+def _driver_row(driver: Driver) -> tuple:
+    vehicle = driver.vehicle
+    return (driver.id, driver.name, driver.phone, vehicle.vehicle_id, vehicle.model, vehicle.vehicle_type,
+            vehicle.capacity, driver.current_location[0], driver.current_location[1],
+            int(driver.is_available), driver.rating, json.dumps(driver.stats.to_dict()))
+
+def _ride_row(ride: Ride) -> tuple:
+    trace = ride.trace
+    return (ride.id, ride.rider.id, ride.driver.id if ride.driver else None, ride.vehicle_type.value,
+            ride.ride_type.value, ride.status.value, ride.pickup_location[0], ride.pickup_location[1],
+            ride.dropoff_location[0], ride.dropoff_location[1], _to_epoch(ride.request_time),
+            _to_epoch(ride.start_time), _to_epoch(ride.end_time), ride.fare, ride.distance,
+            ride.pickup_eta_seconds, trace.started_at if trace else None,
+            trace.to_bytes() if trace else None, trace.distance_km if trace else None,
+            _to_epoch(ride.assigned_time))
+
+def _rider_from_row(row: tuple) -> Rider:
+    rider_id, name, phone, default_lat, default_lon, lat, lon, ride_history = row
+    rider = Rider(name, phone, (default_lat, default_lon))
+    rider.id = rider_id
+    rider.update_location((lat, lon))
+    rider.ride_history.extend(json.loads(ride_history))
+    return rider
+
+def _driver_from_row(row: tuple, ride_history: List[str]) -> Driver:
+    (driver_id, name, phone, vehicle_id, vehicle_model, vehicle_type, capacity,
+     lat, lon, is_available, rating, stats) = row
+    driver = Driver(name, phone, Vehicle(vehicle_id, vehicle_model, vehicle_type, capacity), (lat, lon))
+    driver.id = driver_id
+    driver.set_availability(bool(is_available))
+    driver.rating = rating
+    driver.ride_history.extend(ride_history)
+    driver.stats = DriverStats.from_dict(json.loads(stats))
+    return driver
+
+def _to_epoch(moment: Optional[datetime]) -> Optional[float]:
+    return moment.timestamp() if moment is not None else None
+
+def _from_epoch(seconds: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(seconds) if seconds is not None else None
+
+def _time_range(clauses: List[str], parameters: List[Any], since: Optional[datetime],
+                until: Optional[datetime]) -> None:
+    """Add request-time bounds to a query.
+
+    The bounds stay on request_time rather than on the ID's embedded time:
+    rides saved before time-ordered IDs keep their uuid4 IDs, which an ID
+    range would leave out.
+    """
+    if since is not None:
+        clauses.append("request_time >= ?")
+        parameters.append(since.timestamp())
+    if until is not None:
+        clauses.append("request_time < ?")
+        parameters.append(until.timestamp())
@@ -1,64 +1,222 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
-from models.user import Driver
-from models.ride import Ride
+from bisect import bisect_left
+from typing import Callable, Hashable, Iterator, List, Optional, Tuple
+import heapq
 import math
+from models.user import Driver
+from models.ride import Ride, VehicleType
+from spatial.driver_index import DriverSpatialIndex
+from spatial.geo import haversine_km
+from routing.engine import routing_engine
+from routing.eta import eta_service
+from strategies.search_radius import search_radius
+
+# Maximum pickup distance in kilometers per vehicle type; bikes and autos
+# are slow over long pickups, SUVs are scarce enough to fetch from further
+MAX_MATCH_DISTANCE_BY_TYPE = {
+    VehicleType.BIKE.value: 5.0,
+    VehicleType.AUTO_RICKSHAW.value: 8.0,
+    VehicleType.SEDAN.value: 10.0,
+    VehicleType.SUV.value: 15.0
+}
+
+# Maximum pickup distance of any vehicle type
+MAX_MATCH_DISTANCE_KM = max(MAX_MATCH_DISTANCE_BY_TYPE.values())
+
+def max_match_distance(vehicle_type: str) -> float:
+    """Maximum pickup distance in kilometers for a vehicle type"""
+    return MAX_MATCH_DISTANCE_BY_TYPE.get(vehicle_type, MAX_MATCH_DISTANCE_KM)
 
 class DriverMatchingStrategy(ABC):
     """Abstract strategy for matching drivers to rides"""
     
+    candidates_scanned = 0  # Drivers looked at by the last find_driver call
+    
     @abstractmethod
-    def find_driver(self, ride: Ride, available_drivers: List[Driver]) -> Optional[Driver]:
-        """Find the best driver for a ride based on the strategy"""
+    def find_driver(self, ride: Ride, available_drivers: List[Driver],
+                    driver_index: Optional[DriverSpatialIndex] = None) -> Optional[Driver]:
+        """Find the best driver for a ride based on the strategy.
+        
+        driver_index, when given, indexes the same drivers as available_drivers
+        and may be used instead of scanning the list.
+        """
         pass
     
-    def _is_within_range(self, driver_location, pickup_location, ride, max_distance=10.0):
-        """Check if driver is within max_distance km of pickup location using Haversine distance"""
-        # Use the ride's _calculate_distance method which implements Haversine formula
+    def find_drivers(self, ride: Ride, available_drivers: List[Driver],
+                     driver_index: Optional[DriverSpatialIndex] = None, k: int = 1) -> List[Driver]:
+        """Find up to k drivers for a ride, best first, e.g. to offer it to several at once"""
+        driver = self.find_driver(ride, available_drivers, driver_index)
+        return [driver] if driver else []
+    
+    def _is_within_range(self, driver_location, pickup_location, ride, max_distance=None):
+        """Check if driver is within max_distance km of pickup location by road"""
+        if max_distance is None:
+            max_distance = max_match_distance(ride.vehicle_type.value)
+        # Use the ride's _calculate_distance method, which routes over the road graph
         return ride._calculate_distance(driver_location, pickup_location) <= max_distance
-
-class NearestDriverStrategy(DriverMatchingStrategy):
-    """Strategy that matches the nearest available driver within 10km"""
     
-    def find_driver(self, ride: Ride, available_drivers: List[Driver]) -> Optional[Driver]:
-        if not available_drivers:
-            return None
+    def _pickup_distances(self, drivers: List[Driver], ride: Ride) -> List[float]:
+        """Road distance from each driver to the pickup, infinity when out of range"""
+        # One one-to-many query instead of a route per driver
+        return routing_engine.distances_to([driver.get_location() for driver in drivers],
+                                           ride.pickup_location, max_match_distance(ride.vehicle_type.value))
+    
+    def _rings(self, ride: Ride, available_drivers: List[Driver], driver_index: Optional[DriverSpatialIndex],
+               search: Hashable) -> Iterator[Tuple[float, List[Driver]]]:
+        """Yield (radius, drivers newly within it by straight line) for growing radii"""
+        vehicle_type = ride.vehicle_type.value
+        radii = search_radius.rings(ride.pickup_location, vehicle_type, max_match_distance(vehicle_type), search)
+        if driver_index is not None:
+            for radius, found in driver_index.rings(ride.pickup_location, vehicle_type, radii):
+                yield radius, [driver for driver, _ in found]
+            return
         
-        # Filter drivers by vehicle type and range (10km)
-        matching_drivers = [
-            driver for driver in available_drivers 
-            if driver.vehicle.vehicle_type == ride.vehicle_type.value and
-            self._is_within_range(driver.get_location(), ride.pickup_location, ride)
-        ]
+        # Same rings over the list: one straight-line pass sorts drivers into
+        # rings, and only a ring that gets searched is ordered
+        rings: List[List[Tuple[float, int, Driver]]] = [[] for _ in radii]
+        for position, driver in enumerate(available_drivers):
+            if driver.vehicle.vehicle_type == vehicle_type:
+                distance = haversine_km(driver.get_location(), ride.pickup_location)
+                ring = bisect_left(radii, distance)
+                if ring < len(radii):
+                    rings[ring].append((distance, position, driver))
+        for radius, ring in zip(radii, rings):
+            ring.sort(key=lambda item: (item[0], item[1]))
+            yield radius, [driver for _, _, driver in ring]
+    
+    def _expanding_search(self, ride: Ride, available_drivers: List[Driver],
+                          driver_index: Optional[DriverSpatialIndex], k: int,
+                          measure: Callable[[List[Driver]], List[float]],
+                          bound: Callable[[float], float]) -> List[Tuple[float, Driver]]:
+        """Find the k drivers with the lowest measure, searching outward ring by ring.
         
-        if not matching_drivers:
-            return None
+        measure scores a ring's drivers (infinity when out of range) and bound(r)
+        is the lowest score a driver beyond r by straight line could have. Once k
+        scores are within the bound of the current ring, no wider ring can beat
+        them, so the search stops there; the radius it reached is fed back as
+        the region's learned starting radius.
+        """
+        # Each strategy and k learns its own starting radius
+        search = (type(self).__name__, k)
+        found: List[Tuple[float, Driver]] = []
+        scanned = 0
+        reached = 0.0
+        for radius, drivers in self._rings(ride, available_drivers, driver_index, search):
+            reached = radius
+            if drivers:
+                scanned += len(drivers)
+                found.extend((score, driver) for score, driver in zip(measure(drivers), drivers)
+                             if score != math.inf)
+            if sum(1 for score, _ in found if score <= bound(radius)) >= k:
+                break
         
-        # Find the nearest driver using ride's Haversine distance calculation
-        nearest_driver = min(matching_drivers, 
-                            key=lambda driver: ride._calculate_distance(
-                                driver.get_location(), ride.pickup_location))
+        self.candidates_scanned = scanned
+        search_radius.record(ride.pickup_location, ride.vehicle_type.value, reached, search)
+        # Ties keep ring order, i.e. the nearer driver by straight line first
+        return heapq.nsmallest(k, found, key=lambda pair: pair[0])
+
+class NearestDriverStrategy(DriverMatchingStrategy):
+    """Strategy that matches the nearest available driver within range"""
+    
+    def find_driver(self, ride: Ride, available_drivers: List[Driver],
+                    driver_index: Optional[DriverSpatialIndex] = None) -> Optional[Driver]:
+        drivers = self.find_drivers(ride, available_drivers, driver_index)
+        return drivers[0] if drivers else None
+    
+    def find_drivers(self, ride: Ride, available_drivers: List[Driver],
+                     driver_index: Optional[DriverSpatialIndex] = None, k: int = 1) -> List[Driver]:
+        self.candidates_scanned = 0
+        if not available_drivers:
+            return []
         
-        return nearest_driver
+        # Routes are never shorter than the straight line (the road graph
+        # raises shorter edges), so a driver beyond the ring is at least the
+        # ring's radius away by road
+        nearest = self._expanding_search(ride, available_drivers, driver_index, k,
+                                         lambda drivers: self._pickup_distances(drivers, ride),
+                                         lambda radius: radius)
+        return [driver for _, driver in nearest]
 
 class HighestRatedDriverStrategy(DriverMatchingStrategy):
-    """Strategy that matches the highest rated available driver within 10km"""
+    """Strategy that matches the highest rated available driver within range"""
+    
+    def find_driver(self, ride: Ride, available_drivers: List[Driver],
+                    driver_index: Optional[DriverSpatialIndex] = None) -> Optional[Driver]:
+        drivers = self.find_drivers(ride, available_drivers, driver_index)
+        return drivers[0] if drivers else None
     
-    def find_driver(self, ride: Ride, available_drivers: List[Driver]) -> Optional[Driver]:
+    def find_drivers(self, ride: Ride, available_drivers: List[Driver],
+                     driver_index: Optional[DriverSpatialIndex] = None, k: int = 1) -> List[Driver]:
+        self.candidates_scanned = 0
         if not available_drivers:
-            return None
+            return []
         
-        # Filter drivers by vehicle type and range (10km)
+        # Only visit the cells in range, in per-cell rating order
+        if driver_index is not None:
+            return self._find_in_index(ride, driver_index, k)
+        
+        self.candidates_scanned = len(available_drivers)
+        # Filter drivers by vehicle type and range
         matching_drivers = [
             driver for driver in available_drivers 
-            if driver.vehicle.vehicle_type == ride.vehicle_type.value and
-            self._is_within_range(driver.get_location(), ride.pickup_location, ride)
+            if driver.vehicle.vehicle_type == ride.vehicle_type.value
+        ]
+        matching_drivers = [
+            driver
+            for distance, driver in zip(self._pickup_distances(matching_drivers, ride), matching_drivers)
+            if distance != math.inf
         ]
         
-        if not matching_drivers:
-            return None
-        
-        # Find the highest rated driver
-        highest_rated_driver = max(matching_drivers, key=lambda driver: driver.rating)
+        # Highest rated drivers first; ties keep pool order
+        return heapq.nlargest(k, matching_drivers, key=lambda driver: driver.rating)
+    
+    def _find_in_index(self, ride: Ride, driver_index: DriverSpatialIndex, k: int) -> List[Driver]:
+        """Walk the index in rating order until k drivers are in range by road"""
+        max_km = max_match_distance(ride.vehicle_type.value)
+        batch = k if not routing_engine.loaded else 8 * k
+        while True:
+            # The index only knows straight-line distance, which never exceeds
+            # the road distance, so its candidates are a superset of the answer
+            matches = driver_index.highest_rated(ride.pickup_location, ride.vehicle_type.value, max_km, k=batch)
+            self.candidates_scanned = driver_index.last_visited
+            drivers = [driver for driver, _ in matches]
+            if not routing_engine.loaded:
+                return drivers
+            
+            in_range = [driver for distance, driver in zip(self._pickup_distances(drivers, ride), drivers)
+                        if distance != math.inf]
+            if len(in_range) >= k or len(matches) < batch:
+                return in_range[:k]
+            batch *= 8
+
+class FastestArrivalDriverStrategy(DriverMatchingStrategy):
+    """Strategy that matches the available driver with the earliest pickup ETA within range"""
+    
+    def find_driver(self, ride: Ride, available_drivers: List[Driver],
+                    driver_index: Optional[DriverSpatialIndex] = None) -> Optional[Driver]:
+        drivers = self.find_drivers(ride, available_drivers, driver_index)
+        return drivers[0] if drivers else None
+    
+    def find_drivers(self, ride: Ride, available_drivers: List[Driver],
+                     driver_index: Optional[DriverSpatialIndex] = None, k: int = 1) -> List[Driver]:
+        self.candidates_scanned = 0
+        if not available_drivers:
+            return []
         
-        return highest_rated_driver 
\ No newline at end of file
+        max_km = max_match_distance(ride.vehicle_type.value)
+        # One one-to-many query per ring; per-cell speeds turn road distances
+        # into times, and no driver beyond a ring arrives sooner than the ring's
+        # radius at the fastest speed ever observed
+        fastest = self._expanding_search(
+            ride, available_drivers, driver_index, k,
+            lambda drivers: eta_service.etas_to([driver.get_location() for driver in drivers],
+                                                ride.pickup_location, max_km),
+            lambda radius: radius / eta_service.grid.fastest_kmh * 3600)
+        return [driver for _, driver in fastest]
+
+# Matching strategies by API name, for callers that pick one from a string
+MATCHING_STRATEGIES = {
+    "NEAREST": NearestDriverStrategy,
+    "HIGHEST_RATED": HighestRatedDriverStrategy,
+    "FASTEST_ARRIVAL": FastestArrivalDriverStrategy
+}
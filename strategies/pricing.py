@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
+from typing import Optional, Tuple
 from models.ride import Ride, VehicleType
+from spatial.zones import ZoneIndex, RATE_CARD, zone_index
 
 class PricingStrategy(ABC):
     """Abstract strategy for calculating ride fare"""
@@ -16,8 +18,8 @@ class BasePricingStrategy(PricingStrategy):
         # Base fare by vehicle type
         base_fare = self._get_base_fare(ride.vehicle_type)
         
-        # Distance-based fare
-        distance_fare = ride.distance * self._get_per_km_rate(ride.vehicle_type)
+        # Distance-based fare, on the distance actually driven once the trip was traced
+        distance_fare = ride.billable_distance * self._get_per_km_rate(ride.vehicle_type)
         
         return base_fare + distance_fare
     
@@ -41,6 +43,37 @@ class BasePricingStrategy(PricingStrategy):
         }
         return per_km_rates.get(vehicle_type, 12.0)  # Default to SEDAN if type not found
 
+class ZonePricingStrategy(BasePricingStrategy):
+    """Base pricing with the rate card of the pickup's zone and the surcharges of airport zones"""
+    
+    def __init__(self, zones: Optional[ZoneIndex] = None):
+        self.zones = zones if zones is not None else zone_index
+    
+    def calculate_fare(self, ride: Ride) -> float:
+        distance_fare = ride.billable_distance * self.per_km_rate_for(ride)
+        return self.base_fare_for(ride) + distance_fare + self.surcharge_for(ride)
+    
+    def base_fare_for(self, ride: Ride) -> float:
+        """Base fare from the pickup zone's rate card, or by vehicle type outside any"""
+        card = self.zones.zone_of_kind(ride.pickup_location, RATE_CARD)
+        if card is not None and ride.vehicle_type.name in card.base_fares:
+            return card.base_fares[ride.vehicle_type.name]
+        return self._get_base_fare(ride.vehicle_type)
+    
+    def per_km_rate_for(self, ride: Ride) -> float:
+        """Per kilometer rate from the pickup zone's rate card, or by vehicle type outside any"""
+        card = self.zones.zone_of_kind(ride.pickup_location, RATE_CARD)
+        if card is not None and ride.vehicle_type.name in card.per_km_rates:
+            return card.per_km_rates[ride.vehicle_type.name]
+        return self._get_per_km_rate(ride.vehicle_type)
+    
+    def surcharge_for(self, ride: Ride) -> float:
+        """Largest zone surcharge at the pickup plus the largest at the dropoff"""
+        return self._surcharge_at(ride.pickup_location) + self._surcharge_at(ride.dropoff_location)
+    
+    def _surcharge_at(self, location: Tuple[float, float]) -> float:
+        return max((zone.surcharge for zone in self.zones.zones_at(location)), default=0.0)
+
 # Decorator pattern for pricing modifiers
 class PricingDecorator(PricingStrategy):
     """Base decorator for pricing strategies"""
@@ -69,4 +102,14 @@ class DiscountDecorator(PricingDecorator):
     def calculate_fare(self, ride: Ride) -> float:
         base_fare = self.wrapped_strategy.calculate_fare(ride)
         discount = (self.discount_percentage / 100) * base_fare
-        return base_fare - discount 
\ No newline at end of file
+        return base_fare - discount 
+
+def pricing_strategy_for(name: str, surge_multiplier: Optional[float] = None,
+                         discount_percentage: Optional[float] = None) -> PricingStrategy:
+    """Zone pricing with the adjustment an API name picks: BASE, SURGE or DISCOUNT"""
+    base_strategy = ZonePricingStrategy()
+    if name == "SURGE":
+        return SurgePricingDecorator(base_strategy, surge_multiplier or 1.5)
+    if name == "DISCOUNT":
+        return DiscountDecorator(base_strategy, discount_percentage or 10.0)
+    return base_strategy
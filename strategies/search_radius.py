@@ -0,0 +1,66 @@
+from typing import Dict, Hashable, List, Tuple
+import math
+import threading
+
+CellKey = Tuple[Hashable, str, int, int]  # (search, vehicle type, region row, region column)
+
+class SearchRadius:
+    """Starting radius of expanding driver searches, learned per region and vehicle type.
+
+    Each region keeps a moving average of the radius at which its searches
+    found enough drivers. Searches start a ring below that average, so a dense
+    downtown settles on small rings while a suburb starts wide instead of
+    working outward from scratch every time. Averages are kept per kind of
+    search, since one after five candidates reaches further than one after
+    the single nearest driver.
+    """
+
+    def __init__(self, cell_size: float = 0.05, default_km: float = 1.0, min_km: float = 0.5,
+                 growth: float = 2.0, smoothing: float = 0.2):
+        self.cell_size = cell_size  # Region edge in degrees
+        self.default_km = default_km  # First ring where nothing has been learned yet
+        self.min_km = min_km
+        self.growth = growth  # Each ring's radius over the previous one's
+        self.smoothing = smoothing  # Weight of the latest search in the average
+        self._radii: Dict[CellKey, float] = {}
+        self._lock = threading.Lock()
+
+    def start_km(self, location: Tuple[float, float], vehicle_type: str, cap: float,
+                 search: Hashable = None) -> float:
+        """Radius of the first ring for a search around location"""
+        learned = self._radii.get(self._key(location, vehicle_type, search))
+        start = learned / self.growth if learned is not None else self.default_km
+        return min(cap, max(self.min_km, start))
+
+    def rings(self, location: Tuple[float, float], vehicle_type: str, cap: float,
+              search: Hashable = None) -> List[float]:
+        """Radii to search in turn, growing from the learned start up to cap"""
+        radius = self.start_km(location, vehicle_type, cap, search)
+        radii = []
+        while radius < cap:
+            radii.append(radius)
+            radius *= self.growth
+        radii.append(cap)
+        return radii
+
+    def record(self, location: Tuple[float, float], vehicle_type: str, radius_km: float,
+               search: Hashable = None) -> None:
+        """Fold in the radius a search around location had to reach"""
+        key = self._key(location, vehicle_type, search)
+        with self._lock:
+            learned = self._radii.get(key)
+            self._radii[key] = radius_km if learned is None else learned + self.smoothing * (radius_km - learned)
+
+    def learned_km(self, location: Tuple[float, float], vehicle_type: str, search: Hashable = None) -> float:
+        """Average radius searches around location reached, 0 before any"""
+        return self._radii.get(self._key(location, vehicle_type, search), 0.0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._radii.clear()
+
+    def _key(self, location: Tuple[float, float], vehicle_type: str, search: Hashable) -> CellKey:
+        return (search, vehicle_type, math.floor(location[0] / self.cell_size), math.floor(location[1] / self.cell_size))
+
+# Process-wide radius statistics shared by every matching strategy
+search_radius = SearchRadius()
@@ -2,10 +2,56 @@ import unittest
 from models.user import Rider, Driver, Vehicle
 from models.ride import Ride, VehicleType, RideStatus
 from strategies.driver_matching import NearestDriverStrategy, HighestRatedDriverStrategy
+from strategies.driver_matching import FastestArrivalDriverStrategy, max_match_distance
 from strategies.pricing import BasePricingStrategy, SurgePricingDecorator, DiscountDecorator
-from managers.ride_manager import RideManager
+from strategies.pricing import ZonePricingStrategy
+from strategies.search_radius import SearchRadius, search_radius
+from managers.ride_manager import RideManager, MATCH_CANDIDATES
 from managers.user_manager import UserManager
 from factories.ride_factory import RideFactory
+from models import ids
+from models.ids import SnowflakeIdGenerator, UuidIdGenerator, decode_id, id_timestamp
+from models.offer import OfferStatus
+from models.stats import FleetStats, RollingWindow, fleet_stats
+from models.trace import TripTrace
+from spatial.driver_index import DriverSpatialIndex
+from spatial.geo import EARTH_RADIUS_KM, KM_PER_DEGREE_LAT, degree_span, haversine_km
+from spatial.rtree import RTree
+from spatial.viewport import Viewport, cluster_points
+from spatial.zones import Zone, ZoneError, ZoneIndex, PreparedPolygon, zone_index
+from routing.graph import RoadGraph
+from routing.engine import RoutingEngine, dijkstra, routing_engine
+from routing.eta import EtaService, SpeedGrid, eta_service
+from api.idempotency import IdempotencyCache, IdempotencyConflict
+from api.admission import AdmissionController, AdmissionRejected
+from api.workers import WorkerPool
+from api.response_cache import ResponseCache
+from api.single_flight import SingleFlight, COALESCED_REQUESTS, quantize
+from observers.change_log import ChangeLog, change_log
+from storage.sqlite import SQLiteRepository, ROWS_WRITTEN, FLUSH_ERRORS, MIGRATIONS, SCHEMA
+from storage.export import export_chunks, ndjson_chunks, csv_chunks
+from storage.bulk_import import import_drivers, import_riders
+from sharding.shard_map import GeoShardMap
+from sharding.router import ShardError, ShardRouter
+from simulation.clock import EventClock
+from simulation.simulator import SimulationConfig, CitySimulator
+from benchmarks.load import LoadGenerator, make_client, parse_mix
+from monitoring.metrics import MetricsRegistry
+from monitoring.profiler import Profiler
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+import asyncio
+import csv
+import gzip
+import io
+import json
+import math
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
 
 class TestRideSharingPlatform(unittest.TestCase):
     
@@ -131,6 +177,21 @@ class TestRideSharingPlatform(unittest.TestCase):
         self.assertAlmostEqual(surge_fare / base_fare, 1.5, places=1)
         self.assertAlmostEqual(discount_fare / base_fare, 0.9, places=1)
     
+    def test_strategies_given_per_request(self):
+        """Test strategies passed with a request apply to that ride only"""
+        self.ride_manager.set_pricing_strategy(BasePricingStrategy())
+        surge = SurgePricingDecorator(BasePricingStrategy(), 2.0)
+        ride1 = self.ride_manager.request_ride(self.rider1, self.pickup_location, self.dropoff_location,
+                                               VehicleType.SEDAN, NearestDriverStrategy(), surge)
+        ride2 = self.ride_manager.request_ride(self.rider2, self.pickup_location, self.dropoff_location,
+                                               VehicleType.SUV)
+        self.assertIsInstance(self.ride_manager.pricing_strategy, BasePricingStrategy)
+        
+        self.ride_manager.complete_ride(ride1.id)
+        self.ride_manager.complete_ride(ride2.id)
+        self.assertAlmostEqual(ride1.fare, BasePricingStrategy().calculate_fare(ride1) * 2.0)
+        self.assertAlmostEqual(ride2.fare, BasePricingStrategy().calculate_fare(ride2))
+    
     def test_ride_factory(self):
         """Test the ride factory creates appropriate ride types"""
         regular_ride = RideFactory.create_regular_ride(self.rider1, self.pickup_location, self.dropoff_location, VehicleType.SEDAN)
@@ -143,5 +204,1900 @@ class TestRideSharingPlatform(unittest.TestCase):
         bike_carpool = RideFactory.create_carpool_ride(self.rider1, self.pickup_location, self.dropoff_location, VehicleType.BIKE)
         self.assertEqual(bike_carpool.vehicle_type, VehicleType.SEDAN)  # Should default to sedan
 
+class TestDriverSpatialIndex(unittest.TestCase):
+    
+    def setUp(self):
+        self.index = DriverSpatialIndex()
+        self.pickup_location = (40.7128, -74.0060)
+    
+    def _make_driver(self, name, location, vehicle_type=VehicleType.SEDAN.value, rating=4.5):
+        driver = Driver(name, "000-000-0000", Vehicle(name, "Test Car", vehicle_type, 4), location)
+        driver.rating = rating
+        return driver
+    
+    def test_highest_rated_matches_full_scan(self):
+        """Test the index returns the same driver as scanning every available driver"""
+        rng = random.Random(42)
+        drivers = [
+            self._make_driver(f"D{i}", (40.7128 + rng.uniform(-0.3, 0.3), -74.0060 + rng.uniform(-0.3, 0.3)),
+                              rng.choice([VehicleType.SEDAN.value, VehicleType.SUV.value]),
+                              round(rng.uniform(3.0, 5.0), 2))
+            for i in range(500)
+        ]
+        for driver in drivers:
+            self.index.add(driver)
+        
+        ride = Ride(Rider("R", "111"), self.pickup_location, (40.8, -73.9), VehicleType.SEDAN)
+        strategy = HighestRatedDriverStrategy()
+        self.assertIs(strategy.find_driver(ride, drivers, self.index), strategy.find_driver(ride, drivers))
+        
+        top = self.index.highest_rated(self.pickup_location, VehicleType.SEDAN.value, 10.0, k=5)
+        ratings = [driver.rating for driver, _ in top]
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+        self.assertTrue(all(distance <= 10.0 for _, distance in top))
+    
+    def test_index_tracks_rating_location_and_removal(self):
+        """Test rating and location updates re-position drivers in the index"""
+        near = self._make_driver("Near", (40.7200, -74.0000), rating=4.0)
+        far = self._make_driver("Far", (40.7500, -73.9900), rating=4.2)
+        self.index.add(near)
+        self.index.add(far)
+        
+        best = lambda: self.index.highest_rated(self.pickup_location, VehicleType.SEDAN.value, 10.0)[0][0]
+        self.assertIs(best(), far)
+        
+        near.rating = 4.9
+        self.assertIs(best(), near)
+        
+        near.update_location((41.5, -74.0))  # Out of range
+        self.assertIs(best(), far)
+        
+        self.index.remove(far)
+        self.assertEqual(self.index.highest_rated(self.pickup_location, VehicleType.SEDAN.value, 10.0), [])
+        self.assertNotIn(self.index, far._observers)
+    
+    def test_degree_span_reaches_the_search_radius(self):
+        """Test the degree box around a location reaches exactly the haversine search radius"""
+        for latitude in (0.0, 40.7128, 60.0):
+            lat_span, lon_span = degree_span(latitude, 10.0)
+            self.assertAlmostEqual(haversine_km((latitude, 0.0), (latitude + lat_span, 0.0)), 10.0, places=9)
+            # The circle's widest longitude is on the poleward side of its centre
+            widest_latitude = math.degrees(math.asin(math.sin(math.radians(latitude))
+                                                     / math.cos(10.0 / EARTH_RADIUS_KM)))
+            self.assertAlmostEqual(haversine_km((latitude, 0.0), (widest_latitude, lon_span)), 10.0, places=9)
+            self.assertGreaterEqual(lon_span, 10.0 / (KM_PER_DEGREE_LAT * math.cos(math.radians(latitude))))
+
+class TestIdempotencyCache(unittest.TestCase):
+    
+    def setUp(self):
+        self.now = 0.0
+        self.cache = IdempotencyCache(max_entries=2, ttl_seconds=10.0, clock=lambda: self.now)
+    
+    def test_replay_and_conflict(self):
+        """Test a stored response is replayed and a reused key with a new request is rejected"""
+        self.cache.put(("request_ride", "k1"), "body", "response")
+        self.assertEqual(self.cache.get(("request_ride", "k1"), "body"), "response")
+        self.assertIsNone(self.cache.get(("cancel_ride", "k1"), "body"))
+        with self.assertRaises(IdempotencyConflict):
+            self.cache.get(("request_ride", "k1"), "other body")
+    
+    def test_ttl_and_size_bound(self):
+        """Test entries expire after the TTL and the oldest are evicted past max_entries"""
+        self.cache.put("a", "", 1)
+        self.now = 5.0
+        self.cache.put("b", "", 2)
+        self.cache.put("c", "", 3)
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get("a", ""))
+        
+        self.now = 12.0
+        self.cache.put("d", "", 4)
+        self.assertIsNone(self.cache.get("b", ""))
+        self.assertEqual(self.cache.get("c", ""), 3)
+    
+    def test_first_request_giving_up_leaves_retries_waiting(self):
+        """Test cancelling the first request for a key neither cancels its work nor its retries"""
+        async def scenario():
+            release = asyncio.Event()
+            calls = []
+            
+            async def compute():
+                calls.append(1)
+                await release.wait()
+                return "response"
+            
+            first = asyncio.ensure_future(self.cache.run("k", "body", compute))
+            await asyncio.sleep(0)
+            retry = asyncio.ensure_future(self.cache.run("k", "body", compute))
+            await asyncio.sleep(0)
+            first.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            self.assertEqual(await retry, "response")
+            self.assertTrue(first.cancelled())
+            self.assertEqual(len(calls), 1)
+        
+        asyncio.run(scenario())
+        self.assertEqual(self.cache.get("k", "body"), "response")
+
+class TestAdmissionController(unittest.TestCase):
+    
+    def setUp(self):
+        self.now = 0.0
+        self.controller = AdmissionController(default_concurrency=1, queue_delay_target=0.5,
+                                              rider_rate=1.0, rider_burst=2.0, clock=lambda: self.now)
+    
+    def test_rider_rate_limit(self):
+        """Test a rider past their token bucket is rejected with 429 until it refills"""
+        async def scenario():
+            for _ in range(2):
+                async with self.controller.admit("request_ride", "rider-1"):
+                    pass
+            with self.assertRaises(AdmissionRejected) as rejected:
+                await self.controller.acquire("request_ride", "rider-1")
+            self.assertEqual(rejected.exception.status_code, 429)
+            self.assertEqual(rejected.exception.retry_after_header, "1")
+            
+            # Other riders have their own bucket, and tokens refill over time
+            async with self.controller.admit("request_ride", "rider-2"):
+                pass
+            self.now = 1.0
+            async with self.controller.admit("request_ride", "rider-1"):
+                pass
+        
+        asyncio.run(scenario())
+        self.assertEqual(self.controller.stats()["request_ride"]["rejected_rate_limited"], 1)
+    
+    def test_sheds_when_queueing_delay_exceeds_target(self):
+        """Test requests are shed with 503 once the expected queueing delay passes the target"""
+        async def scenario():
+            state = await self.controller.acquire("request_ride")
+            self.controller.release(state, 5.0)  # Slow requests raise the service time estimate
+            
+            state = await self.controller.acquire("request_ride")
+            with self.assertRaises(AdmissionRejected) as rejected:
+                await self.controller.acquire("request_ride")
+            self.assertEqual(rejected.exception.status_code, 503)
+            self.controller.release(state, 0.0)
+        
+        asyncio.run(scenario())
+        stats = self.controller.stats()["request_ride"]
+        self.assertEqual((stats["accepted"], stats["rejected_overloaded"], stats["in_flight"]), (2, 1, 0))
+
+class TestWorkerPool(unittest.TestCase):
+    
+    def test_concurrent_jobs_in_a_region_share_one_pool_task(self):
+        """Test jobs queued for the same region run in a single batch, in order"""
+        pool = WorkerPool("thread", max_workers=1)
+        release = threading.Event()
+        order = []
+        
+        def job(name):
+            if name == "bad":
+                raise ValueError("no driver")
+            order.append(name)
+            return name
+        
+        async def scenario():
+            # Keep the only worker busy so the region jobs pile up behind it
+            blocker = asyncio.ensure_future(pool.run(release.wait))
+            jobs = [asyncio.ensure_future(pool.run_coalesced((1, 1), job, name)) for name in ["a", "bad", "b"]]
+            other = asyncio.ensure_future(pool.run_coalesced((2, 2), job, "c"))
+            await asyncio.sleep(0)
+            release.set()
+            await blocker
+            results = await asyncio.gather(*jobs, other, return_exceptions=True)
+            return results
+        
+        results = asyncio.run(scenario())
+        self.assertEqual(results[0], "a")
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2:], ["b", "c"])
+        self.assertEqual(order, ["a", "b", "c"])
+        self.assertEqual(pool.stats()["batches_run"], 2)
+        self.assertEqual(pool.stats()["jobs_coalesced"], 2)
+    
+    def test_process_pool_loads_zones_itself(self):
+        """Test process pool workers load the zones file rather than rely on inheriting them"""
+        # Load the whole app first, so every router shares the same managers
+        import api.main
+        from api.routers.rides import FareEstimateRequest, calculate_estimate
+        
+        feature = {"type": "Feature", "properties": {"id": "city", "name": "City"},
+                   "geometry": {"type": "Polygon",
+                                "coordinates": [[[-75.0, 40.0], [-73.0, 40.0], [-73.0, 41.0], [-75.0, 41.0]]]}}
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "zones.geojson")
+            with open(path, "w") as f:
+                json.dump({"type": "FeatureCollection", "features": [feature]}, f)
+            
+            pool = WorkerPool("process", max_workers=1, zones_path=path)
+            request = FareEstimateRequest(pickup_location=(40.71, -74.0), dropoff_location=(40.75, -74.0))
+            try:
+                estimate = asyncio.run(pool.run_isolated(calculate_estimate, request))
+            finally:
+                pool._processes.shutdown()
+        
+        self.assertEqual(zone_index.zones_at((40.71, -74.0)), [])
+        self.assertEqual(estimate.pickup_zones, ["City"])
+
+class TestGeoSharding(unittest.TestCase):
+    
+    def test_shard_map_bands_and_border_neighbours(self):
+        """Test locations map to longitude bands and border pickups see the next band"""
+        shard_map = GeoShardMap.even(3, -74.3, -73.7)
+        self.assertEqual(shard_map.shard_count, 3)
+        self.assertEqual(shard_map.shard_for((40.7, -74.25)), 0)
+        self.assertEqual(shard_map.shard_for((40.7, -73.75)), 2)
+        self.assertEqual(shard_map.shards_near((40.7, -74.25), 1.0), [0])
+        self.assertEqual(shard_map.shards_near((40.7, -74.101), 10.0), [0, 1])
+    
+    def test_cross_shard_matching_hands_driver_over(self):
+        """Test a pickup near a border is matched with the nearer driver from the next shard"""
+        with ShardRouter(GeoShardMap([-74.0])) as router:
+            rider_id = router.register_rider("Rider", "111", (40.7128, -74.0060))
+            far_id = router.register_driver("Far", "222", "CAR1", "Car", "SEDAN", 4, (40.7600, -74.0400))
+            near_id = router.register_driver("Near", "333", "CAR2", "Car", "SEDAN", 4, (40.7130, -73.9990))
+            
+            ride = router.request_ride(rider_id, (40.7128, -74.0010), (40.8000, -74.0500))
+            self.assertEqual(ride["driver_id"], near_id)
+            self.assertEqual(router.handoffs, 1)
+            
+            for step in (router.start_ride, router.pickup_rider, router.complete_ride):
+                self.assertTrue(step(ride["id"]))
+            self.assertEqual(router.get_ride(ride["id"])["status"], RideStatus.COMPLETED.value)
+            
+            # An idle driver crossing the border moves to the other shard
+            router.update_driver_location(far_id, (40.7600, -73.9500))
+            self.assertEqual([stats["drivers"] for stats in router.stats()], [1, 1])
+    
+    def test_failed_rider_copy_is_retried(self):
+        """Test a shard that failed to take a rider gets it again on the next request"""
+        with ShardRouter(GeoShardMap([])) as router:
+            rider_id = router.register_rider("Rider", "111", (40.7128, -74.0060))
+            driver_id = router.register_driver("Driver", "222", "CAR1", "Car", "SEDAN", 4, (40.7130, -74.0050))
+            shard = router._shards[0]
+            call = shard.call
+            
+            def failing_call(command, *args):
+                if command == "add_rider":
+                    raise ShardError("Shard 0 failed on add_rider")
+                return call(command, *args)
+            
+            shard.call = failing_call
+            with self.assertRaises(ShardError):
+                router.request_ride(rider_id, (40.7128, -74.0060), (40.8000, -74.0500))
+            shard.call = call
+            
+            ride = router.request_ride(rider_id, (40.7128, -74.0060), (40.8000, -74.0500))
+            self.assertEqual(ride["rider_id"], rider_id)
+            self.assertEqual(ride["driver_id"], driver_id)
+    
+    def test_http_routes_run_on_shards(self):
+        """Test the sharded HTTP routes match a ride across a border and walk it to completion"""
+        # Load the whole app first, so the sharded routes share its admission controller
+        import api.main
+        from api.routers import sharded
+        from fastapi import FastAPI
+        import httpx
+        
+        app = FastAPI()
+        app.include_router(sharded.riders_router, prefix="/api/riders")
+        app.include_router(sharded.drivers_router, prefix="/api/drivers")
+        app.include_router(sharded.rides_router, prefix="/api/rides")
+        
+        async def scenario():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://shards") as client:
+                rider = (await client.post("/api/riders/", json={
+                    "name": "Rider", "phone": "111", "default_location": [40.7128, -74.0060]})).json()
+                driver = (await client.post("/api/drivers/", json={
+                    "name": "Near", "phone": "333", "current_location": [40.7130, -73.9990],
+                    "vehicle": {"vehicle_id": "CAR2", "model": "Car", "vehicle_type": "SEDAN", "capacity": 4}
+                })).json()
+                response = await client.post("/api/rides/", json={
+                    "rider_id": rider["id"], "pickup_location": [40.7128, -74.0010],
+                    "dropoff_location": [40.8000, -74.0500], "pricing_strategy": "SURGE", "surge_multiplier": 2.0
+                })
+                ride = response.json()
+                steps = [(await client.put(f"/api/rides/{ride['id']}/{step}")).status_code
+                         for step in ("start", "pickup", "complete")]
+                completed = (await client.get(f"/api/rides/{ride['id']}")).json()
+                missing = await client.post("/api/rides/", json={
+                    "rider_id": "nobody", "pickup_location": [40.7, -74.0], "dropoff_location": [40.8, -74.0]})
+                moved = (await client.put(f"/api/drivers/{driver['id']}/location",
+                                          json={"location": [40.7200, -74.0300]})).json()
+                return response.status_code, ride, driver, steps, completed, missing.status_code, moved
+        
+        sharded.start_shards(GeoShardMap([-74.0]))
+        try:
+            status, ride, driver, steps, completed, missing, moved = asyncio.run(scenario())
+            self.assertEqual([stats["drivers"] for stats in sharded.shard_router.stats()], [1, 0])
+        finally:
+            sharded.stop_shards()
+        
+        self.assertEqual(status, 200)
+        self.assertEqual(ride["driver"]["id"], driver["id"])
+        self.assertEqual(steps, [200, 200, 200])
+        self.assertEqual(completed["status"], RideStatus.COMPLETED.value)
+        self.assertGreater(completed["fare"], 0)
+        self.assertEqual(missing, 404)
+        self.assertEqual(moved["current_location"], [40.7200, -74.0300])
+
+class TestCitySimulator(unittest.TestCase):
+    
+    def tearDown(self):
+        RideManager._instance = None
+        UserManager._instance = None
+    
+    def test_event_clock_orders_events(self):
+        """Test events run in time order, ties in scheduling order, and stop at the horizon"""
+        clock = EventClock()
+        seen = []
+        clock.schedule(5, seen.append, "late")
+        clock.schedule(1, seen.append, "first")
+        clock.schedule(1, seen.append, "second")
+        clock.schedule(20, seen.append, "beyond")
+        clock.run(10)
+        self.assertEqual(seen, ["first", "second", "late"])
+        self.assertEqual(clock.now, 10)
+        self.assertEqual(len(clock), 1)
+    
+    def test_simulated_day_is_consistent_and_reproducible(self):
+        """Test a simulated day completes rides and the same seed gives the same day"""
+        config = SimulationConfig(drivers=40, riders=50, hours=24, demand_per_hour=30, seed=7)
+        report = CitySimulator(config).run()
+        
+        self.assertGreater(report["requests"], 0)
+        self.assertLessEqual(report["completed"], report["matched"])
+        self.assertLessEqual(report["matched"], report["requests"])
+        self.assertGreater(report["match_rate"], 0.5)
+        self.assertGreater(report["utilization"], 0.0)
+        self.assertLess(report["utilization"], 1.0)
+        # Finished rides are dropped from the manager as the run goes
+        self.assertEqual(len(RideManager().rides), report["matched"] - report["completed"])
+        
+        again = CitySimulator(config).run()
+        for metric in ("requests", "matched", "completed", "pickup_km_mean", "revenue"):
+            self.assertEqual(report[metric], again[metric])
+
+class TestLoadGenerator(unittest.TestCase):
+    
+    def test_parse_mix(self):
+        """Test scenario weights parse and unknown scenarios are rejected"""
+        self.assertEqual(parse_mix("ping=3,estimate"), {"ping": 3.0, "estimate": 1.0})
+        with self.assertRaises(ValueError):
+            parse_mix("teleport=1")
+    
+    def test_in_process_run_reports_routes(self):
+        """Test a short in-process run reports latency per route template"""
+        async def scenario():
+            async with make_client(None) as client:
+                generator = LoadGenerator(client, {"ping": 1.0, "estimate": 1.0, "lifecycle": 1.0}, seed=3)
+                await generator.seed(5, 5)
+                return await generator.run(rate=40, duration=0.5)
+        
+        with redirect_stdout(io.StringIO()):
+            report = asyncio.run(scenario())
+        
+        routes = report["routes"]
+        self.assertGreater(routes["TOTAL"]["requests"], 0)
+        self.assertEqual(routes["TOTAL"]["error_rate"], 0.0)
+        self.assertIn("POST /api/rides/estimate", routes)
+        self.assertNotIn("POST /api/riders/", routes)
+        self.assertLessEqual(routes["TOTAL"]["p50_ms"], routes["TOTAL"]["p99_ms"])
+
+class TestMetrics(unittest.TestCase):
+    
+    def test_histogram_renders_cumulative_buckets(self):
+        """Test histograms render cumulative buckets, sum and count with escaped labels"""
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "Latency", ["route"], buckets=[0.1, 1.0])
+        histogram.observe(0.05, ('/a"b',))
+        histogram.observe(0.1, ('/a"b',))
+        histogram.observe(3.0, ('/a"b',))
+        
+        text = registry.render()
+        self.assertIn("# TYPE latency_seconds histogram", text)
+        self.assertIn('latency_seconds_bucket{route="/a\\"b",le="0.1"} 2', text)
+        self.assertIn('latency_seconds_bucket{route="/a\\"b",le="1.0"} 2', text)
+        self.assertIn('latency_seconds_bucket{route="/a\\"b",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_count{route="/a\\"b"} 3', text)
+        self.assertIs(registry.histogram("latency_seconds", "Latency", ["route"]), histogram)
+        with self.assertRaises(ValueError):
+            registry.counter("latency_seconds", "Latency")
+    
+    def test_counters_sum_per_thread_shards(self):
+        """Test increments from many threads all show up in the total"""
+        counter = MetricsRegistry().counter("requests_total", "Requests", ["route"])
+        threads = [threading.Thread(target=lambda: [counter.inc(labels=("/",)) for _ in range(1000)])
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.collect(), {("/",): 4000})
+    
+    def test_matching_records_candidates_scanned(self):
+        """Test ride matching reports how many drivers the strategy looked at"""
+        RideManager._instance = None
+        UserManager._instance = None
+        user_manager, ride_manager = UserManager(), RideManager()
+        for i in range(3):
+            ride_manager.register_driver(user_manager.register_driver(
+                f"Driver {i}", "555", f"CAR{i}", "Car", VehicleType.SEDAN.value, 4, (40.71 + i * 0.01, -74.0)))
+        rider = user_manager.register_rider("Rider", "556", (40.71, -74.0))
+        
+        labels = ("NearestDriverStrategy",)
+        before = MATCH_CANDIDATES.collect().get(labels, [0] * 17)
+        search_radius.clear()
+        with redirect_stdout(io.StringIO()):
+            ride_manager.request_ride(rider, (40.71, -74.0), (40.75, -74.0), VehicleType.SEDAN)
+        after = MATCH_CANDIDATES.collect()[labels]
+        # The first 1 km ring already holds the nearest driver
+        self.assertEqual(after[-1] - before[-1], 1)
+        RideManager._instance = None
+        UserManager._instance = None
+
+class TestProfiler(unittest.TestCase):
+    
+    def setUp(self):
+        self.output = tempfile.TemporaryDirectory()
+        self.profiler = Profiler(self.output.name)
+    
+    def tearDown(self):
+        self.profiler.stop()
+        self.output.cleanup()
+    
+    def test_spans_are_free_when_disabled(self):
+        """Test span() hands out one shared no-op object unless profiling is on"""
+        self.assertIs(self.profiler.span("a"), self.profiler.span("b"))
+    
+    def test_request_trace_folds_nested_spans(self):
+        """Test a trace writes each span stack with its self time"""
+        trace = self.profiler.begin_trace()
+        with self.profiler.span("request"):
+            with self.profiler.span("matching"):
+                time.sleep(0.01)
+            with self.profiler.span("serialize"):
+                pass
+        path = trace.finish()
+        
+        with open(path) as f:
+            folded = dict(line.rsplit(" ", 1) for line in f.read().splitlines())
+        self.assertEqual(set(folded), {"request", "request;matching", "request;serialize"})
+        self.assertGreaterEqual(int(folded["request;matching"]), 10000)
+        self.assertLess(int(folded["request"]), int(folded["request;matching"]))
+        # Spans after the trace ends are not recorded
+        self.assertIs(self.profiler.span("a"), self.profiler.span("b"))
+    
+    def test_profile_window_samples_and_stops(self):
+        """Test a window records spans and writes a samples file and a spans file"""
+        self.assertTrue(self.profiler.start(5, interval=0.001))
+        self.assertFalse(self.profiler.start(5))
+        with self.profiler.span("work"):
+            time.sleep(0.05)
+        self.profiler.stop()
+        
+        status = self.profiler.status()
+        self.assertFalse(status["running"])
+        self.assertEqual(len(status["files"]), 2)
+        samples, spans = status["files"]
+        with open(samples) as f:
+            self.assertIn("MainThread;", f.read())
+        with open(spans) as f:
+            self.assertTrue(f.read().startswith("work "))
+
+class TestRoutingEngine(unittest.TestCase):
+    
+    def setUp(self):
+        # Pickup P with a driver D1 across a river and a driver D2 down the road:
+        # D1 is closer as the crow flies but must detour over the bridge at B
+        self.pickup = (40.0000, -74.0000)
+        self.across = (40.0000, -73.9900)
+        self.down_road = (40.0000, -74.0300)
+        self.graph_text = "\n".join([
+            "# test town",
+            "v P 40.0000 -74.0000",
+            "v D1 40.0000 -73.9900",
+            "v B 40.0500 -73.9950",
+            "v D2 40.0000 -74.0300",
+            "e D1 B",
+            "e B P - oneway",
+            "e D2 P 2.6",
+        ])
+    
+    def tearDown(self):
+        routing_engine.set_graph(None)
+    
+    def _load(self, engine):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "town.graph")
+            with open(path, "w") as f:
+                f.write(self.graph_text)
+            engine.load(path)
+    
+    def test_astar_matches_dijkstra(self):
+        """Test ALT A* finds the same distances as a plain Dijkstra search"""
+        rng = random.Random(7)
+        size = 15
+        nodes = [(40.0 + row * 0.004, -74.0 + col * 0.005) for row in range(size) for col in range(size)]
+        edges = []
+        for row in range(size):
+            for col in range(size):
+                node = row * size + col
+                if col + 1 < size:
+                    edges.append((node, node + 1, None, rng.random() < 0.3))
+                if row + 1 < size:
+                    edges.append((node + size, node, None, rng.random() < 0.3))
+        engine = RoutingEngine(landmark_count=4)
+        engine.set_graph(RoadGraph(nodes, edges))
+        graph = engine.graph
+        
+        for _ in range(50):
+            source, target = rng.randrange(len(nodes)), rng.randrange(len(nodes))
+            expected = dijkstra(graph.offsets, graph.targets, graph.weights, source)[target]
+            if expected == math.inf:
+                continue
+            self.assertAlmostEqual(engine.distance_km(nodes[source], nodes[target]), expected, places=9)
+        self.assertEqual(engine.fallbacks, 0)
+    
+    def test_road_distance_one_way_and_fallback(self):
+        """Test loaded graphs route along one-way streets and fall back off the network"""
+        engine = RoutingEngine()
+        self.assertAlmostEqual(engine.distance_km(self.across, self.pickup),
+                               haversine_km(self.across, self.pickup))
+        self._load(engine)
+        
+        detour = haversine_km(self.across, (40.05, -73.995)) + haversine_km((40.05, -73.995), self.pickup)
+        self.assertAlmostEqual(engine.distance_km(self.across, self.pickup), detour)
+        self.assertAlmostEqual(engine.distance_km(self.down_road, self.pickup), 2.6)
+        # The bridge is one-way, so P cannot reach D1 and the straight line is used
+        self.assertAlmostEqual(engine.distance_km(self.pickup, self.across),
+                               haversine_km(self.pickup, self.across))
+        self.assertEqual(engine.fallbacks, 1)
+        off_network = (41.0, -74.0)
+        self.assertAlmostEqual(engine.distance_km(off_network, self.pickup),
+                               haversine_km(off_network, self.pickup))
+        
+        distances = engine.distances_to([self.across, self.down_road], self.pickup)
+        self.assertAlmostEqual(distances[0], detour)
+        self.assertAlmostEqual(distances[1], 2.6)
+        self.assertEqual(engine.distances_to([self.across, self.down_road], self.pickup, max_km=10.0),
+                         [math.inf, distances[1]])
+    
+    def test_disconnected_pairs_and_short_edges(self):
+        """Test both queries fall back to the straight line for unconnected pairs and no edge beats it"""
+        self.graph_text = self.graph_text.replace("e D2 P 2.6", "e D2 P 1.0")
+        engine = RoutingEngine()
+        self._load(engine)
+        
+        straight = haversine_km(self.pickup, self.across)
+        self.assertAlmostEqual(engine.distance_km(self.pickup, self.across), straight)
+        self.assertAlmostEqual(engine.distances_to([self.pickup], self.across, max_km=10.0)[0], straight)
+        self.assertAlmostEqual(engine.distances_to([self.pickup], self.across)[0], straight)
+        self.assertEqual(engine.fallbacks, 3)
+        # An edge given as shorter than the straight line between its ends is raised to it
+        self.assertAlmostEqual(engine.distance_km(self.down_road, self.pickup), haversine_km(self.down_road, self.pickup))
+    
+    def test_matching_uses_road_distance(self):
+        """Test nearest matching ranks drivers by road distance once a graph is loaded"""
+        rider = Rider("R", "111")
+        across = Driver("Across", "1", Vehicle("V1", "Car", VehicleType.SEDAN.value, 4), self.across)
+        down_road = Driver("Down", "2", Vehicle("V2", "Car", VehicleType.SEDAN.value, 4), self.down_road)
+        ride = Ride(rider, self.pickup, (40.01, -74.0), VehicleType.SEDAN)
+        strategy = NearestDriverStrategy()
+        self.assertIs(strategy.find_driver(ride, [across, down_road]), across)
+        
+        self._load(routing_engine)
+        self.assertIs(strategy.find_driver(ride, [across, down_road]), down_road)
+        # Across is 11 km away by road, beyond the 10 km matching range
+        self.assertIsNone(strategy.find_driver(ride, [across]))
+        
+        index = DriverSpatialIndex()
+        across.rating, down_road.rating = 5.0, 4.0
+        index.add(across)
+        index.add(down_road)
+        self.assertIs(HighestRatedDriverStrategy().find_driver(ride, [across, down_road], index), down_road)
+        self.assertIs(HighestRatedDriverStrategy().find_driver(ride, [across, down_road]), down_road)
+
+class TestEtaService(unittest.TestCase):
+    
+    def setUp(self):
+        self.eta = EtaService(SpeedGrid(default_speed_kmh=30.0), RoutingEngine())
+        self.pickup = (40.7128, -74.0060)
+        self.noon = time.mktime((2026, 5, 4, 12, 0, 0, 0, 0, -1))
+    
+    def _drive(self, driver_id, start, speed_kmh, pings=5, interval=30.0, timestamp=None):
+        """Ping northwards from start at speed_kmh; returns the last location"""
+        timestamp = self.noon if timestamp is None else timestamp
+        step = speed_kmh * interval / 3600 / 111.32
+        location = start
+        for i in range(pings):
+            location = (start[0] + i * step, start[1])
+            self.eta.record_ping(driver_id, location, timestamp + i * interval)
+        return location
+    
+    def test_speed_grid_learns_from_pings(self):
+        """Test consecutive pings teach the grid per cell and hour, with city and default fallbacks"""
+        self._drive("d1", (40.7000, -74.0100), 12.0)
+        grid = self.eta.grid
+        self.assertAlmostEqual(grid.speed_kmh((40.7010, -74.0100), 12), 12.0, delta=0.2)
+        # Another cell the same hour uses the city average; another hour the default
+        self.assertAlmostEqual(grid.speed_kmh((40.9, -73.8), 12), 12.0, delta=0.2)
+        self.assertEqual(grid.speed_kmh((40.7010, -74.0100), 3), 30.0)
+        
+        # Parked cars, long gaps and impossible jumps are ignored
+        self.assertIsNone(self.eta.record_ping("d2", (40.8, -74.0), self.noon))
+        self.assertIsNone(self.eta.record_ping("d2", (40.8, -74.0), self.noon + 30))
+        self.assertIsNone(self.eta.record_ping("d2", (40.81, -74.0), self.noon + 3600))
+        self.assertIsNone(self.eta.record_ping("d2", (41.81, -74.0), self.noon + 3630))
+    
+    def test_etas_follow_local_speeds(self):
+        """Test one-to-many ETAs use each end's cell speed and mark drivers out of range"""
+        slow, fast = (40.6990, -74.0060), (40.7328, -74.0060)
+        self._drive("jam", (40.6980, -74.0060), 6.0, pings=4)
+        self._drive("clear", (40.7320, -74.0060), 60.0, pings=4)
+        
+        far = (40.9, -74.0060)
+        etas = self.eta.etas_to([slow, fast, far], self.pickup, max_km=10.0, timestamp=self.noon)
+        self.assertEqual(etas[2], math.inf)
+        self.assertLess(etas[1], etas[0])
+        self.assertAlmostEqual(etas[0], self.eta.eta_seconds(slow, self.pickup, self.noon))
+    
+    def test_fastest_arrival_strategy(self):
+        """Test fastest-arrival matching prefers a farther driver on faster roads"""
+        rider = Rider("R", "111")
+        slow = Driver("Slow", "1", Vehicle("V1", "Car", VehicleType.SEDAN.value, 4), (40.6990, -74.0060))
+        fast = Driver("Fast", "2", Vehicle("V2", "Car", VehicleType.SEDAN.value, 4), (40.7328, -74.0060))
+        ride = Ride(rider, self.pickup, (40.75, -74.0), VehicleType.SEDAN)
+        
+        self.assertIs(NearestDriverStrategy().find_driver(ride, [slow, fast]), slow)
+        self.assertIs(FastestArrivalDriverStrategy().find_driver(ride, [slow, fast]), slow)
+        
+        hour = time.localtime().tm_hour
+        grid, eta_service.grid = eta_service.grid, SpeedGrid()
+        try:
+            for _ in range(3):
+                eta_service.grid.record(slow.get_location(), hour, 3.0)
+                eta_service.grid.record(fast.get_location(), hour, 60.0)
+                eta_service.grid.record(self.pickup, hour, 30.0)
+            self.assertIs(FastestArrivalDriverStrategy().find_driver(ride, [slow, fast]), fast)
+        finally:
+            eta_service.grid = grid
+
+class TestTripTrace(unittest.TestCase):
+    
+    def test_round_trip_and_size(self):
+        """Test a trace decodes to its points at meter precision in a few bytes per point"""
+        rng = random.Random(3)
+        location = (40.7128, -74.0060)
+        trace = TripTrace(location, timestamp=1000.0)
+        expected = [(1000.0, location)]
+        for i in range(1, 200):
+            location = (location[0] + rng.uniform(-0.002, 0.002), location[1] + rng.uniform(-0.002, 0.002))
+            self.assertTrue(trace.append(location, 1000.0 + i * 15))
+            expected.append((1000.0 + i * 15, location))
+        self.assertFalse(trace.append(location, 4000.0))
+        
+        decoded = list(trace.points())
+        self.assertEqual(len(decoded), trace.point_count)
+        for (timestamp, point), (expected_timestamp, expected_point) in zip(decoded, expected):
+            self.assertEqual(timestamp, expected_timestamp)
+            self.assertAlmostEqual(point[0], expected_point[0], places=5)
+            self.assertAlmostEqual(point[1], expected_point[1], places=5)
+        self.assertLessEqual(trace.size_bytes, 7 * trace.point_count + 8)
+        
+        driven = sum(haversine_km(a[1], b[1]) for a, b in zip(expected, expected[1:]))
+        self.assertAlmostEqual(trace.distance_km, driven)
+    
+    def test_fare_uses_distance_driven(self):
+        """Test location updates during the trip, and only then, are priced"""
+        RideManager._instance = None
+        UserManager._instance = None
+        user_manager, ride_manager = UserManager(), RideManager()
+        rider = user_manager.register_rider("R", "111", (40.7128, -74.0060))
+        driver = user_manager.register_driver("D", "222", "T1", "Car", VehicleType.SEDAN.value, 4,
+                                              (40.7200, -74.0060))
+        ride_manager.register_driver(driver)
+        pickup, dropoff = (40.7128, -74.0060), (40.7528, -74.0060)
+        
+        with redirect_stdout(io.StringIO()):
+            ride = ride_manager.request_ride(rider, pickup, dropoff, VehicleType.SEDAN)
+            ride_manager.start_ride(ride.id)
+            driver.update_location((40.7150, -74.0060))  # Before pickup: not traced
+            ride_manager.pickup_rider(ride.id)
+            # Detour east, then on to the dropoff
+            for waypoint in [(40.7128, -73.9960), (40.7528, -73.9960), dropoff]:
+                driver.update_location(waypoint)
+            self.assertTrue(ride_manager.complete_ride(ride.id))
+            driver.update_location((40.8, -74.0))  # After completion: not traced
+        
+        detour = (haversine_km(pickup, (40.7128, -73.9960)) + haversine_km((40.7128, -73.9960), (40.7528, -73.9960))
+                  + haversine_km((40.7528, -73.9960), dropoff))
+        self.assertEqual(ride.trace.point_count, 4)
+        self.assertAlmostEqual(ride.billable_distance, detour)
+        self.assertGreater(ride.billable_distance, ride.distance)
+        self.assertAlmostEqual(ride.fare, 50.0 + 12.0 * detour)
+        RideManager._instance = None
+        UserManager._instance = None
+    
+    def test_fare_covers_the_way_from_the_last_update_to_the_dropoff(self):
+        """Test a trip whose last location update falls short of the dropoff bills the rest of the way"""
+        RideManager._instance = None
+        UserManager._instance = None
+        user_manager, ride_manager = UserManager(), RideManager()
+        rider = user_manager.register_rider("R", "111", (40.7128, -74.0060))
+        driver = user_manager.register_driver("D", "222", "T1", "Car", VehicleType.SEDAN.value, 4,
+                                              (40.7128, -74.0060))
+        ride_manager.register_driver(driver)
+        pickup, dropoff = (40.7128, -74.0060), (40.7528, -74.0060)
+        
+        with redirect_stdout(io.StringIO()):
+            ride = ride_manager.request_ride(rider, pickup, dropoff, VehicleType.SEDAN)
+            ride_manager.start_ride(ride.id)
+            ride_manager.pickup_rider(ride.id)
+            driver.update_location((40.7328, -73.9960))  # Halfway, then no more updates
+            self.assertTrue(ride_manager.complete_ride(ride.id))
+        
+        driven = haversine_km(pickup, (40.7328, -73.9960)) + haversine_km((40.7328, -73.9960), dropoff)
+        self.assertEqual(ride.trace.point_count, 3)
+        self.assertAlmostEqual(ride.billable_distance, driven)
+        self.assertAlmostEqual(ride.fare, 50.0 + 12.0 * driven)
+        self.assertAlmostEqual(driver.stats.distance_km, driven)
+        RideManager._instance = None
+        UserManager._instance = None
+
+class TestSQLiteRepository(unittest.TestCase):
+    
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "rides.db")
+        self.repository = self._open()
+    
+    def tearDown(self):
+        self.repository.close()
+        RideManager._instance = None
+        UserManager._instance = None
+        self.directory.cleanup()
+    
+    def _open(self, flush_interval=0.05):
+        return SQLiteRepository(self.path, batch_size=100, flush_interval=flush_interval)
+    
+    def _managers(self, repository):
+        RideManager._instance = None
+        UserManager._instance = None
+        user_manager, ride_manager = UserManager(), RideManager()
+        user_manager.set_repository(repository)
+        ride_manager.set_repository(repository, user_manager.riders, user_manager.drivers)
+        for driver in user_manager.get_all_drivers():
+            ride_manager.register_driver(driver)
+        return user_manager, ride_manager
+    
+    def test_finished_rides_live_on_disk(self):
+        """Test terminal rides leave memory but stay readable and queryable"""
+        user_manager, ride_manager = self._managers(self.repository)
+        rider = user_manager.register_rider("R", "111", (40.7128, -74.0060))
+        driver = user_manager.register_driver("D", "222", "T1", "Car", VehicleType.SEDAN.value, 4, (40.72, -74.0))
+        ride_manager.register_driver(driver)
+        
+        with redirect_stdout(io.StringIO()):
+            done = ride_manager.request_ride(rider, (40.7128, -74.0060), (40.75, -74.0), VehicleType.SEDAN)
+            ride_manager.start_ride(done.id)
+            ride_manager.pickup_rider(done.id)
+            driver.update_location((40.75, -74.0))
+            ride_manager.complete_ride(done.id)
+            cancelled = ride_manager.request_ride(rider, (40.7128, -74.0060), (40.73, -74.0), VehicleType.SEDAN)
+            ride_manager.cancel_ride(cancelled.id)
+            active = ride_manager.request_ride(rider, (40.7128, -74.0060), (40.76, -74.0), VehicleType.SEDAN)
+        
+        self.assertEqual(set(ride_manager.rides), {active.id})
+        stored = ride_manager.get_ride(done.id)
+        self.assertIsNot(stored, done)
+        self.assertEqual(stored.status, RideStatus.COMPLETED)
+        self.assertAlmostEqual(stored.fare, done.fare)
+        self.assertEqual(stored.end_time, done.end_time)
+        self.assertAlmostEqual(stored.trace.distance_km, done.trace.distance_km)
+        self.assertIs(stored.driver, driver)
+        
+        self.assertEqual([ride.id for ride in ride_manager.find_rides(rider_id=rider.id)],
+                         [active.id, cancelled.id, done.id])
+        self.assertIs(ride_manager.find_rides(rider_id=rider.id, limit=1)[0], active)
+        self.assertEqual([ride.id for ride in ride_manager.find_rides(status=RideStatus.CANCELLED)],
+                         [cancelled.id])
+        self.assertEqual(ride_manager.find_rides(driver_id=driver.id, status=RideStatus.COMPLETED)[0].id, done.id)
+    
+    def test_restart_resumes_users_and_active_rides(self):
+        """Test a new process picks up users, the available pool and rides in progress"""
+        user_manager, ride_manager = self._managers(self.repository)
+        rider = user_manager.register_rider("R", "111", (40.7128, -74.0060))
+        busy = user_manager.register_driver("Busy", "222", "T1", "Car", VehicleType.SEDAN.value, 4, (40.72, -74.0))
+        ride_manager.register_driver(busy)
+        with redirect_stdout(io.StringIO()):
+            ride = ride_manager.request_ride(rider, (40.7128, -74.0060), (40.75, -74.0), VehicleType.SEDAN)
+            ride_manager.start_ride(ride.id)
+            ride_manager.pickup_rider(ride.id)
+        busy.update_location((40.73, -74.0))
+        idle = user_manager.register_driver("Idle", "333", "T2", "Car", VehicleType.SUV.value, 6, (40.70, -74.0))
+        ride_manager.register_driver(idle)
+        self.repository.close()
+        
+        self.repository = self._open()
+        user_manager, ride_manager = self._managers(self.repository)
+        self.assertEqual(user_manager.get_rider(rider.id).name, "R")
+        self.assertEqual([driver.id for driver in ride_manager.available_drivers], [idle.id])
+        resumed = ride_manager.active_rides[ride.id]
+        restored_busy = user_manager.get_driver(busy.id)
+        self.assertIs(resumed.driver, restored_busy)
+        self.assertEqual(restored_busy.get_location(), (40.73, -74.0))
+        
+        # The trace keeps following the driver after the restart
+        with redirect_stdout(io.StringIO()):
+            restored_busy.update_location((40.75, -74.0))
+            self.assertTrue(ride_manager.complete_ride(ride.id))
+        self.assertAlmostEqual(resumed.billable_distance, haversine_km((40.7128, -74.0060), (40.75, -74.0)), places=3)
+        self.assertEqual(user_manager.get_driver(busy.id).ride_history, [ride.id])
+        
+        # Driver rows leave the history out; it is read back from the completed rides
+        self.repository.close()
+        self.repository = self._open()
+        user_manager, _ = self._managers(self.repository)
+        self.assertEqual(user_manager.get_driver(busy.id).ride_history, [ride.id])
+        self.assertEqual(len(self.repository._lookup("drivers", busy.id)), 12)
+    
+    def test_writes_are_batched_and_coalesced(self):
+        """Test repeated saves collapse into one row write and reads see unflushed saves"""
+        self.repository.close()
+        self.repository = self._open(flush_interval=60)
+        user_manager, _ = self._managers(self.repository)
+        driver = user_manager.register_driver("D", "222", "T1", "Car", VehicleType.SEDAN.value, 4, (40.72, -74.0))
+        self.repository.flush()
+        
+        before = ROWS_WRITTEN.collect().get(("drivers",), 0)
+        for i in range(50):
+            driver.update_location((40.72 + i * 0.001, -74.0))
+        self.repository.flush()
+        self.assertEqual(ROWS_WRITTEN.collect()[("drivers",)] - before, 1)
+        self.assertEqual(self.repository.load_drivers()[0].get_location(), (40.769, -74.0))
+
+    def test_failed_flush_is_retried(self):
+        """Test a batch that fails to write stays queued, newer saves win, and the flusher keeps going"""
+        user_manager, _ = self._managers(self.repository)
+        driver = user_manager.register_driver("D", "222", "T1", "Car", VehicleType.SEDAN.value, 4, (40.72, -74.0))
+        self.repository.flush()
+        
+        def wait_for(condition):
+            deadline = time.time() + 5
+            while not condition() and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(condition())
+        
+        # Writes fail while the drivers table is away
+        outside = sqlite3.connect(self.path)
+        outside.execute("ALTER TABLE drivers RENAME TO drivers_away")
+        outside.commit()
+        errors = FLUSH_ERRORS.collect().get((), 0)
+        with self.assertLogs("storage.sqlite", level="ERROR"):
+            driver.update_location((40.73, -74.0))
+            wait_for(lambda: FLUSH_ERRORS.collect().get((), 0) > errors)
+            driver.update_location((40.74, -74.0))
+            self.assertTrue(self.repository._flusher.is_alive())
+            self.assertEqual(self.repository._lookup("drivers", driver.id)[7], 40.74)
+            outside.execute("ALTER TABLE drivers_away RENAME TO drivers")
+            outside.commit()
+        wait_for(lambda: not self.repository._pending["drivers"] and not self.repository._flushing["drivers"])
+        self.assertEqual(outside.execute("SELECT lat FROM drivers").fetchone()[0], 40.74)
+        outside.close()
+    
+    def test_migrates_database_from_before_driver_stats(self):
+        """Test a database with the original drivers table gains the stats column and keeps its rows"""
+        self.repository.close()
+        os.remove(self.path)
+        connection = sqlite3.connect(self.path)
+        connection.executescript('''
+            CREATE TABLE drivers (id TEXT PRIMARY KEY, name TEXT NOT NULL, phone TEXT NOT NULL,
+                vehicle_id TEXT NOT NULL, vehicle_model TEXT NOT NULL, vehicle_type TEXT NOT NULL,
+                capacity INTEGER NOT NULL, lat REAL NOT NULL, lon REAL NOT NULL,
+                is_available INTEGER NOT NULL, rating REAL NOT NULL, ride_history TEXT NOT NULL);
+            INSERT INTO drivers VALUES ('old', 'Old', '222', 'T1', 'Car', 'SEDAN', 4, 40.72, -74.0, 1, 4.2, '[]');
+        ''')
+        connection.commit()
+        connection.close()
+        
+        self.repository = self._open()
+        old = self.repository.load_drivers()[0]
+        self.assertEqual((old.id, old.rating, old.stats.ride_count), ("old", 4.2, 0))
+        old.update_location((40.73, -74.0))
+        self.repository.save_driver(old)
+        self.repository.flush()
+        self.assertEqual(self.repository.load_drivers()[0].get_location(), (40.73, -74.0))
+        version = self.repository._reader().execute("PRAGMA user_version").fetchone()[0]
+        self.assertEqual(version, len(MIGRATIONS))
+        columns = [row[1] for row in self.repository._reader().execute("PRAGMA table_info(drivers)")]
+        self.assertNotIn("ride_history", columns)
+        
+        # Reopening an up-to-date database changes nothing
+        self.repository.close()
+        self.repository = self._open()
+        self.assertEqual(len(self.repository.load_drivers()), 1)
+
+class TestRideExport(unittest.TestCase):
+    
+    def setUp(self):
+        RideManager._instance = None
+        UserManager._instance = None
+        self.user_manager, self.ride_manager = UserManager(), RideManager()
+        self.rider = self.user_manager.register_rider("R", "111", (40.7128, -74.0060))
+        self.driver = self.user_manager.register_driver("D", "222", "T1", "Car", VehicleType.SEDAN.value, 4,
+                                                        (40.72, -74.0))
+        self.ride_manager.register_driver(self.driver)
+    
+    def tearDown(self):
+        RideManager._instance = None
+        UserManager._instance = None
+    
+    def _rides(self, count):
+        """Complete count rides and leave one cancelled; returns the completed ones"""
+        completed = []
+        with redirect_stdout(io.StringIO()):
+            for i in range(count):
+                ride = self.ride_manager.request_ride(self.rider, (40.7128, -74.0060), (40.75, -74.0 + i * 0.001),
+                                                      VehicleType.SEDAN)
+                self.ride_manager.start_ride(ride.id)
+                self.ride_manager.pickup_rider(ride.id)
+                self.ride_manager.complete_ride(ride.id)
+                completed.append(ride)
+            ride = self.ride_manager.request_ride(self.rider, (40.7128, -74.0060), (40.75, -74.0), VehicleType.SEDAN)
+            self.ride_manager.cancel_ride(ride.id)
+        return completed
+    
+    def test_ndjson_and_csv_stream_in_chunks(self):
+        """Test both formats decode to the completed rides, oldest first, over several chunks"""
+        completed = self._rides(30)
+        records = lambda: self.ride_manager.iter_ride_records(RideStatus.COMPLETED)
+        
+        chunks = list(ndjson_chunks(records(), chunk_bytes=1024))
+        self.assertGreater(len(chunks), 1)
+        lines = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+        self.assertEqual([line["id"] for line in lines], [ride.id for ride in completed])
+        self.assertAlmostEqual(lines[0]["fare"], completed[0].fare)
+        
+        rows = list(csv.DictReader(io.StringIO(b"".join(csv_chunks(records(), chunk_bytes=1024)).decode())))
+        self.assertEqual([row["id"] for row in rows], [ride.id for ride in completed])
+        self.assertEqual(rows[0]["status"], "COMPLETED")
+        
+        compressed = b"".join(export_chunks(records(), "csv", compress=True))
+        self.assertEqual(gzip.decompress(compressed).decode().splitlines()[1:],
+                         [line for line in b"".join(csv_chunks(records())).decode().splitlines()[1:]])
+    
+    def test_export_reads_from_sqlite(self):
+        """Test the export streams finished rides back from the repository by time range"""
+        with tempfile.TemporaryDirectory() as directory:
+            repository = SQLiteRepository(os.path.join(directory, "rides.db"))
+            try:
+                self.user_manager.set_repository(repository)
+                self.ride_manager.set_repository(repository, self.user_manager.riders, self.user_manager.drivers)
+                completed = self._rides(5)
+                self.assertEqual(self.ride_manager.rides, {})
+                
+                records = list(repository.iter_ride_records(RideStatus.COMPLETED, batch_size=2))
+                self.assertEqual([record["id"] for record in records], [ride.id for ride in completed])
+                self.assertEqual(records[0]["request_time"], completed[0].request_time.isoformat())
+                
+                since = completed[2].request_time
+                records = list(self.ride_manager.iter_ride_records(RideStatus.COMPLETED, since, None))
+                self.assertEqual([record["id"] for record in records], [ride.id for ride in completed[2:]])
+                self.assertEqual(len(list(self.ride_manager.iter_ride_records(RideStatus.CANCELLED))), 1)
+            finally:
+                repository.close()
+
+    def test_export_route_takes_utc_offsets(self):
+        """Test export bounds with a UTC offset compare with the rides' local request times"""
+        completed = self._rides(2)
+        since = completed[1].request_time.astimezone(timezone.utc).isoformat()
+        self.assertTrue(since.endswith("+00:00"))
+        
+        async def export():
+            async with make_client(None) as client:
+                return await client.get("/api/rides/export", params={"since": since})
+        
+        # Load the whole app first, so every router shares the same managers
+        import api.main
+        from api.routers import rides as rides_router
+        router_manager = rides_router.ride_manager
+        rides_router.ride_manager = self.ride_manager
+        try:
+            response = asyncio.run(export())
+        finally:
+            rides_router.ride_manager = router_manager
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([json.loads(line)["id"] for line in response.text.splitlines()], [completed[1].id])
+
+class TestBulkImport(unittest.TestCase):
+    
+    def setUp(self):
+        RideManager._instance = None
+        UserManager._instance = None
+        self.user_manager, self.ride_manager = UserManager(), RideManager()
+        self.directory = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        RideManager._instance = None
+        UserManager._instance = None
+        self.directory.cleanup()
+    
+    def _path(self, name):
+        return os.path.join(self.directory.name, name)
+    
+    def test_csv_drivers_fill_pool_and_index(self):
+        """Test valid CSV rows become available drivers and bad rows are reported by line"""
+        with open(self._path("drivers.csv"), "w", newline="") as f:
+            f.write("id,name,phone,vehicle_id,model,vehicle_type,capacity,latitude,longitude,rating\n")
+            f.write("d1,Dave,456,CAR001,Camry,SEDAN,4,40.7128,-74.0060,4.9\n")
+            f.write("d2,Eve,567,CAR002,Civic,SEDAN,4,40.7214,-73.9896,\n")
+            f.write("d3,Frank,678,SUV001,Explorer,TRUCK,6,40.73,-74.0,\n")
+            f.write("d4,Grace,789,SUV002,Explorer,SUV,6,95.0,-74.0,\n")
+            f.write("d1,Dup,890,CAR003,Camry,SEDAN,4,40.7,-74.0,\n")
+        
+        report = import_drivers(self._path("drivers.csv"), self.user_manager, self.ride_manager, batch_size=2)
+        
+        self.assertEqual(report.imported, 2)
+        self.assertEqual(report.rejected, 3)
+        self.assertEqual([line for line, _ in report.errors], [4, 5, 6])
+        self.assertIn("vehicle_type", report.errors[0][1])
+        self.assertIn("latitude", report.errors[1][1])
+        self.assertIn("already exists", report.errors[2][1])
+        
+        driver = self.user_manager.get_driver("d1")
+        self.assertEqual(driver.get_location(), (40.7128, -74.0060))
+        self.assertEqual(driver.rating, 4.9)
+        self.assertEqual(driver.vehicle.capacity, 4)
+        self.assertEqual(len(self.ride_manager.available_drivers), 2)
+        self.assertEqual(len(self.ride_manager.driver_index), 2)
+        # Imported drivers match like registered ones
+        ride = self.ride_manager.request_ride(Rider("R", "111"), (40.7128, -74.0060), (40.75, -74.0),
+                                              VehicleType.SEDAN)
+        self.assertIs(ride.driver, driver)
+    
+    def test_gzipped_ndjson_riders(self):
+        """Test NDJSON rows load from a gzip file and malformed lines are rejected"""
+        with gzip.open(self._path("riders.ndjson.gz"), "wt") as f:
+            f.write(json.dumps({"name": "Alice", "phone": "123", "latitude": 40.71, "longitude": -74.0}) + "\n")
+            f.write("{not json\n")
+            f.write(json.dumps({"name": "Bob", "phone": "234", "latitude": "40.72", "longitude": True}) + "\n")
+            f.write(json.dumps({"id": "r9", "name": "Carol", "phone": "345", "latitude": 0, "longitude": 0}) + "\n")
+        
+        report = import_riders(self._path("riders.ndjson.gz"), self.user_manager)
+        
+        self.assertEqual((report.imported, report.rejected), (2, 2))
+        self.assertEqual(report.errors[0], (2, "not a JSON object"))
+        self.assertIn("longitude", report.errors[1][1])
+        self.assertEqual(self.user_manager.get_rider("r9").get_location(), (0.0, 0.0))
+        self.assertEqual(sorted(rider.name for rider in self.user_manager.get_all_riders()), ["Alice", "Carol"])
+    
+    def test_import_persists_to_repository(self):
+        """Test imported users are queued to the repository like registered ones"""
+        repository = SQLiteRepository(self._path("import.db"))
+        self.user_manager.set_repository(repository)
+        with open(self._path("drivers.ndjson"), "w") as f:
+            for i in range(20):
+                f.write(json.dumps({"id": f"d{i}", "name": f"D{i}", "phone": "1", "vehicle_id": f"V{i}",
+                                    "model": "Car", "vehicle_type": "BIKE", "capacity": 1,
+                                    "latitude": 40.7 + i * 0.001, "longitude": -74.0}) + "\n")
+        import_drivers(self._path("drivers.ndjson"), self.user_manager, self.ride_manager, batch_size=8)
+        repository.close()
+        
+        reopened = SQLiteRepository(self._path("import.db"))
+        self.assertEqual(sorted(driver.id for driver in reopened.load_drivers()),
+                         sorted(f"d{i}" for i in range(20)))
+        reopened.close()
+    
+    def test_unknown_extension_rejected(self):
+        """Test files of an unknown format are refused up front"""
+        with self.assertRaises(ValueError):
+            import_riders(self._path("riders.txt"), self.user_manager)
+
+class TestIds(unittest.TestCase):
+    
+    def setUp(self):
+        RideManager._instance = None
+        UserManager._instance = None
+        self.user_manager, self.ride_manager = UserManager(), RideManager()
+        self.generator = ids.id_generator
+    
+    def tearDown(self):
+        ids.set_id_generator(self.generator)
+        RideManager._instance = None
+        UserManager._instance = None
+    
+    def test_ids_are_compact_and_time_ordered(self):
+        """Test IDs are 13 characters, unique, and sort as strings in creation order"""
+        generator = SnowflakeIdGenerator(worker_id=7)
+        started = time.time()
+        generated = [generator.new_id() for _ in range(10000)]
+        
+        self.assertEqual({len(id_string) for id_string in generated}, {13})
+        self.assertEqual(len(set(generated)), len(generated))
+        self.assertEqual(sorted(generated), generated)
+        self.assertEqual([decode_id(id_string) for id_string in generated],
+                         sorted(decode_id(id_string) for id_string in generated))
+        self.assertAlmostEqual(id_timestamp(generated[0]), started, delta=1.0)
+        self.assertEqual((decode_id(generated[0]) >> 12) & 1023, 7)
+        self.assertLessEqual(generator.first_id_at(started - 0.001), generated[0])
+        self.assertGreater(generator.first_id_at(time.time() + 1), generated[-1])
+        self.assertIsNone(id_timestamp(UuidIdGenerator().new_id()))
+        
+        # Another worker in the same millisecond never collides
+        other = SnowflakeIdGenerator(worker_id=8)
+        self.assertTrue(set(other.new_id() for _ in range(1000)).isdisjoint(generated))
+        with self.assertRaises(ValueError):
+            SnowflakeIdGenerator(worker_id=1024)
+    
+    def test_users_and_rides_take_the_pluggable_generator(self):
+        """Test new users and rides get IDs from the process-wide generator"""
+        rider = self.user_manager.register_rider("R", "111")
+        self.assertEqual(len(rider.id), 13)
+        
+        ids.set_id_generator(UuidIdGenerator())
+        ride = Ride(rider, (40.7128, -74.0060), (40.75, -74.0))
+        self.assertEqual(len(ride.id), 36)
+        with self.assertRaises(ValueError):
+            self.ride_manager.find_rides(before=ride.id)
+    
+    def test_find_rides_pages_by_id(self):
+        """Test before pages through rides newest first, in memory and in SQLite"""
+        rider = self.user_manager.register_rider("R", "111", (40.7128, -74.0060))
+        
+        def request_rides():
+            with redirect_stdout(io.StringIO()):
+                return [self.ride_manager.request_ride(rider, (40.7128, -74.0060), (40.75, -74.0),
+                                                       VehicleType.SEDAN) for _ in range(7)]
+        
+        def pages():
+            seen, before = [], None
+            while True:
+                page = self.ride_manager.find_rides(rider_id=rider.id, limit=3, before=before)
+                if not page:
+                    return seen
+                seen.append([ride.id for ride in page])
+                before = page[-1].id
+        
+        rides = request_rides()
+        newest_first = [ride.id for ride in reversed(rides)]
+        self.assertEqual(pages(), [newest_first[0:3], newest_first[3:6], newest_first[6:]])
+        
+        with tempfile.TemporaryDirectory() as directory:
+            repository = SQLiteRepository(os.path.join(directory, "rides.db"))
+            try:
+                self.ride_manager.set_repository(repository, self.user_manager.riders, self.user_manager.drivers)
+                # The first rides were handed to the repository along with the new ones
+                stored = [ride.id for ride in reversed(request_rides())] + newest_first
+                self.assertEqual(pages(), [stored[i:i + 3] for i in range(0, 14, 3)])
+            finally:
+                repository.close()
+    
+    def test_time_ranges_keep_rides_with_uuid_ids(self):
+        """Test rides saved with uuid4 IDs stay in time-range queries after switching to ordered IDs"""
+        rider = self.user_manager.register_rider("R", "111", (40.7128, -74.0060))
+        since = datetime.now() - timedelta(seconds=1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "rides.db")
+            # A database from before ordered IDs, with its (column, request_time) indexes
+            connection = sqlite3.connect(path)
+            connection.executescript(SCHEMA.replace("_id ON rides", " ON rides").replace(", id);", ", request_time);"))
+            connection.close()
+            repository = SQLiteRepository(path)
+            try:
+                self.ride_manager.set_repository(repository, self.user_manager.riders, self.user_manager.drivers)
+                with redirect_stdout(io.StringIO()):
+                    ids.set_id_generator(UuidIdGenerator())
+                    old = self.ride_manager.request_ride(rider, (40.7128, -74.0060), (40.75, -74.0), VehicleType.SEDAN)
+                    ids.set_id_generator(self.generator)
+                    new = self.ride_manager.request_ride(rider, (40.7128, -74.0060), (40.75, -74.0), VehicleType.SEDAN)
+                
+                exported = [record["id"] for record in repository.iter_ride_records(since=since)]
+                self.assertEqual(exported, [old.id, new.id])
+                found = repository.find_rides(rider_id=rider.id, since=since)
+                self.assertEqual([ride.id for ride in found], [new.id, old.id])
+                indexes = {row[0] for row in repository._reader().execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'rides_by_%'")}
+                self.assertEqual(indexes, {"rides_by_rider_id", "rides_by_driver_id", "rides_by_status_id", "rides_by_time"})
+            finally:
+                repository.close()
+
+class TestDriverStats(unittest.TestCase):
+    
+    def setUp(self):
+        RideManager._instance = None
+        UserManager._instance = None
+        self.user_manager, self.ride_manager = UserManager(), RideManager()
+        self.rider = self.user_manager.register_rider("R", "111", (40.7128, -74.0060))
+        self.driver = self.user_manager.register_driver("D", "222", "T1", "Car", VehicleType.SEDAN.value, 4,
+                                                        (40.72, -74.0))
+        self.ride_manager.register_driver(self.driver)
+    
+    def tearDown(self):
+        RideManager._instance = None
+        UserManager._instance = None
+    
+    def test_completed_rides_update_running_totals(self):
+        """Test each completion adds to the driver's and the fleet's totals; cancellations do not"""
+        fleet_rides = fleet_stats.lifetime.ride_count
+        fares = []
+        with redirect_stdout(io.StringIO()):
+            for dropoff in [(40.75, -74.0), (40.76, -73.99)]:
+                ride = self.ride_manager.request_ride(self.rider, (40.7128, -74.0060), dropoff, VehicleType.SEDAN)
+                self.ride_manager.start_ride(ride.id)
+                self.ride_manager.pickup_rider(ride.id)
+                self.ride_manager.complete_ride(ride.id)
+                fares.append((ride.fare, ride.distance))
+            ride = self.ride_manager.request_ride(self.rider, (40.7128, -74.0060), (40.75, -74.0), VehicleType.SEDAN)
+            self.ride_manager.cancel_ride(ride.id)
+        
+        stats = self.driver.stats
+        self.assertEqual(stats.ride_count, 2)
+        self.assertAlmostEqual(stats.earnings, sum(fare for fare, _ in fares))
+        self.assertAlmostEqual(stats.distance_km, sum(distance for _, distance in fares))
+        self.assertGreater(stats.busy_seconds, 0.0)
+        self.assertEqual(fleet_stats.lifetime.ride_count, fleet_rides + 2)
+    
+    def test_rating_averages_ratings_received(self):
+        """Test the rating is the mean of ratings given, however many rides the driver has"""
+        self.driver.ride_history.extend(["a", "b", "c"])
+        self.driver.update_rating(4.0)
+        self.assertEqual(self.driver.rating, 4.0)
+        self.driver.update_rating(5.0)
+        self.assertEqual(self.driver.rating, 4.5)
+        self.assertEqual((self.driver.stats.rating_count, self.driver.stats.rating_sum), (2, 9.0))
+    
+    def test_rating_set_directly_counts_as_one_rating(self):
+        """Test an imported rating is averaged with new ratings instead of being replaced"""
+        self.driver.rating = 4.8
+        self.driver.update_rating(4.0)
+        self.assertAlmostEqual(self.driver.rating, 4.4)
+        self.assertEqual(self.driver.stats.rating_count, 2)
+    
+    def test_rolling_window_drops_old_buckets(self):
+        """Test window totals include only the buckets still inside the window"""
+        window = RollingWindow(window_seconds=60, bucket_seconds=10)
+        window.add((1, 10.0, 2.0, 100.0), timestamp=1000)
+        window.add((1, 20.0, 3.0, 200.0), timestamp=1035)
+        self.assertEqual(window.totals(1040)["rides"], 2)
+        self.assertEqual(window.totals(1065)["earnings"], 20.0)
+        # Samples older than the window are ignored
+        window.add((1, 50.0, 1.0, 1.0), timestamp=1000)
+        self.assertEqual(window.totals(1065)["rides"], 1)
+        self.assertEqual(window.totals(5000), {"rides": 0, "earnings": 0, "distance_km": 0, "busy_seconds": 0})
+        
+        fleet = FleetStats({"1m": (60, 10)})
+        fleet.record_ride(10.0, 2.0, 30.0, timestamp=1000)
+        snapshot = fleet.snapshot(driver_count=2, timestamp=1001)
+        self.assertEqual(snapshot["windows"]["1m"]["utilization"], 30.0 / 120)
+        self.assertEqual(snapshot["lifetime"]["ride_count"], 1)
+    
+    def test_stats_survive_the_repository(self):
+        """Test driver totals are stored with the driver and read back"""
+        self.driver.stats.record_ride(12.5, 3.0, 600.0)
+        with tempfile.TemporaryDirectory() as directory:
+            repository = SQLiteRepository(os.path.join(directory, "stats.db"))
+            try:
+                repository.save_driver(self.driver)
+                repository.flush()
+                stored = repository.load_drivers()[0]
+            finally:
+                repository.close()
+        self.assertEqual(stored.stats.to_dict(), self.driver.stats.to_dict())
+    
+    def test_busy_time_survives_the_repository(self):
+        """Test a restored ride still counts the driver's busy time from their assignment"""
+        with redirect_stdout(io.StringIO()):
+            ride = self.ride_manager.request_ride(self.rider, (40.7128, -74.0060), (40.75, -74.0), VehicleType.SEDAN)
+        ride._assigned_time = ride.assigned_time - timedelta(minutes=5)
+        with tempfile.TemporaryDirectory() as directory:
+            repository = SQLiteRepository(os.path.join(directory, "stats.db"))
+            try:
+                repository.save_ride(ride)
+                repository.flush()
+                stored = repository.get_ride(ride.id, drivers={self.driver.id: self.driver})
+            finally:
+                repository.close()
+        self.assertAlmostEqual(stored.assigned_time.timestamp(), ride.assigned_time.timestamp(), places=3)
+        self.assertGreaterEqual(stored.busy_seconds, 300.0)
+
+class TestChangeLog(unittest.TestCase):
+    
+    def setUp(self):
+        RideManager._instance = None
+        UserManager._instance = None
+        self.user_manager, self.ride_manager = UserManager(), RideManager()
+    
+    def tearDown(self):
+        RideManager._instance = None
+        UserManager._instance = None
+    
+    def test_changes_since_are_deduplicated_and_bounded(self):
+        """Test each changed ID comes back once, and a client too far behind is told to resync"""
+        log = ChangeLog(capacity=5)
+        self.assertEqual(log.changed_since(0, "ride"), (0, []))
+        log.record("ride", "a")
+        log.record("driver", "d")
+        log.record("ride", "b")
+        log.record("ride", "a")
+        self.assertEqual(log.changed_since(0, "ride"), (4, ["a", "b"]))
+        self.assertEqual(log.changed_since(3, "driver"), (4, []))
+        
+        for i in range(4):
+            log.record("ride", f"x{i}")
+        self.assertEqual(log.changed_since(3, "ride"), (8, ["a", "x0", "x1", "x2", "x3"]))
+        self.assertIsNone(log.changed_since(2, "ride"))
+        self.assertIsNone(log.changed_since(9, "ride"))
+    
+    def test_entity_changes_are_logged(self):
+        """Test registrations, driver updates and ride transitions all move the sequence"""
+        start = change_log.sequence
+        rider = self.user_manager.register_rider("R", "111", (40.7128, -74.0060))
+        driver = self.user_manager.register_driver("D", "222", "T1", "Car", VehicleType.SEDAN.value, 4,
+                                                   (40.72, -74.0))
+        self.ride_manager.register_driver(driver)
+        self.assertEqual(change_log.changed_since(start, "rider")[1], [rider.id])
+        
+        after_registration = change_log.sequence
+        self.user_manager.update_driver_location(driver.id, (40.721, -74.0))
+        self.assertEqual(change_log.changed_since(after_registration, "driver")[1], [driver.id])
+        
+        after_move = change_log.sequence
+        with redirect_stdout(io.StringIO()):
+            ride = self.ride_manager.request_ride(rider, (40.7128, -74.0060), (40.75, -74.0), VehicleType.SEDAN)
+        self.assertEqual(change_log.changed_since(after_move, "ride")[1], [ride.id])
+        # Being assigned made the driver unavailable, which is a driver change too
+        self.assertEqual(change_log.changed_since(after_move, "driver")[1], [driver.id])
+        
+        after_request = change_log.sequence
+        with redirect_stdout(io.StringIO()):
+            self.ride_manager.cancel_ride(ride.id)
+        self.assertEqual(change_log.changed_since(after_request, "ride")[1], [ride.id])
+        
+        after_cancel = change_log.sequence
+        self.user_manager.remove_driver(driver.id)
+        driver.update_location((40.73, -74.0))
+        self.assertEqual(change_log.changed_since(after_cancel, "driver"), (after_cancel + 1, [driver.id]))
+
+class TestResponseCache(unittest.TestCase):
+    
+    def test_body_rendered_once_per_version(self):
+        """Test a version is rendered once, served from cache after, and 304 for a current ETag"""
+        cache = ResponseCache("test", max_entries=2)
+        renders = []
+        render = lambda: renders.append(1) or b'{"a":1}'
+        
+        etag, body = cache.get("x", 1, render)
+        self.assertEqual(cache.get("x", 1, render), (etag, body))
+        self.assertEqual(len(renders), 1)
+        
+        not_modified = cache.response("x", 1, render, if_none_match=f'"other", {etag}')
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.headers["etag"], etag)
+        changed = cache.response("x", 2, render, if_none_match=etag)
+        self.assertEqual((changed.status_code, changed.body), (200, b'{"a":1}'))
+        self.assertNotEqual(changed.headers["etag"], etag)
+        self.assertEqual(len(renders), 2)
+        
+        # Least recently used entries go first
+        cache.get("y", 1, render)
+        cache.get("x", 2, render)
+        cache.get("z", 1, render)
+        self.assertEqual(len(cache), 2)
+        cache.get("x", 2, render)
+        self.assertEqual(len(renders), 4)
+        # Another cache, as after a restart, never confirms this one's ETags
+        self.assertEqual(ResponseCache("test").response("x", 2, render, if_none_match=etag).status_code, 200)
+    
+    def test_changes_take_new_versions(self):
+        """Test transitions, driver updates and restores each give a version not seen before"""
+        rider = Rider("R", "111")
+        driver = Driver("D", "222", Vehicle("T1", "Car", VehicleType.SEDAN.value, 4), (40.72, -74.0))
+        ride = Ride(rider, (40.7128, -74.0060), (40.75, -74.0))
+        
+        seen = {ride.version}
+        ride.assign_driver(driver)
+        seen.add(ride.version)
+        driver_version = driver.version
+        driver.update_location((40.73, -74.0))
+        self.assertGreater(driver.version, driver_version)
+        ride.fare = 12.0
+        seen.add(ride.version)
+        restored = Ride.restore(ride.id, rider, driver, ride.pickup_location, ride.dropoff_location,
+                                ride.vehicle_type, ride.ride_type, ride.status, ride.request_time, None, None,
+                                ride.fare, ride.distance)
+        seen.add(restored.version)
+        self.assertEqual(len(seen), 4)
+    
+    def test_driver_observers_see_completed_ride(self):
+        """Test the driver's history and totals are updated before the driver becomes available"""
+        rider = Rider("R", "111")
+        driver = Driver("D", "222", Vehicle("T1", "Car", VehicleType.SEDAN.value, 4), (40.72, -74.0))
+        ride = Ride(rider, (40.7128, -74.0060), (40.75, -74.0))
+        ride.assign_driver(driver)
+        ride.start_ride()
+        ride.pickup_rider()
+        
+        class Watcher:
+            def update(self, subject):
+                seen.append((subject.is_available, len(subject.ride_history), subject.stats.ride_count))
+        seen = []
+        driver.register_observer(Watcher())
+        ride.complete_ride()
+        self.assertEqual(seen, [(True, 1, 1)])
+
+class TestViewport(unittest.TestCase):
+    
+    def setUp(self):
+        RideManager._instance = None
+        UserManager._instance = None
+        self.user_manager, self.ride_manager = UserManager(), RideManager()
+    
+    def tearDown(self):
+        RideManager._instance = None
+        UserManager._instance = None
+    
+    def make_driver(self, location, vehicle_type=VehicleType.SEDAN.value):
+        return Driver("D", "222", Vehicle("T1", "Car", vehicle_type, 4), location)
+    
+    def test_box_and_polygon(self):
+        """Test a polygon only takes points inside its outline, not its whole bounding box"""
+        triangle = Viewport(polygon=[(0.0, 0.0), (0.0, 1.0), (1.0, 0.0)])
+        self.assertEqual(triangle.box, (0.0, 0.0, 1.0, 1.0))
+        self.assertTrue(triangle.contains((0.2, 0.2)))
+        self.assertFalse(triangle.contains((0.8, 0.8)))
+        self.assertTrue(Viewport(box=(0.0, 0.0, 1.0, 1.0)).contains((0.8, 0.8)))
+        with self.assertRaises(ValueError):
+            Viewport(box=(1.0, 0.0, 0.0, 1.0))
+        with self.assertRaises(ValueError):
+            Viewport(polygon=[(0.0, 0.0), (1.0, 1.0)])
+    
+    def test_drivers_in_viewport(self):
+        """Test a viewport query returns the indexed drivers inside it, filtered by vehicle type"""
+        index = DriverSpatialIndex()
+        inside = self.make_driver((40.71, -74.01))
+        suv = self.make_driver((40.72, -74.02), VehicleType.SUV.value)
+        outside = self.make_driver((40.90, -74.01))
+        for driver in (inside, suv, outside):
+            index.add(driver)
+        
+        viewport = Viewport(box=(40.70, -74.05, 40.75, -74.0))
+        self.assertEqual({driver.id for driver in index.in_viewport(viewport)}, {inside.id, suv.id})
+        self.assertEqual(index.in_viewport(viewport, VehicleType.SUV.value), [suv])
+        outside.update_location((40.74, -74.03))
+        self.assertEqual(len(index.in_viewport(viewport)), 3)
+    
+    def test_active_rides_follow_their_drivers(self):
+        """Test rides are placed by pickup or driver position, move with the driver and leave when done"""
+        rider = self.user_manager.register_rider("R", "111", (40.7128, -74.0060))
+        driver = self.user_manager.register_driver("D", "222", "T1", "Car", VehicleType.SEDAN.value, 4,
+                                                   (40.72, -74.0))
+        self.ride_manager.register_driver(driver)
+        with redirect_stdout(io.StringIO()):
+            ride = self.ride_manager.request_ride(rider, (40.7128, -74.0060), (40.75, -74.0), VehicleType.SEDAN)
+        index = self.ride_manager.ride_index
+        
+        around_pickup = Viewport(box=(40.71, -74.01, 40.715, -74.0))
+        self.assertEqual(index.in_viewport(around_pickup), [(ride, (40.7128, -74.0060))])
+        self.assertEqual(index.in_viewport(around_pickup, by="driver"), [])
+        driver.update_location((40.713, -74.005))
+        self.assertEqual(index.in_viewport(around_pickup, by="driver"), [(ride, (40.713, -74.005))])
+        with self.assertRaises(ValueError):
+            index.in_viewport(around_pickup, by="rider")
+        
+        with redirect_stdout(io.StringIO()):
+            self.ride_manager.cancel_ride(ride.id)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.in_viewport(around_pickup), [])
+        # The finished ride no longer ties the index to its driver
+        driver.update_location((40.714, -74.005))
+        self.assertEqual(index.in_viewport(around_pickup, by="driver"), [])
+    
+    def test_clusters(self):
+        """Test points are grouped per grid cell with a count per label"""
+        points = [((40.71, -74.01), "SEDAN"), ((40.712, -74.012), "SUV"), ((40.713, -74.011), "SEDAN"),
+                  ((41.5, -73.0), "SEDAN")]
+        clusters = sorted(cluster_points(points, 0.1), key=lambda cluster: cluster["count"])
+        self.assertEqual([cluster["count"] for cluster in clusters], [1, 3])
+        self.assertEqual(clusters[1]["counts"], {"SEDAN": 2, "SUV": 1})
+        self.assertAlmostEqual(clusters[1]["location"][0], 40.711666, places=5)
+
+class TestZones(unittest.TestCase):
+    
+    def setUp(self):
+        RideManager._instance = None
+        UserManager._instance = None
+        self.user_manager, self.ride_manager = UserManager(), RideManager()
+        self.city = Zone("city", "City", "service_area", [[[(40.0, -75.0), (40.0, -73.0), (41.0, -73.0), (41.0, -75.0)]]])
+        self.airport = Zone("jfk", "Airport", "airport", [[[(40.6, -73.8), (40.6, -73.7), (40.7, -73.7), (40.7, -73.8)]]],
+                            surcharge=5.0)
+        self.downtown = Zone("downtown", "Downtown", "rate_card",
+                             [[[(40.7, -74.02), (40.7, -73.98), (40.72, -73.98), (40.72, -74.02)]]],
+                             priority=1, base_fares={"SEDAN": 80.0}, per_km_rates={"SEDAN": 20.0})
+        self.plaza = Zone("plaza", "Plaza", "no_pickup", [[[(40.71, -74.0), (40.71, -73.99), (40.715, -73.99)]]])
+    
+    def tearDown(self):
+        zone_index.set_zones([])
+        RideManager._instance = None
+        UserManager._instance = None
+    
+    def test_rtree_matches_brute_force(self):
+        """Test point queries return exactly the boxes that contain the point"""
+        rng = random.Random(7)
+        boxes = []
+        for i in range(500):
+            lat, lon = rng.uniform(0, 10), rng.uniform(0, 10)
+            boxes.append(((lat, lon, lat + rng.uniform(0, 2), lon + rng.uniform(0, 2)), i))
+        tree = RTree(boxes, node_capacity=8)
+        for _ in range(200):
+            point = (rng.uniform(0, 12), rng.uniform(0, 12))
+            expected = {i for box, i in boxes if box[0] <= point[0] <= box[2] and box[1] <= point[1] <= box[3]}
+            self.assertEqual(set(tree.at(point)), expected)
+        self.assertEqual(list(RTree([]).at((1.0, 1.0))), [])
+    
+    def test_polygon_with_hole(self):
+        """Test a prepared polygon excludes its holes and agrees across latitude bands"""
+        outline = [(math.sin(2 * math.pi * k / 40), math.cos(2 * math.pi * k / 40)) for k in range(40)]
+        hole = [(-0.2, -0.2), (-0.2, 0.2), (0.2, 0.2), (0.2, -0.2)]
+        polygon = PreparedPolygon([outline, hole])
+        self.assertTrue(polygon.contains((0.5, 0.0)))
+        self.assertTrue(polygon.contains((-0.9, 0.1)))
+        self.assertFalse(polygon.contains((0.0, 0.0)))
+        self.assertFalse(polygon.contains((0.9, 0.9)))
+    
+    def test_lookup_and_trip_checks(self):
+        """Test lookups order zones by priority, are memoized, and trips are checked against them"""
+        index = ZoneIndex()
+        index.set_zones([self.city, self.airport, self.downtown, self.plaza])
+        self.assertEqual([zone.id for zone in index.zones_at((40.712, -73.995))], ["downtown", "city", "plaza"])
+        index.zones_at((40.7120000001, -73.995))
+        self.assertEqual((index.cache_misses, index.cache_hits), (1, 1))
+        
+        index.check_trip((40.65, -73.75), (40.75, -74.0))
+        with self.assertRaises(ZoneError):
+            index.check_trip((42.0, -74.0), (40.75, -74.0))
+        with self.assertRaises(ZoneError):
+            index.check_trip((40.75, -74.0), (42.0, -74.0))
+        with self.assertRaisesRegex(ZoneError, "Plaza"):
+            index.check_trip((40.712, -73.995), (40.75, -74.0))
+        # Dropping off in a no-pickup zone is fine
+        index.check_trip((40.75, -74.0), (40.712, -73.995))
+    
+    def test_zone_pricing(self):
+        """Test rate cards replace the base rates and airport trips pay the surcharge"""
+        index = ZoneIndex()
+        index.set_zones([self.city, self.airport, self.downtown])
+        strategy, base = ZonePricingStrategy(index), BasePricingStrategy()
+        rider = Rider("R", "111")
+        
+        uptown = Ride(rider, (40.8, -74.0), (40.85, -74.0), VehicleType.SEDAN)
+        self.assertAlmostEqual(strategy.calculate_fare(uptown), base.calculate_fare(uptown))
+        downtown = Ride(rider, (40.71, -74.0), (40.75, -74.0), VehicleType.SEDAN)
+        self.assertAlmostEqual(strategy.calculate_fare(downtown), 80.0 + 20.0 * downtown.billable_distance)
+        suv = Ride(rider, (40.71, -74.0), (40.65, -73.75), VehicleType.SUV)
+        self.assertAlmostEqual(strategy.calculate_fare(suv), base.calculate_fare(suv) + 5.0)
+    
+    def test_request_outside_service_area_rejected(self):
+        """Test the ride manager refuses trips the zones do not allow"""
+        zone_index.set_zones([self.city])
+        rider = self.user_manager.register_rider("R", "111", (40.7128, -74.0060))
+        with self.assertRaises(ZoneError):
+            self.ride_manager.request_ride(rider, (42.0, -74.0), (40.75, -74.0), VehicleType.SEDAN)
+        self.assertEqual(self.ride_manager.rides, {})
+
+class TestRideOffers(unittest.TestCase):
+    
+    def setUp(self):
+        RideManager._instance = None
+        UserManager._instance = None
+        self.user_manager, self.ride_manager = UserManager(), RideManager()
+        self.now = 1000.0
+        self.ride_manager.set_offer_dispatch(2, timeout_seconds=10.0, clock=lambda: self.now)
+        self.rider = self.user_manager.register_rider("R", "111", (40.7128, -74.0060))
+        self.drivers = []
+        for i, latitude in enumerate([40.713, 40.715, 40.72]):
+            driver = self.user_manager.register_driver(f"D{i}", "222", f"T{i}", "Car", VehicleType.SEDAN.value, 4,
+                                                       (latitude, -74.006))
+            self.ride_manager.register_driver(driver)
+            self.drivers.append(driver)
+    
+    def tearDown(self):
+        RideManager._instance = None
+        UserManager._instance = None
+    
+    def request(self):
+        with redirect_stdout(io.StringIO()):
+            return self.ride_manager.request_ride(self.rider, (40.7128, -74.0060), (40.75, -74.0), VehicleType.SEDAN)
+    
+    def open_offer(self, driver):
+        return self.ride_manager.offers.open_for_driver(driver.id)
+    
+    def test_first_accept_wins(self):
+        """Test the top candidates are offered at once, reserved, and the first acceptance revokes the rest"""
+        ride = self.request()
+        self.assertEqual(ride.status, RideStatus.REQUESTED)
+        first, second = self.open_offer(self.drivers[0]), self.open_offer(self.drivers[1])
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(self.open_offer(self.drivers[2]))
+        self.assertEqual(self.ride_manager.get_available_drivers(), [self.drivers[2]])
+        
+        self.now += 3
+        with redirect_stdout(io.StringIO()):
+            self.assertTrue(self.ride_manager.accept_offer(second.id))
+            self.assertFalse(self.ride_manager.accept_offer(first.id))
+        self.assertEqual((first.status, second.status), (OfferStatus.REVOKED, OfferStatus.ACCEPTED))
+        self.assertEqual(ride.driver, self.drivers[1])
+        self.assertEqual(ride.status, RideStatus.DRIVER_ASSIGNED)
+        self.assertEqual(set(self.ride_manager.get_available_drivers()), {self.drivers[0], self.drivers[2]})
+    
+    def test_declines_and_expiry_move_to_next_drivers(self):
+        """Test a ride is re-offered to fresh drivers once all its open offers are answered or expire"""
+        ride = self.request()
+        first, second = self.open_offer(self.drivers[0]), self.open_offer(self.drivers[1])
+        self.assertTrue(self.ride_manager.decline_offer(first.id))
+        # The other offer is still open, so nothing new goes out yet
+        self.assertIsNone(self.open_offer(self.drivers[2]))
+        
+        self.now += 11
+        self.assertEqual(self.ride_manager.expire_offers(), 1)
+        self.assertEqual(second.status, OfferStatus.EXPIRED)
+        third = self.open_offer(self.drivers[2])
+        self.assertEqual(third.wave, 2)
+        # Drivers already asked are not asked again
+        self.assertIsNone(self.open_offer(self.drivers[0]))
+        self.assertFalse(self.ride_manager.accept_offer(second.id))
+        
+        with redirect_stdout(io.StringIO()):
+            self.ride_manager.cancel_ride(ride.id)
+        self.assertEqual(third.status, OfferStatus.REVOKED)
+        self.assertEqual(len(self.ride_manager.get_available_drivers()), 3)
+        self.assertEqual(len(self.ride_manager.offers), 0)
+    
+    def test_reserved_driver_going_offline_declines(self):
+        """Test a driver holding an offer stays out of the pool and declines by going offline"""
+        self.request()
+        driver = self.drivers[0]
+        offer = self.open_offer(driver)
+        self.ride_manager.register_driver(driver)
+        self.assertNotIn(driver, self.ride_manager.get_available_drivers())
+        
+        driver.set_availability(False)
+        self.ride_manager.unregister_driver(driver)
+        self.assertEqual(offer.status, OfferStatus.DECLINED)
+        self.assertNotIn(driver, self.ride_manager.get_available_drivers())
+        self.assertIsNone(self.open_offer(self.drivers[2]))
+    
+    def test_batch_registration_keeps_reserved_drivers_out(self):
+        """Test registering drivers in bulk leaves a driver holding an offer out of the pool"""
+        self.request()
+        self.ride_manager.register_drivers(self.drivers)
+        self.assertEqual(self.ride_manager.get_available_drivers(), [self.drivers[2]])
+    
+    def test_ride_without_candidates_gets_another_wave(self):
+        """Test a ride nobody could be offered is offered again once a driver comes online"""
+        for driver in self.drivers:
+            driver.set_availability(False)
+            self.ride_manager.unregister_driver(driver)
+        ride = self.request()
+        self.assertEqual(self.ride_manager.offers.waves(ride.id), 0)
+        
+        self.drivers[1].set_availability(True)
+        self.ride_manager.register_driver(self.drivers[1])
+        self.assertEqual(self.ride_manager.expire_offers(), 0)
+        offer = self.open_offer(self.drivers[1])
+        self.assertEqual((offer.ride_id, offer.wave), (ride.id, 1))
+    
+    def test_top_k_candidates(self):
+        """Test strategies rank several candidates in the same order they pick one"""
+        ride = Ride(self.rider, (40.7128, -74.0060), (40.75, -74.0))
+        pool = list(reversed(self.drivers))
+        self.assertEqual(NearestDriverStrategy().find_drivers(ride, pool, k=2), self.drivers[:2])
+        self.drivers[2].rating = 5.0
+        strategy = HighestRatedDriverStrategy()
+        index = DriverSpatialIndex()
+        for driver in pool:
+            index.add(driver)
+        self.assertEqual(strategy.find_drivers(ride, pool, index, k=2)[0], self.drivers[2])
+        self.assertEqual(strategy.find_drivers(ride, pool, k=5)[0], strategy.find_driver(ride, pool))
+
+class TestAdaptiveMatchingRadius(unittest.TestCase):
+    
+    def setUp(self):
+        search_radius.clear()
+        self.pickup = (40.7128, -74.0060)
+        self.rider = Rider("R", "111")
+    
+    def tearDown(self):
+        search_radius.clear()
+    
+    def _make_driver(self, name, km_north, vehicle_type=VehicleType.SEDAN.value, rating=4.5):
+        location = (self.pickup[0] + km_north / 111.32, self.pickup[1])
+        driver = Driver(name, "000-000-0000", Vehicle(name, "Test Car", vehicle_type, 4), location)
+        driver.rating = rating
+        return driver
+    
+    def test_rings_read_each_driver_once(self):
+        """Test index rings hand out every driver once, nearest first, within each radius"""
+        rng = random.Random(7)
+        index = DriverSpatialIndex()
+        for i in range(300):
+            index.add(Driver(f"D{i}", "1", Vehicle(f"V{i}", "Car", VehicleType.SEDAN.value, 4),
+                             (self.pickup[0] + rng.uniform(-0.2, 0.2), self.pickup[1] + rng.uniform(-0.2, 0.2))))
+        
+        seen, previous = [], 0.0
+        for radius, found in index.rings(self.pickup, VehicleType.SEDAN.value, [1.0, 2.0, 4.0, 8.0]):
+            distances = [distance for _, distance in found]
+            self.assertEqual(distances, sorted(distances))
+            self.assertTrue(all(previous < distance <= radius for distance in distances))
+            seen.extend(driver.id for driver, _ in found)
+            previous = radius
+        within = [driver for driver, _ in index.highest_rated(self.pickup, VehicleType.SEDAN.value, 8.0, k=300)]
+        self.assertEqual(sorted(seen), sorted(driver.id for driver in within))
+    
+    def test_stops_at_first_sufficient_ring(self):
+        """Test a dense area is matched from the first ring, with the same answer as the full range"""
+        drivers = [self._make_driver(f"D{i}", 0.25 + i * 0.1) for i in range(90)]
+        index = DriverSpatialIndex()
+        index.add_many(drivers)
+        ride = Ride(self.rider, self.pickup, (40.75, -74.0), VehicleType.SEDAN)
+        
+        strategy = NearestDriverStrategy()
+        self.assertEqual(strategy.find_drivers(ride, drivers, index, k=3), drivers[:3])
+        self.assertEqual(strategy.candidates_scanned, 8)
+        self.assertEqual(strategy.find_drivers(ride, drivers, k=3), drivers[:3])
+        
+        # Highest rated still looks across the whole range
+        drivers[3].rating = 4.8
+        drivers[40].rating = 5.0
+        self.assertIs(HighestRatedDriverStrategy().find_driver(ride, drivers, index), drivers[40])
+        self.assertIs(HighestRatedDriverStrategy().find_driver(ride, drivers), drivers[40])
+    
+    def test_range_per_vehicle_type(self):
+        """Test sparse areas widen up to the vehicle type's own range"""
+        bike = self._make_driver("Bike", 6.0, VehicleType.BIKE.value)
+        suv = self._make_driver("Suv", 12.0, VehicleType.SUV.value)
+        self.assertEqual(max_match_distance(VehicleType.SEDAN.value), 10.0)
+        
+        strategy = NearestDriverStrategy()
+        bike_ride = Ride(self.rider, self.pickup, (40.75, -74.0), VehicleType.BIKE)
+        self.assertIsNone(strategy.find_driver(bike_ride, [bike, suv]))
+        suv_ride = Ride(self.rider, self.pickup, (40.75, -74.0), VehicleType.SUV)
+        self.assertIs(strategy.find_driver(suv_ride, [bike, suv]), suv)
+        # The search had to reach the 15 km SUV range, so the next one starts a ring below it
+        search = ("NearestDriverStrategy", 1)
+        self.assertEqual(search_radius.learned_km(self.pickup, VehicleType.SUV.value, search), 15.0)
+        self.assertEqual(search_radius.rings(self.pickup, VehicleType.SUV.value, 15.0, search), [7.5, 15.0])
+    
+    def test_radius_learned_per_strategy_and_count(self):
+        """Test wide searches for several candidates leave the single-driver start alone"""
+        drivers = [self._make_driver(f"D{i}", 0.25 + i * 0.1) for i in range(3)]
+        drivers.append(self._make_driver("Far", 9.0))
+        ride = Ride(self.rider, self.pickup, (40.75, -74.0), VehicleType.SEDAN)
+        
+        strategy = NearestDriverStrategy()
+        self.assertEqual(len(strategy.find_drivers(ride, drivers, k=4)), 4)
+        self.assertEqual(search_radius.learned_km(self.pickup, VehicleType.SEDAN.value, ("NearestDriverStrategy", 4)), 10.0)
+        self.assertIs(strategy.find_driver(ride, drivers), drivers[0])
+        self.assertEqual(search_radius.learned_km(self.pickup, VehicleType.SEDAN.value, ("NearestDriverStrategy", 1)), 1.0)
+    
+    def test_learned_starting_radius(self):
+        """Test the starting radius follows the radius searches reach, per region and vehicle type"""
+        radius = SearchRadius(default_km=1.0, min_km=0.5, growth=2.0, smoothing=0.5)
+        self.assertEqual(radius.rings(self.pickup, "SEDAN", 10.0), [1.0, 2.0, 4.0, 8.0, 10.0])
+        radius.record(self.pickup, "SEDAN", 8.0)
+        self.assertEqual(radius.start_km(self.pickup, "SEDAN", 10.0), 4.0)
+        radius.record(self.pickup, "SEDAN", 0.5)
+        self.assertEqual(radius.learned_km(self.pickup, "SEDAN"), 4.25)
+        self.assertEqual(radius.start_km(self.pickup, "SEDAN", 10.0, ("Nearest", 5)), 1.0)
+        self.assertEqual(radius.start_km(self.pickup, "SUV", 15.0), 1.0)
+        self.assertEqual(radius.start_km((41.5, -73.0), "SEDAN", 10.0), 1.0)
+        for _ in range(3):
+            radius.record(self.pickup, "SEDAN", 0.1)
+        self.assertEqual(radius.start_km(self.pickup, "SEDAN", 10.0), 0.5)
+    
+    def test_fastest_arrival_looks_past_slow_nearby_drivers(self):
+        """Test fastest-arrival keeps widening while a farther driver could still arrive sooner"""
+        slow = self._make_driver("Slow", -0.8)
+        fast = self._make_driver("Fast", 3.5)
+        ride = Ride(self.rider, self.pickup, (40.75, -74.0), VehicleType.SEDAN)
+        hour = time.localtime().tm_hour
+        grid, eta_service.grid = eta_service.grid, SpeedGrid()
+        try:
+            for _ in range(3):
+                eta_service.grid.record(slow.get_location(), hour, 2.0)
+                eta_service.grid.record(fast.get_location(), hour, 90.0)
+                eta_service.grid.record(self.pickup, hour, 90.0)
+            self.assertIs(NearestDriverStrategy().find_driver(ride, [slow, fast]), slow)
+            self.assertIs(FastestArrivalDriverStrategy().find_driver(ride, [slow, fast]), fast)
+        finally:
+            eta_service.grid = grid
+
+class TestSingleFlight(unittest.TestCase):
+    
+    def setUp(self):
+        self.now = 0.0
+        self.calls = 0
+    
+    def flight(self, name, ttl_seconds=0.5):
+        return SingleFlight(name, ttl_seconds, max_entries=2, clock=lambda: self.now)
+    
+    async def compute(self, value, release=None):
+        self.calls += 1
+        if release is not None:
+            await release.wait()
+        if value == "bad":
+            raise ValueError("no drivers")
+        return value
+    
+    def counts(self, name):
+        collected = COALESCED_REQUESTS.collect()
+        return [collected.get((name, outcome), 0) for outcome in ("computed", "joined", "cached")]
+    
+    def test_concurrent_requests_share_one_computation(self):
+        """Test identical requests in flight together get one result, then the cache serves it"""
+        flight = self.flight("test-share")
+        
+        async def scenario():
+            release = asyncio.Event()
+            same = [asyncio.ensure_future(flight.run("a", lambda: self.compute("A", release))) for _ in range(5)]
+            other = asyncio.ensure_future(flight.run("b", lambda: self.compute("B", release)))
+            await asyncio.sleep(0)
+            release.set()
+            results = await asyncio.gather(*same, other)
+            cached = await flight.run("a", lambda: self.compute("fresh"))
+            self.now = 1.0
+            expired = await flight.run("a", lambda: self.compute("fresh"))
+            return results, cached, expired
+        
+        results, cached, expired = asyncio.run(scenario())
+        self.assertEqual(results, ["A"] * 5 + ["B"])
+        self.assertEqual((cached, expired), ("A", "fresh"))
+        self.assertEqual(self.calls, 3)
+        self.assertEqual(self.counts("test-share"), [3, 4, 1])
+    
+    def test_failures_are_shared_but_not_kept(self):
+        """Test waiting requests see the first request's error and the next request retries"""
+        flight = self.flight("test-fail")
+        
+        async def scenario():
+            release = asyncio.Event()
+            jobs = [asyncio.ensure_future(flight.run("a", lambda: self.compute("bad", release))) for _ in range(3)]
+            await asyncio.sleep(0)
+            release.set()
+            failures = await asyncio.gather(*jobs, return_exceptions=True)
+            retried = await flight.run("a", lambda: self.compute("ok"))
+            return failures, retried
+        
+        failures, retried = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(failure, ValueError) for failure in failures))
+        self.assertEqual(retried, "ok")
+        self.assertEqual(self.calls, 2)
+    
+    def test_cancelled_caller_leaves_computation_running(self):
+        """Test the request that started a computation can disconnect without failing the others"""
+        flight = self.flight("test-cancel", ttl_seconds=0.0)
+        
+        async def scenario():
+            release = asyncio.Event()
+            first = asyncio.ensure_future(flight.run("a", lambda: self.compute("A", release)))
+            second = asyncio.ensure_future(flight.run("a", lambda: self.compute("A", release)))
+            await asyncio.sleep(0)
+            first.cancel()
+            release.set()
+            return await second
+        
+        self.assertEqual(asyncio.run(scenario()), "A")
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(flight), 0)  # A TTL of 0 only joins, it keeps nothing
+    
+    def test_keys_quantize_nearby_locations(self):
+        """Test pickups a few meters apart share a key and ones further apart do not"""
+        self.assertEqual(quantize((40.71281, -74.00602), 4), quantize((40.71279, -74.00598), 4))
+        self.assertNotEqual(quantize((40.7128, -74.0060), 4), quantize((40.7130, -74.0060), 4))
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file